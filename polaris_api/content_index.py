@@ -0,0 +1,262 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+from polaris_logger import log_info, log_warning
+from polaris_metrics import dedup_skipped, dedup_sessions
+
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Distância de Hamming máxima entre simhashes para considerar quase-duplicata
+# (0 desativa; 3 é um bom ponto de partida para textos de algumas frases)
+DEDUP_SIMHASH_DISTANCE = int(os.getenv("DEDUP_SIMHASH_DISTANCE", 0))
+DEDUP_MAX_SESSIONS = int(os.getenv("DEDUP_MAX_SESSIONS", 1000))
+DEDUP_DIGEST_DB = os.getenv("DEDUP_DIGEST_DB", "./session_db/file_digests.sqlite3")
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+
+def content_hash(text: str) -> str:
+    """Hash do conteúdo normalizado (espaços colapsados), 128 bits em hex."""
+    normalized = _SPACES.sub(" ", text).strip()
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def file_hash(path: str, chunk_bytes: int = 1024 * 1024) -> str:
+    """Hash dos bytes do arquivo, lido em pedaços."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def simhash(text: str) -> int:
+    """Simhash de 64 bits sobre trigramas de palavras (minúsculas)."""
+    words = _WORD.findall(text.lower())
+    shingles = [" ".join(words[i : i + 3]) for i in range(max(1, len(words) - 2))]
+    weights = np.zeros(64, dtype=np.int64)
+    bits = np.arange(64, dtype=np.uint64)
+    for shingle in shingles:
+        h = np.uint64(
+            int.from_bytes(
+                hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(),
+                "big",
+            )
+        )
+        weights += np.where((h >> bits) & np.uint64(1), 1, -1)
+    value = 0
+    for bit in np.flatnonzero(weights > 0):
+        value |= 1 << int(bit)
+    return value
+
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+class _SessionHashes:
+    """Hashes já indexados de uma sessão: um set compacto + simhashes em array."""
+
+    def __init__(self):
+        self.exact = set()
+        self.simhashes = np.zeros(0, dtype=np.uint64)
+
+    def add_simhash(self, value: int):
+        self.simhashes = np.append(self.simhashes, np.uint64(value))
+
+    def near(self, value: int, distance: int) -> bool:
+        if not len(self.simhashes):
+            return False
+        xor = self.simhashes ^ np.uint64(value)
+        return bool((_popcount(xor) <= distance).any())
+
+
+class FileDigestStore:
+    """Hashes de arquivos já indexados por sessão, num SQLite (WAL).
+
+    O file_hash nos metadados do último lote some quando todos os trechos
+    do arquivo são duplicatas (não há lote); aqui o digest é gravado
+    mesmo assim e sobrevive a restarts. Vários workers podem abrir o
+    mesmo arquivo.
+    """
+
+    def __init__(self, path: str = DEDUP_DIGEST_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS file_digests ("
+            " session_id TEXT NOT NULL, digest TEXT NOT NULL,"
+            " PRIMARY KEY (session_id, digest))"
+        )
+        self._conn.commit()
+
+    def digests(self, session_id: str) -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT digest FROM file_digests WHERE session_id = ?", (session_id,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, session_id: str, digest: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO file_digests VALUES (?, ?)", (session_id, digest)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ContentIndex:
+    """Índice de hashes do que já foi gravado no vectorstore, por sessão.
+
+    claim() decide se um texto é novo antes do embedding: duplicatas
+    exatas (blake2b do texto normalizado) e, com DEDUP_SIMHASH_DISTANCE
+    > 0, quase-duplicatas (simhash) são descartadas. O hash vai para os
+    metadados do documento, então o índice de uma sessão é reconstruído
+    do Chroma na primeira vez que ela é tocada neste processo. Só as
+    DEDUP_MAX_SESSIONS sessões mais recentes ficam em memória. Com um
+    `digests` (FileDigestStore), os hashes de arquivos também vão para lá.
+
+    claim() pode consultar o Chroma: chame fora do event loop. A carga de
+    uma sessão roda fora do lock, sem travar as demais.
+    """
+
+    def __init__(
+        self,
+        get_store: Callable,
+        simhash_distance: int = DEDUP_SIMHASH_DISTANCE,
+        max_sessions: int = DEDUP_MAX_SESSIONS,
+        digests: Optional[FileDigestStore] = None,
+    ):
+        self._get_store = get_store
+        self.digests = digests
+        self.simhash_distance = simhash_distance
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, session_id: str) -> _SessionHashes:
+        hashes = _SessionHashes()
+        if self.digests is not None:
+            try:
+                hashes.exact.update(self.digests.digests(session_id))
+            except sqlite3.Error as e:
+                log_warning(
+                    f"⚠️ Não foi possível carregar os hashes de arquivos: {e}",
+                    session_id=session_id,
+                )
+        try:
+            existing = self._get_store().get(
+                where={"session_id": session_id}, include=["documents", "metadatas"]
+            )
+        except Exception as e:
+            log_warning(
+                f"⚠️ Não foi possível carregar os hashes da sessão: {e}",
+                session_id=session_id,
+            )
+            return hashes
+
+        for text, metadata in zip(
+            existing.get("documents") or [], existing.get("metadatas") or []
+        ):
+            metadata = metadata or {}
+            # Documentos antigos não têm hash nos metadados: calcula do texto
+            hashes.exact.add(metadata.get("content_hash") or content_hash(text or ""))
+            if metadata.get("file_hash"):
+                hashes.exact.add(metadata["file_hash"])
+            if self.simhash_distance and text:
+                hashes.add_simhash(
+                    int(metadata["simhash"], 16)
+                    if metadata.get("simhash")
+                    else simhash(text)
+                )
+        if hashes.exact:
+            log_info(
+                f"🔑 Índice de duplicatas carregado: {len(hashes.exact)} hashes",
+                session_id=session_id,
+            )
+        return hashes
+
+    def _session(self, session_id: str) -> _SessionHashes:
+        """Hashes da sessão; a leitura do Chroma acontece fora do lock."""
+        with self._lock:
+            hashes = self._sessions.get(session_id)
+            if hashes is not None:
+                self._sessions.move_to_end(session_id)
+                return hashes
+        loaded = self._load(session_id)
+        with self._lock:
+            # Outra thread pode ter carregado a sessão enquanto isso
+            hashes = self._sessions.setdefault(session_id, loaded)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            dedup_sessions.set(len(self._sessions))
+        return hashes
+
+    def claim(self, session_id: str, text: str, kind: str = "text") -> Optional[dict]:
+        """Registra o texto e devolve os metadados de hash; None se for duplicata."""
+        digest = content_hash(text)
+        hashes = self._session(session_id)
+        with self._lock:
+            if digest in hashes.exact:
+                dedup_skipped.labels(kind=kind, match="exact").inc()
+                return None
+            metadata = {"content_hash": digest}
+            if self.simhash_distance:
+                value = simhash(text)
+                if hashes.near(value, self.simhash_distance):
+                    dedup_skipped.labels(kind=kind, match="near").inc()
+                    return None
+                hashes.add_simhash(value)
+                metadata["simhash"] = f"{value:016x}"
+            hashes.exact.add(digest)
+            return metadata
+
+    def has_digest(self, session_id: str, digest: str, kind: str = "file") -> bool:
+        """Indica se um hash já calculado (ex.: do arquivo) já foi indexado."""
+        hashes = self._session(session_id)
+        with self._lock:
+            if digest in hashes.exact:
+                dedup_skipped.labels(kind=kind, match="exact").inc()
+                return True
+            return False
+
+    def add_digest(self, session_id: str, digest: str):
+        """Marca o hash como indexado (e o persiste, se houver `digests`)."""
+        if self.digests is not None:
+            try:
+                self.digests.add(session_id, digest)
+            except sqlite3.Error as e:
+                log_warning(
+                    f"⚠️ Hash do arquivo não persistido: {e}", session_id=session_id
+                )
+        hashes = self._session(session_id)
+        with self._lock:
+            hashes.exact.add(digest)
+
+    def forget(self, session_id: str):
+        """Descarta o índice da sessão; é recarregado do Chroma no próximo uso.
+
+        Usado quando uma gravação falha, para que hashes de textos que não
+        chegaram ao vectorstore não bloqueiem reenvios.
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            dedup_sessions.set(len(self._sessions))
@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from polaris_logger import log_info, log_warning
+from polaris_metrics import embedding_cache_lookups, embedding_cache_entries
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 20000))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")
+EMBEDDING_CACHE_DISK_ROWS = int(os.getenv("EMBEDDING_CACHE_DISK_ROWS", 200000))
+
+# Persiste o índice do disco a cada N gravações (e sempre no close)
+DISK_FLUSH_EVERY = 256
+KEY_BYTES = 32
+
+
+class DiskEmbeddingStore:
+    """Tier em disco: vetores num np.memmap circular e as chaves sha256 em outro.
+
+    A gravação do vetor vem antes da chave, então uma chave presente no
+    arquivo sempre aponta para um vetor completo. Ao encher, a linha mais
+    antiga é sobrescrita (FIFO). Sobrevive a reinícios: o índice é
+    reconstruído a partir do arquivo de chaves.
+    """
+
+    def __init__(self, directory: str, rows: int, namespace: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rows = rows
+        self.namespace = namespace
+        self.dim = None
+        self._vectors = None
+        self._keys = None
+        self._index = {}
+        self._next = 0
+        self._unflushed = 0
+
+        meta = self._read_meta()
+        if (
+            meta
+            and meta.get("namespace") == namespace
+            and meta.get("rows") == rows
+            and os.path.exists(self._path("vectors.f32"))
+        ):
+            self._open(meta["dim"], "r+")
+            self._next = meta.get("next", 0) % rows
+            for row in np.flatnonzero(self._keys.any(axis=1)):
+                self._index[self._keys[row].tobytes()] = int(row)
+            log_info(f"💾 Cache de embeddings em disco: {len(self._index)} vetores")
+
+    def __len__(self):
+        return len(self._index)
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _open(self, dim: int, mode: str):
+        self.dim = dim
+        self._vectors = np.memmap(
+            self._path("vectors.f32"),
+            dtype=np.float32,
+            mode=mode,
+            shape=(self.rows, dim),
+        )
+        self._keys = np.memmap(
+            self._path("keys.bin"),
+            dtype=np.uint8,
+            mode=mode,
+            shape=(self.rows, KEY_BYTES),
+        )
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        row = self._index.get(key)
+        if row is None:
+            return None
+        return np.array(self._vectors[row])
+
+    def put(self, key: bytes, vector: np.ndarray):
+        if self._vectors is None:
+            # Primeira gravação (ou modelo trocado): recria os arquivos
+            self._open(len(vector), "w+")
+        if len(vector) != self.dim or key in self._index:
+            return
+
+        row = self._next
+        old_key = self._keys[row].tobytes()
+        self._index.pop(old_key, None)
+        self._vectors[row] = vector
+        self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+        self._index[key] = row
+        self._next = (row + 1) % self.rows
+
+        self._unflushed += 1
+        if self._unflushed >= DISK_FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._vectors is None:
+            return
+        self._vectors.flush()
+        self._keys.flush()
+        meta = {
+            "namespace": self.namespace,
+            "rows": self.rows,
+            "dim": self.dim,
+            "next": self._next,
+        }
+        tmp = self._path("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._path("meta.json"))
+        self._unflushed = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings com cache por hash do conteúdo, compartilhado por busca e ingestão.
+
+    Mantém uma LRU em memória limitada a `capacity` vetores e, se
+    `cache_dir` estiver definido, um tier em disco (memmap) que sobrevive
+    a reinícios. Cada acerto economiza um forward do modelo de embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        namespace: str,
+        capacity: int = EMBEDDING_CACHE_SIZE,
+        cache_dir: str = EMBEDDING_CACHE_DIR,
+        disk_rows: int = EMBEDDING_CACHE_DISK_ROWS,
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.capacity = capacity
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        # Sem kwargs próprios de query, embed_query == embed_documents: a
+        # mesma entrada serve para a busca e para a ingestão
+        self._query_namespace = (
+            f"{namespace}:query"
+            if getattr(embeddings, "query_encode_kwargs", None)
+            else namespace
+        )
+        self.disk = None
+        if cache_dir:
+            try:
+                self.disk = DiskEmbeddingStore(cache_dir, disk_rows, namespace)
+            except (OSError, ValueError) as e:
+                log_warning(f"⚠️ Cache de embeddings em disco desativado: {e}")
+
+    @staticmethod
+    def _key(namespace: str, text: str) -> bytes:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).digest()
+
+    def _get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                embedding_cache_lookups.labels(result="memory_hit").inc()
+                return vector
+            if self.disk is not None:
+                vector = self.disk.get(key)
+                if vector is not None:
+                    self._remember(key, vector)
+                    embedding_cache_lookups.labels(result="disk_hit").inc()
+                    return vector
+        embedding_cache_lookups.labels(result="miss").inc()
+        return None
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.capacity:
+            self._memory.popitem(last=False)
+        embedding_cache_entries.labels(tier="memory").set(len(self._memory))
+
+    def _put(self, key: bytes, vector: np.ndarray):
+        with self._lock:
+            self._remember(key, vector)
+            if self.disk is not None:
+                self.disk.put(key, vector)
+                embedding_cache_entries.labels(tier="disk").set(len(self.disk))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(self.namespace, text) for text in texts]
+        vectors = [self._get(key) for key in keys]
+
+        # Textos repetidos no mesmo lote são calculados uma vez só
+        missing = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        fresh = {}
+        if missing:
+            computed = self.embeddings.embed_documents(list(missing.values()))
+            for key, vector in zip(missing, computed):
+                fresh[key] = np.asarray(vector, dtype=np.float32)
+                self._put(key, fresh[key])
+
+        return [
+            (fresh[key] if vector is None else vector).tolist()
+            for key, vector in zip(keys, vectors)
+        ]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(self._query_namespace, text)
+        vector = self._get(key)
+        if vector is None:
+            vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+            self._put(key, vector)
+        return vector.tolist()
+
+    def close(self):
+        with self._lock:
+            if self.disk is not None:
+                self.disk.flush()
@@ -0,0 +1,188 @@
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from polaris_logger import log_info, log_error
+from polaris_metrics import pdf_jobs, pdf_jobs_active
+from pdf_ingest import ingest_pdf, count_pages
+from content_index import file_hash
+
+PDF_INGEST_WORKERS = int(os.getenv("PDF_INGEST_WORKERS", 2))
+PDF_MAX_JOBS = int(os.getenv("PDF_MAX_JOBS", 2))
+PDF_JOB_HISTORY = int(os.getenv("PDF_JOB_HISTORY", 200))
+
+
+class IngestJob:
+    """Estado de uma indexação de PDF em segundo plano."""
+
+    def __init__(self, session_id: str, source: str):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.source = source
+        self.status = "queued"
+        self.pages_total = None
+        self.pages_done = 0
+        self.chunks_done = 0
+        self.error = None
+        self.duplicate = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def advance(self, pages: int, chunks: int):
+        self.pages_done += pages
+        self.chunks_done += chunks
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "job_id": self.id,
+            "session_id": self.session_id,
+            "source": self.source,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_done,
+            "chunks_embedded": self.chunks_done,
+            "elapsed_seconds": round(elapsed, 2),
+            "pages_per_second": round(self.pages_done / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": (
+                round(self.chunks_done / elapsed, 2) if elapsed else 0.0
+            ),
+            "duplicate": self.duplicate,
+            "error": self.error,
+        }
+
+
+class IngestJobManager:
+    """Fila de indexações de PDF fora do ciclo da requisição.
+
+    Até `max_jobs` PDFs são indexados ao mesmo tempo (threads coordenadoras);
+    a extração de texto das páginas roda num ProcessPoolExecutor com
+    `workers` processos, então PDFs grandes não disputam o GIL com o chat.
+    O embedding e a escrita no Chroma ficam neste processo, que já tem o
+    modelo carregado. Com um `index` (ContentIndex), um PDF já indexado
+    na sessão é reconhecido pelo hash do arquivo e nem é extraído.
+    """
+
+    def __init__(
+        self,
+        get_store: Callable,
+        workers: int = PDF_INGEST_WORKERS,
+        max_jobs: int = PDF_MAX_JOBS,
+        history: int = PDF_JOB_HISTORY,
+        index=None,
+    ):
+        self._get_store = get_store
+        self.index = index
+        self.workers = workers
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._runner = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_jobs, thread_name_prefix="polaris-ingest"
+        )
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: o processo da API tem threads (uvicorn, torch) e fork não é seguro
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _remember(self, job: IngestJob):
+        with self._lock:
+            self._jobs[job.id] = job
+            # Esquece os jobs concluídos mais antigos
+            finished = [j for j in self._jobs.values() if j.finished_at]
+            for old in finished[: max(0, len(self._jobs) - self.history)]:
+                del self._jobs[old.id]
+
+    def submit(
+        self,
+        path: str,
+        session_id: str,
+        source: str,
+        prepare_text: Callable[[str], str] = lambda text: text,
+    ) -> IngestJob:
+        """Agenda a indexação; o arquivo em `path` é removido ao terminar."""
+        job = IngestJob(session_id, source)
+        self._remember(job)
+        pdf_jobs.labels(status="queued").inc()
+        self._runner.submit(self._run, job, path, prepare_text)
+        return job
+
+    def _run(self, job: IngestJob, path: str, prepare_text):
+        job.status = "running"
+        job.started_at = time.time()
+        pdf_jobs_active.inc()
+        log_info(
+            f"📥 Indexando PDF '{job.source}' (job {job.id})", session_id=job.session_id
+        )
+        status = "failed"
+        try:
+            digest = file_hash(path) if self.index is not None else None
+            if digest and self.index.has_digest(job.session_id, digest):
+                job.duplicate = True
+                status = "done"
+                log_info(
+                    f"♻️ PDF '{job.source}' já indexado nesta sessão, ignorando.",
+                    session_id=job.session_id,
+                )
+                return
+            job.pages_total = count_pages(path)
+            ingest_pdf(
+                path,
+                job.session_id,
+                self._get_store(),
+                prepare_text,
+                source=job.source,
+                executor=self._get_pool(),
+                window=self.workers * 2,
+                progress=job.advance,
+                pages=job.pages_total,
+                index=self.index,
+                file_digest=digest,
+            )
+            if digest:
+                self.index.add_digest(job.session_id, digest)
+            status = "done"
+        except Exception as e:
+            job.error = str(e)
+            if self.index is not None:
+                # Parte dos trechos pode não ter sido gravada: recarrega do Chroma
+                self.index.forget(job.session_id)
+            log_error(
+                f"Erro ao indexar o PDF (job {job.id}): {e}", session_id=job.session_id
+            )
+        finally:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            # Estado final só é publicado depois da limpeza
+            job.finished_at = time.time()
+            job.status = status
+            pdf_jobs_active.dec()
+            pdf_jobs.labels(status=status).inc()
+
+    def close(self):
+        """Cancela jobs ainda na fila e encerra os pools sem esperar PDFs longos."""
+        self._runner.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
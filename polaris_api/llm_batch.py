@@ -0,0 +1,325 @@
+import codecs
+import os
+import queue
+import threading
+
+import numpy as np
+from fastapi import HTTPException
+from llama_cpp import llama_cpp as llama_lib
+from llama_cpp._internals import LlamaModel, LlamaContext, LlamaBatch
+from polaris_logger import log_info, log_success, log_error, log_prompt
+from polaris_metrics import llm_batch_active_sequences, llm_generated_tokens
+from llm_local import (
+    NUM_CORES,
+    MODEL_CONTEXT_SIZE,
+    TEMPERATURE,
+    TOP_P,
+    TOP_K,
+    FREQUENCY_PENALTY,
+    SEED,
+)
+
+LLAMA_BATCH_SLOTS = int(os.getenv("LLAMA_BATCH_SLOTS", 1))
+LLAMA_BATCH_TOKENS = int(os.getenv("LLAMA_BATCH_TOKENS", 512))
+
+MAX_TOKENS = 1024
+STOP = "---"
+REPEAT_LAST_N = 64
+
+_SENTINEL = object()
+
+
+class _Sequence:
+    """Estado de uma requisição ocupando um slot (seq_id) do contexto."""
+
+    __slots__ = (
+        "seq_id",
+        "prompt_tokens",
+        "n_prompt_done",
+        "n_past",
+        "last_token",
+        "history",
+        "generated",
+        "decoder",
+        "pending_text",
+        "out",
+        "cancelled",
+    )
+
+    def __init__(self, prompt_tokens):
+        self.seq_id = None
+        self.prompt_tokens = prompt_tokens
+        self.n_prompt_done = 0
+        self.n_past = 0
+        self.last_token = None
+        self.history = list(prompt_tokens[-REPEAT_LAST_N:])
+        self.generated = 0
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.pending_text = ""
+        self.out = queue.Queue()
+        self.cancelled = False
+
+
+class BatchedLlamaRunnable:
+    """Backend llama.cpp com continuous batching.
+
+    Um único contexto com `slots` sequências (n_seq_max) é decodificado por
+    uma thread dedicada. A cada passo, um só llama_decode avança o prefill
+    das sequências novas e gera um token para cada sequência ativa; novas
+    requisições entram no lote entre um passo e outro.
+    """
+
+    def __init__(self, model_path: str, slots: int = LLAMA_BATCH_SLOTS):
+        self.model_path = model_path
+        self.slots = slots
+        self.n_batch = max(LLAMA_BATCH_TOKENS, slots)
+        self._model = None
+        self._ctx = None
+        self._batch = None
+        self._rng = np.random.default_rng(SEED)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._active = {}
+        self._free_ids = list(range(slots))
+        self._closing = False
+        self._thread = None
+
+    def load(self):
+        if self._model is not None:
+            return
+        log_info(f"Carregando modelo LLaMA local em modo batch ({self.slots} slots)...")
+
+        model_params = llama_lib.llama_model_default_params()
+        model_params.n_gpu_layers = 0
+        model_params.use_mlock = True
+        self._model = LlamaModel(
+            path_model=self.model_path, params=model_params, verbose=False
+        )
+
+        ctx_params = llama_lib.llama_context_default_params()
+        # Sem KV unificado cada sequência recebe n_ctx / n_seq_max posições
+        ctx_params.n_ctx = MODEL_CONTEXT_SIZE * self.slots
+        ctx_params.n_batch = self.n_batch
+        ctx_params.n_ubatch = self.n_batch
+        ctx_params.n_seq_max = self.slots
+        ctx_params.n_threads = NUM_CORES
+        ctx_params.n_threads_batch = NUM_CORES
+        self._ctx = LlamaContext(model=self._model, params=ctx_params, verbose=False)
+        self._batch = LlamaBatch(
+            n_tokens=self.n_batch, embd=0, n_seq_max=1, verbose=False
+        )
+        self.n_vocab = self._model.n_vocab()
+
+        self._closing = False
+        self._thread = threading.Thread(
+            target=self._loop, name="polaris-llama-batch", daemon=True
+        )
+        self._thread.start()
+        log_success("Modelo LLaMA carregado em modo batch!")
+
+    def close(self):
+        if self._model is None:
+            return
+        log_info("Fechando modelo LLaMA (batch)...")
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._batch.close()
+        self._ctx.close()
+        self._model.close()
+        self._batch = self._ctx = self._model = None
+        log_success("Modelo LLaMA fechado!")
+
+    # ------------------------------------------------------------------
+    # Interface pública (mesma de LlamaRunnable / GroqLLM)
+    # ------------------------------------------------------------------
+
+    def prime_prefix(self, prefix: str):
+        """Sem efeito no modo batch: cada sequência avalia o próprio prompt."""
+
+    def invoke(self, prompt: str, session_id=None) -> str:
+        return self.invoke_stream(prompt, session_id=session_id).strip()
+
+    def invoke_stream(self, prompt: str, stream_callback=None, session_id=None) -> str:
+        """Método com suporte a streaming via callback (compatibilidade)"""
+        partes = []
+        for chunk in self.stream_chunks(prompt, session_id=session_id):
+            partes.append(chunk)
+            if stream_callback:
+                stream_callback(chunk)
+        return "".join(partes)
+
+    def stream_chunks(self, prompt: str, session_id=None):
+        """Generator que yield cada token da sequência conforme o lote avança"""
+        if self._model is None:
+            raise HTTPException(status_code=500, detail="Modelo não carregado!")
+
+        log_prompt("📤 Enviando prompt ao modelo local (batch)", prompt)
+        tokens = self._model.tokenize(prompt.encode("utf-8"), True, True)
+        if len(tokens) >= MODEL_CONTEXT_SIZE:
+            raise ValueError(
+                f"Prompt com {len(tokens)} tokens excede o contexto de {MODEL_CONTEXT_SIZE}"
+            )
+
+        seq = _Sequence(tokens)
+        with self._cond:
+            self._pending.append(seq)
+            self._cond.notify()
+
+        try:
+            while True:
+                item = seq.out.get()
+                if item is _SENTINEL:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Consumidor saiu (fim ou desconexão): libera o slot no próximo passo
+            seq.cancelled = True
+
+    # ------------------------------------------------------------------
+    # Loop de decodificação
+    # ------------------------------------------------------------------
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._closing and not self._pending and not self._active:
+                    self._cond.wait()
+                if self._closing:
+                    break
+                while self._pending and self._free_ids:
+                    seq = self._pending.pop(0)
+                    seq.seq_id = self._free_ids.pop(0)
+                    self._active[seq.seq_id] = seq
+            llm_batch_active_sequences.set(len(self._active))
+
+            try:
+                self._step()
+            except Exception as e:
+                log_error(f"❌ Erro no passo de decodificação em lote: {e}")
+                for seq in list(self._active.values()):
+                    seq.out.put(e)
+                    self._release(seq)
+
+        for seq in list(self._active.values()) + self._pending:
+            seq.out.put(RuntimeError("Modelo encerrado durante a geração."))
+            seq.out.put(_SENTINEL)
+
+    def _step(self):
+        batch = self._batch.batch
+        n = 0
+        sample_at = []
+
+        for seq in list(self._active.values()):
+            if seq.cancelled:
+                self._release(seq)
+                continue
+
+            if seq.last_token is None:
+                # Prefill em pedaços: divide o orçamento do lote entre os prompts
+                remaining = len(seq.prompt_tokens) - seq.n_prompt_done
+                take = min(remaining, self.n_batch - n)
+                for token in seq.prompt_tokens[
+                    seq.n_prompt_done : seq.n_prompt_done + take
+                ]:
+                    n = self._add(batch, n, token, seq, False)
+                seq.n_prompt_done += take
+                if take and seq.n_prompt_done == len(seq.prompt_tokens):
+                    batch.logits[n - 1] = True
+                    sample_at.append((seq, n - 1))
+            elif n < self.n_batch:
+                n = self._add(batch, n, seq.last_token, seq, True)
+                sample_at.append((seq, n - 1))
+
+        if n == 0:
+            return
+
+        batch.n_tokens = n
+        self._ctx.decode(self._batch)
+
+        for seq, index in sample_at:
+            logits = np.ctypeslib.as_array(
+                self._ctx.get_logits_ith(index), shape=(self.n_vocab,)
+            )
+            self._accept(seq, self._sample(logits, seq.history))
+
+    def _add(self, batch, n, token, seq, logits):
+        batch.token[n] = token
+        batch.pos[n] = seq.n_past
+        batch.seq_id[n][0] = seq.seq_id
+        batch.n_seq_id[n] = 1
+        batch.logits[n] = logits
+        seq.n_past += 1
+        return n + 1
+
+    def _sample(self, logits, history):
+        logits = logits.astype(np.float64)
+        if FREQUENCY_PENALTY != 1 and history:
+            recent = np.unique(history[-REPEAT_LAST_N:])
+            values = logits[recent]
+            logits[recent] = np.where(
+                values > 0, values / FREQUENCY_PENALTY, values * FREQUENCY_PENALTY
+            )
+
+        if TEMPERATURE <= 0:
+            return int(np.argmax(logits))
+
+        k = min(TOP_K, len(logits)) if TOP_K > 0 else len(logits)
+        candidates = np.argpartition(-logits, k - 1)[:k]
+        candidates = candidates[np.argsort(-logits[candidates])]
+        scaled = logits[candidates] / TEMPERATURE
+        probs = np.exp(scaled - scaled.max())
+        probs /= probs.sum()
+
+        cutoff = min(int(np.searchsorted(np.cumsum(probs), TOP_P)) + 1, k)
+        probs = probs[:cutoff] / probs[:cutoff].sum()
+        return int(candidates[self._rng.choice(cutoff, p=probs)])
+
+    def _accept(self, seq, token):
+        if llama_lib.llama_vocab_is_eog(self._model.vocab, token):
+            self._finish(seq)
+            return
+
+        seq.last_token = token
+        seq.history.append(token)
+        seq.generated += 1
+        llm_generated_tokens.labels(backend="local-batch").inc()
+
+        text = seq.decoder.decode(self._model.detokenize([token]))
+        seq.pending_text += text
+        if STOP in seq.pending_text:
+            seq.pending_text = seq.pending_text[: seq.pending_text.index(STOP)]
+            self._finish(seq)
+            return
+
+        # Segura só o sufixo que ainda pode virar o stop
+        hold = 0
+        for size in range(min(len(STOP) - 1, len(seq.pending_text)), 0, -1):
+            if STOP.startswith(seq.pending_text[-size:]):
+                hold = size
+                break
+        emit = seq.pending_text[: len(seq.pending_text) - hold]
+        seq.pending_text = seq.pending_text[len(emit) :]
+        if emit:
+            seq.out.put(emit)
+
+        if seq.generated >= MAX_TOKENS or seq.n_past >= MODEL_CONTEXT_SIZE:
+            self._finish(seq)
+
+    def _finish(self, seq):
+        if seq.pending_text:
+            seq.out.put(seq.pending_text)
+            seq.pending_text = ""
+        seq.out.put(_SENTINEL)
+        self._release(seq)
+
+    def _release(self, seq):
+        if self._active.pop(seq.seq_id, None) is None:
+            return
+        llama_lib.llama_memory_seq_rm(self._ctx.memory, seq.seq_id, -1, -1)
+        with self._cond:
+            self._free_ids.append(seq.seq_id)
+        llm_batch_active_sequences.set(len(self._active))
@@ -1,62 +1,269 @@
-from groq import Groq
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+from groq import (
+    Groq,
+    AsyncGroq,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient,
+    APIConnectionError,
+    APITimeoutError,
+    RateLimitError,
+    InternalServerError,
+)
 from polaris_logger import log_info, log_success, log_warning, log_error, log_prompt
+from polaris_metrics import llm_time_to_headers, llm_time_to_first_token, llm_retries
+
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", 60))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", 5))
+GROQ_POOL_SIZE = int(os.getenv("GROQ_POOL_SIZE", 20))
+GROQ_KEEPALIVE = float(os.getenv("GROQ_KEEPALIVE", 60))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", 3))
+GROQ_RETRY_BASE = float(os.getenv("GROQ_RETRY_BASE", 0.5))
+GROQ_RETRY_MAX = float(os.getenv("GROQ_RETRY_MAX", 8))
+
+SYSTEM_MESSAGE = "Você é Polaris, um assistente inteligente."
+
+# Falhas transitórias: conexão/timeout, limite de taxa e 5xx do provedor
+RETRYABLE_ERRORS = (APIConnectionError, RateLimitError, InternalServerError)
+
+
+def _retry_reason(error: Exception) -> str:
+    if isinstance(error, APITimeoutError):
+        return "timeout"
+    if isinstance(error, APIConnectionError):
+        return "connection"
+    if isinstance(error, RateLimitError):
+        return "rate_limit"
+    return "server_error"
+
+
+def backoff_delay(attempt: int, error: Exception = None) -> float:
+    """Backoff exponencial com jitter completo; respeita o Retry-After do 429."""
+    delay = random.uniform(0, min(GROQ_RETRY_MAX, GROQ_RETRY_BASE * 2**attempt))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get("retry-after", 0))
+        except (TypeError, ValueError):
+            retry_after = 0
+        delay = max(delay, min(retry_after, GROQ_RETRY_MAX))
+    return delay
+
+
+def _chunk_content(chunk) -> str:
+    if not chunk.choices:
+        return ""
+    return getattr(chunk.choices[0].delta, "content", None) or ""
 
 
 class GroqLLM:
+    """Backend remoto via Groq.
+
+    Mantém um único cliente síncrono e um assíncrono com pool de conexões
+    keep-alive, reaproveitando a conexão TLS entre requisições. Erros
+    transitórios são repetidos com backoff só antes do primeiro token;
+    depois disso a falha sobe para quem chamou.
+    """
+
     def __init__(self, api_key: str, model: str = "openai/gpt-oss-20b"):
         self.api_key = api_key
         self.model = model
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _timeout(self):
+        return httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT)
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=GROQ_POOL_SIZE,
+            max_keepalive_connections=GROQ_POOL_SIZE,
+            keepalive_expiry=GROQ_KEEPALIVE,
+        )
+
+    def _get_client(self) -> Groq:
+        with self._lock:
+            if self._client is None:
+                # max_retries=0: as repetições ficam com o loop abaixo, que
+                # sabe se algum token já foi entregue
+                self._client = Groq(
+                    api_key=self.api_key,
+                    max_retries=0,
+                    timeout=self._timeout(),
+                    http_client=DefaultHttpxClient(
+                        timeout=self._timeout(), limits=self._limits()
+                    ),
+                )
+            return self._client
+
+    def _get_async_client(self) -> AsyncGroq:
+        with self._lock:
+            if self._async_client is None:
+                self._async_client = AsyncGroq(
+                    api_key=self.api_key,
+                    max_retries=0,
+                    timeout=self._timeout(),
+                    http_client=DefaultAsyncHttpxClient(
+                        timeout=self._timeout(), limits=self._limits()
+                    ),
+                )
+            return self._async_client
 
     def load(self):
+        self._get_client()
+        self._get_async_client()
         log_info("🔌 Polaris conectado ao backend remoto.")
         log_success(f"✅ Modelo configurado: {self.model}")
 
     def close(self):
-        log_info("🛑 Encerrando conexão simbólica com o backend remoto.")
+        log_info("🛑 Encerrando conexão com o backend remoto.")
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def aclose(self):
+        """Fecha o cliente assíncrono; deve rodar no event loop que o usou."""
+        with self._lock:
+            client, self._async_client = self._async_client, None
+        if client is not None:
+            await client.close()
+
+    def prime_prefix(self, prefix: str):
+        """Sem efeito: o cache de prefixo fica a cargo do provedor remoto."""
+
+    def _request_kwargs(self, prompt: str) -> dict:
+        return dict(
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt},
+            ],
+            model=self.model,
+            stream=True,
+            temperature=0.3,
+            max_tokens=1024,
+        )
 
-    def invoke(self, prompt: str) -> str:
+    def _should_retry(self, error: Exception, attempt: int, emitted: bool) -> bool:
+        if emitted or attempt >= GROQ_MAX_RETRIES:
+            log_error(f"❌ Erro na inferência via backend remoto: {error}")
+            return False
+        llm_retries.labels(backend="groq", reason=_retry_reason(error)).inc()
+        return True
+
+    def invoke(self, prompt: str, session_id=None) -> str:
         """Método síncrono para compatibilidade"""
-        return self.invoke_stream(prompt, lambda chunk: None)
+        return self.invoke_stream(prompt, lambda chunk: None, session_id=session_id)
 
-    def invoke_stream(self, prompt: str, stream_callback=None) -> str:
+    def invoke_stream(self, prompt: str, stream_callback=None, session_id=None) -> str:
         """Método com suporte a streaming via callback (compatibilidade)"""
-        full_content = ""
-        for chunk in self.stream_chunks(prompt):
-            full_content += chunk
+        partes = []
+        for chunk in self.stream_chunks(prompt, session_id=session_id):
+            partes.append(chunk)
             if stream_callback:
                 stream_callback(chunk)
-        return full_content
+        return "".join(partes)
 
-    def stream_chunks(self, prompt: str):
+    def stream_chunks(self, prompt: str, session_id=None):
         """Generator que yield cada token conforme chega do Groq"""
-        client = Groq(api_key=self.api_key)
+        log_prompt(f"📤 Enviando prompt para {self.model}", prompt)
 
-        try:
-            log_prompt(f"📤 Enviando prompt para {self.model}", prompt)
-
-            chat_completion = client.chat.completions.create(
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "Você é Polaris, um assistente inteligente.",
-                    },
-                    {"role": "user", "content": prompt},
-                ],
-                model=self.model,
-                stream=True,
-                temperature=0.3,
-                max_tokens=1024,
-            )
-
-            for chunk in chat_completion:
-                if (
-                    hasattr(chunk.choices[0].delta, "content")
-                    and chunk.choices[0].delta.content
-                ):
-                    yield chunk.choices[0].delta.content
-
-            log_success(f"🧠 Streaming concluído.")
-
-        except Exception as e:
-            log_error(f"❌ Erro na inferência via backend remoto: {e}")
-            yield "Erro ao consultar o modelo remoto. Tente novamente em alguns instantes."
+        for attempt in range(GROQ_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            emitted = False
+            try:
+                chat_completion = self._get_client().chat.completions.create(
+                    **self._request_kwargs(prompt)
+                )
+                llm_time_to_headers.labels(backend="groq").observe(
+                    time.perf_counter() - start
+                )
+                try:
+                    for chunk in chat_completion:
+                        content = _chunk_content(chunk)
+                        if not content:
+                            continue
+                        if not emitted:
+                            emitted = True
+                            llm_time_to_first_token.labels(backend="groq").observe(
+                                time.perf_counter() - start
+                            )
+                        yield content
+                finally:
+                    # Libera a conexão mesmo se o consumidor abandonar o stream
+                    chat_completion.close()
+
+                log_success("🧠 Streaming concluído.")
+                return
+
+            except RETRYABLE_ERRORS as e:
+                if not self._should_retry(e, attempt, emitted):
+                    raise
+                delay = backoff_delay(attempt, e)
+                log_warning(
+                    f"🔁 Falha transitória no backend remoto ({e}), tentativa {attempt + 2} em {delay:.2f}s."
+                )
+                time.sleep(delay)
+
+            except Exception as e:
+                log_error(f"❌ Erro na inferência via backend remoto: {e}")
+                raise
+
+    async def ainvoke(self, prompt: str, session_id=None) -> str:
+        """Versão assíncrona de invoke, sem ocupar thread do executor"""
+        partes = []
+        async for chunk in self.astream_chunks(prompt, session_id=session_id):
+            partes.append(chunk)
+        return "".join(partes)
+
+    async def astream_chunks(self, prompt: str, session_id=None):
+        """Gerador assíncrono nativo: os tokens chegam direto no event loop"""
+        log_prompt(f"📤 Enviando prompt para {self.model}", prompt)
+
+        for attempt in range(GROQ_MAX_RETRIES + 1):
+            start = time.perf_counter()
+            emitted = False
+            try:
+                chat_completion = (
+                    await self._get_async_client().chat.completions.create(
+                        **self._request_kwargs(prompt)
+                    )
+                )
+                llm_time_to_headers.labels(backend="groq").observe(
+                    time.perf_counter() - start
+                )
+                try:
+                    async for chunk in chat_completion:
+                        content = _chunk_content(chunk)
+                        if not content:
+                            continue
+                        if not emitted:
+                            emitted = True
+                            llm_time_to_first_token.labels(backend="groq").observe(
+                                time.perf_counter() - start
+                            )
+                        yield content
+                finally:
+                    await chat_completion.close()
+
+                log_success("🧠 Streaming concluído.")
+                return
+
+            except RETRYABLE_ERRORS as e:
+                if not self._should_retry(e, attempt, emitted):
+                    raise
+                delay = backoff_delay(attempt, e)
+                log_warning(
+                    f"🔁 Falha transitória no backend remoto ({e}), tentativa {attempt + 2} em {delay:.2f}s."
+                )
+                await asyncio.sleep(delay)
+
+            except Exception as e:
+                log_error(f"❌ Erro na inferência via backend remoto: {e}")
+                raise
@@ -4,16 +4,71 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
-def load_llm():
-    use_local = os.getenv("USE_LOCAL_LLM", "false").lower() == "true"
+def _load_local():
+    model_path = os.getenv("MODEL_PATH")
+    batch_slots = int(os.getenv("LLAMA_BATCH_SLOTS", 1))
+
+    if batch_slots > 1:
+        from llm_batch import BatchedLlamaRunnable
+
+        return BatchedLlamaRunnable(model_path=model_path, slots=batch_slots)
+
+    from llm_local import LlamaRunnable
 
-    if use_local:
-        from llm_local import LlamaRunnable
+    return LlamaRunnable(model_path=model_path)
 
-        model_path = os.getenv("MODEL_PATH")
-        return LlamaRunnable(model_path=model_path)
 
+def _load_groq():
     from llm_groq import GroqLLM
 
     api_key = os.getenv("GROQ_API_KEY", "test_key_placeholder")
     return GroqLLM(api_key=api_key)
+
+
+def _backend_name():
+    """'router' usa Groq e llama.cpp juntos; senão USE_LOCAL_LLM decide."""
+    if os.getenv("LLM_BACKEND", "").lower() == "router":
+        return "router"
+    use_local = os.getenv("USE_LOCAL_LLM", "false").lower() == "true"
+    return "local" if use_local else "groq"
+
+
+def _slots(backend):
+    # llama.cpp local tem um contexto por slot de lote; o Groq aguenta várias conexões
+    local_slots = int(os.getenv("LLAMA_BATCH_SLOTS", 1))
+    groq_slots = int(os.getenv("GROQ_MAX_CONCURRENCY", 8))
+    return {
+        "local": local_slots,
+        "groq": groq_slots,
+        "router": local_slots + groq_slots,
+    }[backend]
+
+
+def load_llm():
+    backend = _backend_name()
+
+    if backend == "router":
+        from llm_router import RoutedLLM, RouterBackend
+
+        return RoutedLLM(
+            [
+                RouterBackend("groq", _load_groq(), capacity=_slots("groq")),
+                RouterBackend(
+                    "local", _load_local(), capacity=_slots("local"), initial_ttft=3.0
+                ),
+            ]
+        )
+
+    if backend == "local":
+        return _load_local()
+
+    return _load_groq()
+
+
+def load_scheduler():
+    """Cria o scheduler de admissão com os slots adequados ao backend ativo."""
+    from llm_scheduler import LLMScheduler
+
+    backend = _backend_name()
+    slots = int(os.getenv("LLM_MAX_CONCURRENCY", _slots(backend)))
+    return LLMScheduler(backend=backend, slots=slots)
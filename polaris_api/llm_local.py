@@ -1,8 +1,22 @@
 import os
+import threading
 import time
+from collections import OrderedDict
+
+import numpy as np
 from fastapi import HTTPException
 from llama_cpp import Llama
-from polaris_logger import log_info, log_success, log_error
+from llama_cpp import llama_cpp as llama_lib
+from llama_cpp.llama_speculative import LlamaDraftModel
+from polaris_logger import log_info, log_success, log_error, log_prompt
+from polaris_metrics import (
+    llama_state_cache_bytes,
+    llama_state_cache_lookups,
+    llm_draft_tokens,
+    llm_draft_acceptance,
+    llm_generated_tokens,
+    llm_tokens_per_second,
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,16 +30,163 @@ TOP_P = float(os.getenv("TOP_P", 0.7))
 TOP_K = int(os.getenv("TOP_K", 30))
 FREQUENCY_PENALTY = int(os.getenv("FREQUENCY_PENALTY", 2))
 SEED = int(os.getenv("SEED", 42))
+LLAMA_SESSION_CACHE_MB = int(os.getenv("LLAMA_SESSION_CACHE_MB", 1024))
+DRAFT_MODEL_PATH = os.getenv("DRAFT_MODEL_PATH", "")
+DRAFT_NUM_PRED_TOKENS = int(os.getenv("DRAFT_NUM_PRED_TOKENS", 4))
+
+
+class SessionStateCache:
+    """LRU de estados do llama.cpp (KV + tokens avaliados) por sessão, limitado em bytes."""
+
+    def __init__(self, capacity_bytes: int):
+        self.capacity_bytes = capacity_bytes
+        self.size_bytes = 0
+        self._states = OrderedDict()
+
+    @staticmethod
+    def _state_size(state) -> int:
+        return state.llama_state_size + state.input_ids.nbytes + state.scores.nbytes
+
+    def __len__(self):
+        return len(self._states)
+
+    def get(self, session_id):
+        entry = self._states.get(session_id)
+        if entry is None:
+            llama_state_cache_lookups.labels(result="miss").inc()
+            return None
+        self._states.move_to_end(session_id)
+        llama_state_cache_lookups.labels(result="hit").inc()
+        return entry[0]
+
+    def put(self, session_id, state):
+        self.pop(session_id)
+        size = self._state_size(state)
+        if size > self.capacity_bytes:
+            return
+        self._states[session_id] = (state, size)
+        self.size_bytes += size
+        while self.size_bytes > self.capacity_bytes:
+            _, (_, evicted_size) = self._states.popitem(last=False)
+            self.size_bytes -= evicted_size
+        llama_state_cache_bytes.set(self.size_bytes)
+
+    def clear(self):
+        self._states.clear()
+        self.size_bytes = 0
+        llama_state_cache_bytes.set(0)
+
+    def pop(self, session_id):
+        entry = self._states.pop(session_id, None)
+        if entry is not None:
+            self.size_bytes -= entry[1]
+            llama_state_cache_bytes.set(self.size_bytes)
+
+
+class DraftModel(LlamaDraftModel):
+    """Modelo de rascunho para decodificação especulativa.
+
+    Um GGUF pequeno (mesmo vocabulário do modelo principal) propõe os
+    próximos tokens de forma gulosa; o Llama principal avalia todos num só
+    batch e mantém só os que ele mesmo teria amostrado, então a saída é a
+    mesma da decodificação normal. A taxa de aceitação é medida comparando
+    cada proposta com os tokens que de fato entraram no contexto.
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = DRAFT_NUM_PRED_TOKENS):
+        self.model_path = model_path
+        self.num_pred_tokens = max(1, num_pred_tokens)
+        self.llm = Llama(
+            model_path=model_path,
+            n_threads=NUM_CORES,
+            n_ctx=MODEL_CONTEXT_SIZE,
+            n_gpu_layers=0,
+            verbose=False,
+        )
+        self.n_vocab = self.llm.n_vocab()
+        self._proposal = None
+        self._proposal_start = 0
+        self.accepted = 0
+        self.proposed = 0
+
+    def close(self):
+        self.llm.close()
+
+    def begin(self):
+        """Descarta a proposta pendente: uma nova geração vai começar."""
+        self._proposal = None
+
+    def _score_proposal(self, input_ids):
+        if self._proposal is None or len(input_ids) <= self._proposal_start:
+            return
+        actual = input_ids[self._proposal_start :]
+        accepted = 0
+        for proposed, token in zip(self._proposal, actual):
+            if proposed != token:
+                break
+            accepted += 1
+        self.accepted += accepted
+        self.proposed += len(self._proposal)
+        llm_draft_tokens.labels(result="accepted").inc(accepted)
+        llm_draft_tokens.labels(result="rejected").inc(len(self._proposal) - accepted)
+        llm_draft_acceptance.set(self.accepted / max(1, self.proposed))
+
+    def _next_token(self) -> int:
+        logits = np.ctypeslib.as_array(
+            self.llm._ctx.get_logits_ith(-1), shape=(self.n_vocab,)
+        )
+        return int(np.argmax(logits))
+
+    def __call__(self, input_ids, /, **kwargs):
+        ids = input_ids.tolist()
+        self._score_proposal(ids)
+
+        # Reaproveita o KV do rascunho: só avalia o que mudou desde a última chamada
+        cached = self.llm.input_ids[: self.llm.n_tokens].tolist()
+        common = 0
+        for a, b in zip(cached, ids):
+            if a != b:
+                break
+            common += 1
+        # Reavalia ao menos o último token para ter os logits da próxima posição
+        self.llm.n_tokens = min(common, len(ids) - 1)
+        self.llm.eval(ids[self.llm.n_tokens :])
+
+        limit = min(self.num_pred_tokens, MODEL_CONTEXT_SIZE - len(ids))
+        draft = []
+        while len(draft) < limit:
+            token = self._next_token()
+            if llama_lib.llama_vocab_is_eog(self.llm._model.vocab, token):
+                break
+            draft.append(token)
+            if len(draft) < limit:
+                self.llm.eval([token])
+
+        self._proposal = draft
+        self._proposal_start = len(ids)
+        return np.array(draft, dtype=np.intc)
 
 
 class LlamaRunnable:
     def __init__(self, model_path: str):
         self.model_path = model_path
         self.llm = None
+        # O contexto do llama.cpp não é thread-safe: uma geração por vez
+        self._lock = threading.Lock()
+        # Estado KV por sessão: o próximo turno só avalia o sufixo novo do prompt
+        self._session_states = SessionStateCache(LLAMA_SESSION_CACHE_MB * 1024 * 1024)
+        self._current_session = None
+        # Snapshot do prefixo de sistema comum a todos os prompts
+        self._prefix_text = None
+        self._prefix_state = None
+        self.draft_model = None
 
     def load(self):
         if self.llm is None:
             log_info("Carregando modelo LLaMA local...")
+            if DRAFT_MODEL_PATH:
+                log_info(f"Carregando modelo de rascunho: {DRAFT_MODEL_PATH}")
+                self.draft_model = DraftModel(DRAFT_MODEL_PATH)
             self.llm = Llama(
                 model_path=self.model_path,
                 n_threads=NUM_CORES,
@@ -35,6 +196,7 @@ class LlamaRunnable:
                 verbose=False,
                 use_mlock=True,
                 seed=-1,
+                draft_model=self.draft_model,
             )
             log_success("Modelo LLaMA carregado!")
 
@@ -43,17 +205,17 @@ class LlamaRunnable:
             log_info("Fechando modelo LLaMA...")
             del self.llm
             self.llm = None
+            self._session_states.clear()
+            self._current_session = None
+            self._prefix_text = None
+            self._prefix_state = None
+            if self.draft_model is not None:
+                self.draft_model.close()
+                self.draft_model = None
             log_success("Modelo LLaMA fechado!")
 
-    def invoke(self, prompt: str):
-        if self.llm is None:
-            raise HTTPException(status_code=500, detail="Modelo não carregado!")
-
-        log_info(f"📜 Enviando prompt ao modelo:\n{prompt[:500]}...")
-
-        start = time.time()
-        response = self.llm(
-            prompt,
+    def _completion_kwargs(self):
+        return dict(
             stop=["---"],
             max_tokens=1024,
             echo=False,
@@ -63,11 +225,118 @@ class LlamaRunnable:
             repeat_penalty=FREQUENCY_PENALTY,
             seed=SEED,
         )
+
+    def prime_prefix(self, prefix: str):
+        """Avalia o prefixo de sistema uma vez e guarda o snapshot do estado.
+
+        Só recalcula quando o texto do prefixo muda (ex.: polaris_prompt.txt editado).
+        """
+        if self.llm is None or prefix == self._prefix_text:
+            return
+
+        start = time.time()
+        with self._lock:
+            tokens = self.llm.tokenize(
+                prefix.encode("utf-8"), add_bos=True, special=True
+            )
+            self.llm.reset()
+            self.llm.eval(tokens)
+            self._prefix_state = self.llm.save_state()
+            self._prefix_text = prefix
+            self._current_session = None
+            # Estados de sessão antigos partem do prefixo anterior
+            self._session_states.clear()
+
+        log_success(
+            f"🧊 Prefixo de sistema pré-avaliado ({len(tokens)} tokens).",
+            duration=time.time() - start,
+        )
+
+    def _restore_session(self, session_id):
+        """Carrega o KV da sessão (ou do prefixo de sistema); o llama.cpp reaproveita o prefixo comum."""
+        if session_id is not None and session_id != self._current_session:
+            state = self._session_states.get(session_id) or self._prefix_state
+            if state is not None:
+                self.llm.load_state(state)
+        self._current_session = session_id
+
+    def _save_session(self, session_id):
+        if session_id is not None:
+            self._session_states.put(session_id, self.llm.save_state())
+
+    def _begin_generation(self):
+        if self.draft_model is not None:
+            self.draft_model.begin()
+
+    def _record_speed(self, n_tokens: int, duration: float):
+        backend = "local-draft" if self.draft_model is not None else "local"
+        llm_generated_tokens.labels(backend=backend).inc(n_tokens)
+        if n_tokens and duration > 0:
+            llm_tokens_per_second.labels(backend=backend).observe(n_tokens / duration)
+
+    def invoke(self, prompt: str, session_id=None):
+        if self.llm is None:
+            raise HTTPException(status_code=500, detail="Modelo não carregado!")
+
+        log_info(f"📜 Enviando prompt ao modelo:\n{prompt[:500]}...")
+
+        start = time.time()
+        with self._lock:
+            self._restore_session(session_id)
+            self._begin_generation()
+            response = self.llm(prompt, **self._completion_kwargs())
+            self._save_session(session_id)
         duration = time.time() - start
         log_info(f"⚡ Tempo de inferência: {duration:.3f}s")
+        self._record_speed(
+            response.get("usage", {}).get("completion_tokens", 0), duration
+        )
 
         if "choices" in response and response["choices"]:
             return response["choices"][0]["text"].strip()
 
         log_error("❌ Resposta vazia ou inválida!")
         return "Erro ao gerar resposta."
+
+    def invoke_stream(self, prompt: str, stream_callback=None, session_id=None) -> str:
+        """Método com suporte a streaming via callback (compatibilidade)"""
+        partes = []
+        for chunk in self.stream_chunks(prompt, session_id=session_id):
+            partes.append(chunk)
+            if stream_callback:
+                stream_callback(chunk)
+        return "".join(partes)
+
+    def stream_chunks(self, prompt: str, session_id=None):
+        """Generator que yield cada token conforme o llama.cpp gera"""
+        if self.llm is None:
+            raise HTTPException(status_code=500, detail="Modelo não carregado!")
+
+        log_prompt("📤 Enviando prompt ao modelo local (streaming)", prompt)
+
+        start = time.time()
+        first_token_at = None
+        n_chunks = 0
+        with self._lock:
+            self._restore_session(session_id)
+            self._begin_generation()
+            completion = self.llm(prompt, stream=True, **self._completion_kwargs())
+            try:
+                for chunk in completion:
+                    text = chunk["choices"][0]["text"]
+                    if not text:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.time()
+                        log_info(f"⚡ Primeiro token em {first_token_at - start:.3f}s")
+                    n_chunks += 1
+                    yield text
+            finally:
+                # Interrompe o loop de geração se o consumidor desistir
+                completion.close()
+                self._save_session(session_id)
+                # No streaming cada chunk corresponde a um token gerado
+                if first_token_at is not None:
+                    self._record_speed(n_chunks, time.time() - first_token_at)
+
+        log_success(f"🧠 Streaming local concluído em {time.time() - start:.3f}s.")
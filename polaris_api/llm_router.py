@@ -0,0 +1,297 @@
+import os
+import queue
+import threading
+import time
+
+from polaris_logger import log_info, log_success, log_warning, log_error
+from polaris_metrics import (
+    llm_router_requests,
+    llm_router_failovers,
+    llm_router_hedges,
+    llm_router_latency,
+)
+
+LLM_ROUTER_TTFT_BUDGET = float(os.getenv("LLM_ROUTER_TTFT_BUDGET", 15))
+LLM_ROUTER_HEDGE_DELAY = float(os.getenv("LLM_ROUTER_HEDGE_DELAY", 0))
+LLM_ROUTER_COOLDOWN = float(os.getenv("LLM_ROUTER_COOLDOWN", 30))
+LLM_ROUTER_EWMA_ALPHA = float(os.getenv("LLM_ROUTER_EWMA_ALPHA", 0.3))
+
+_SENTINEL = object()
+
+
+class RouterBackend:
+    """Um backend do roteador com suas estatísticas de latência e carga."""
+
+    def __init__(self, name: str, llm, capacity: int = 1, initial_ttft: float = 1.0):
+        self.name = name
+        self.llm = llm
+        self.capacity = max(1, capacity)
+        self.ttft = initial_ttft
+        self.inflight = 0
+        self.cooldown_until = 0.0
+        self.available = True
+
+    @property
+    def healthy(self) -> bool:
+        return self.available and time.time() >= self.cooldown_until
+
+    def score(self) -> float:
+        """Espera estimada até o primeiro token: latência recente × ocupação."""
+        return self.ttft * (1 + self.inflight / self.capacity)
+
+
+class _Attempt:
+    """Uma geração em andamento num backend, rodando numa thread própria."""
+
+    def __init__(self, router, backend, prompt, session_id, events):
+        self.router = router
+        self.backend = backend
+        self.started = time.perf_counter()
+        self.done = False
+        self._prompt = prompt
+        self._session_id = session_id
+        self._events = events
+        self._cancelled = threading.Event()
+        router._track(backend, +1)
+        threading.Thread(
+            target=self._run, name=f"polaris-router-{backend.name}", daemon=True
+        ).start()
+
+    def cancel(self):
+        self.done = True
+        self._cancelled.set()
+
+    def _run(self):
+        chunks = None
+        try:
+            chunks = self.backend.llm.stream_chunks(
+                self._prompt, session_id=self._session_id
+            )
+            for chunk in chunks:
+                if self._cancelled.is_set():
+                    break
+                self._events.put((self, chunk))
+        except Exception as e:
+            self._events.put((self, e))
+        finally:
+            # Fecha o gerador para interromper a geração no backend perdedor
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self.router._track(self.backend, -1)
+            self._events.put((self, _SENTINEL))
+
+
+class RoutedLLM:
+    """Backend que roteia cada requisição entre Groq e llama.cpp local.
+
+    Escolhe o backend com menor espera estimada (EWMA do tempo até o
+    primeiro token × ocupação). Se o backend falha ou estoura o orçamento
+    de TTFT antes do primeiro token, a requisição passa para o próximo
+    (o último backend disponível é esperado sem orçamento);
+    com LLM_ROUTER_HEDGE_DELAY > 0, o segundo backend é disparado em
+    paralelo após esse atraso e vence quem entregar o primeiro token.
+    Depois do primeiro token não há troca: erros sobem para quem chamou.
+    """
+
+    def __init__(
+        self,
+        backends,
+        ttft_budget: float = LLM_ROUTER_TTFT_BUDGET,
+        hedge_delay: float = LLM_ROUTER_HEDGE_DELAY,
+        cooldown: float = LLM_ROUTER_COOLDOWN,
+    ):
+        self.backends = list(backends)
+        self.ttft_budget = ttft_budget
+        self.hedge_delay = hedge_delay
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        for backend in self.backends:
+            llm_router_latency.labels(backend=backend.name).set(backend.ttft)
+
+    def load(self):
+        for backend in self.backends:
+            try:
+                backend.llm.load()
+            except Exception as e:
+                backend.available = False
+                log_error(f"❌ Backend '{backend.name}' indisponível no roteador: {e}")
+        if not any(b.available for b in self.backends):
+            raise RuntimeError("Nenhum backend de LLM pôde ser carregado.")
+        log_success(
+            f"✅ Roteador de LLM ativo: {', '.join(b.name for b in self.backends if b.available)}"
+        )
+
+    def close(self):
+        for backend in self.backends:
+            if backend.available:
+                backend.llm.close()
+
+    async def aclose(self):
+        for backend in self.backends:
+            aclose = getattr(backend.llm, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def prime_prefix(self, prefix: str):
+        for backend in self.backends:
+            if backend.available:
+                backend.llm.prime_prefix(prefix)
+
+    def invoke(self, prompt: str, session_id=None) -> str:
+        return self.invoke_stream(prompt, session_id=session_id)
+
+    def invoke_stream(self, prompt: str, stream_callback=None, session_id=None) -> str:
+        """Método com suporte a streaming via callback (compatibilidade)"""
+        partes = []
+        for chunk in self.stream_chunks(prompt, session_id=session_id):
+            partes.append(chunk)
+            if stream_callback:
+                stream_callback(chunk)
+        return "".join(partes)
+
+    # ------------------------------------------------------------------
+    # Estatísticas
+    # ------------------------------------------------------------------
+
+    def ranked(self):
+        """Backends saudáveis pela menor espera estimada; os em cooldown por último."""
+        with self._lock:
+            candidates = [b for b in self.backends if b.available]
+            return sorted(candidates, key=lambda b: (not b.healthy, b.score()))
+
+    def _track(self, backend, delta):
+        with self._lock:
+            backend.inflight += delta
+
+    def _record_ttft(self, backend, seconds):
+        with self._lock:
+            backend.ttft += LLM_ROUTER_EWMA_ALPHA * (seconds - backend.ttft)
+            backend.cooldown_until = 0.0
+        llm_router_latency.labels(backend=backend.name).set(backend.ttft)
+
+    def _record_failure(self, backend, reason):
+        with self._lock:
+            backend.cooldown_until = time.time() + self.cooldown
+            if reason == "ttft_budget":
+                # Conta o estouro como latência observada para a próxima escolha
+                backend.ttft += LLM_ROUTER_EWMA_ALPHA * (
+                    self.ttft_budget - backend.ttft
+                )
+        llm_router_failovers.labels(backend=backend.name, reason=reason).inc()
+        llm_router_latency.labels(backend=backend.name).set(backend.ttft)
+
+    # ------------------------------------------------------------------
+    # Roteamento
+    # ------------------------------------------------------------------
+
+    def stream_chunks(self, prompt: str, session_id=None):
+        """Generator que yield os tokens do backend vencedor"""
+        pending = self.ranked()
+        events = queue.Queue()
+        attempts = []
+        last_error = None
+        winner = None
+        first = None
+
+        def launch():
+            backend = pending.pop(0)
+            log_info(
+                f"🧭 Roteando geração para '{backend.name}'", session_id=session_id
+            )
+            attempts.append(_Attempt(self, backend, prompt, session_id, events))
+
+        try:
+            launch()
+            hedge_at = (
+                time.perf_counter() + self.hedge_delay if self.hedge_delay > 0 else None
+            )
+
+            # Até o primeiro token: failover por erro, orçamento de TTFT ou hedge
+            while winner is None:
+                live = [a for a in attempts if not a.done]
+                if not live:
+                    if not pending:
+                        raise last_error or RuntimeError(
+                            "Nenhum backend de LLM disponível."
+                        )
+                    launch()
+                    continue
+
+                # Orçamento de TTFT só vale se houver para onde trocar: a
+                # última opção é esperada até responder ou falhar
+                wake = None
+                if pending or len(live) > 1:
+                    wake = min(a.started + self.ttft_budget for a in live)
+                if hedge_at is not None and pending:
+                    wake = hedge_at if wake is None else min(wake, hedge_at)
+                try:
+                    attempt, item = events.get(
+                        timeout=(
+                            None
+                            if wake is None
+                            else max(0.0, wake - time.perf_counter())
+                        )
+                    )
+                except queue.Empty:
+                    now = time.perf_counter()
+                    for attempt in live:
+                        others = pending or any(
+                            not a.done for a in live if a is not attempt
+                        )
+                        if now >= attempt.started + self.ttft_budget and others:
+                            attempt.cancel()
+                            self._record_failure(attempt.backend, "ttft_budget")
+                            log_warning(
+                                f"⏱️ '{attempt.backend.name}' sem primeiro token em {self.ttft_budget}s, trocando de backend.",
+                                session_id=session_id,
+                            )
+                    if hedge_at is not None and now >= hedge_at and pending:
+                        hedge_at = None
+                        llm_router_hedges.inc()
+                        launch()
+                    continue
+
+                if attempt.done:
+                    continue  # resto de uma tentativa já descartada
+                if item is _SENTINEL:
+                    # Terminou sem tokens e sem erro: resposta vazia legítima
+                    attempt.done = True
+                    winner = attempt
+                elif isinstance(item, Exception):
+                    attempt.done = True
+                    last_error = item
+                    self._record_failure(attempt.backend, "error")
+                    log_warning(
+                        f"🔁 Falha em '{attempt.backend.name}' antes do primeiro token ({item}), tentando o próximo backend.",
+                        session_id=session_id,
+                    )
+                else:
+                    winner, first = attempt, item
+
+            self._record_ttft(winner.backend, time.perf_counter() - winner.started)
+            llm_router_requests.labels(backend=winner.backend.name).inc()
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+
+            if first is None:
+                return
+            yield first
+
+            while True:
+                attempt, item = events.get()
+                if attempt is not winner:
+                    continue
+                if item is _SENTINEL:
+                    return
+                if isinstance(item, Exception):
+                    log_error(
+                        f"❌ Erro em '{winner.backend.name}' durante o streaming: {item}"
+                    )
+                    raise item
+                yield item
+        finally:
+            # Consumidor saiu ou terminou: cancela toda tentativa ainda viva
+            for attempt in attempts:
+                attempt.cancel()
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional
+
+from fastapi import HTTPException
+from polaris_logger import log_warning
+from polaris_metrics import (
+    llm_queue_depth,
+    llm_active_generations,
+    llm_queue_wait,
+    llm_rejected,
+)
+from polaris_stream import TokenBridge, AsyncTokenStream
+
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 32))
+LLM_REQUEST_DEADLINE = float(os.getenv("LLM_REQUEST_DEADLINE", 120))
+
+
+class LLMScheduler:
+    """Controle de admissão entre a API e o backend de LLM.
+
+    Limita as gerações simultâneas a `slots`, mantém no máximo `max_queue`
+    requisições esperando e aplica um prazo por requisição:
+    - fila cheia → 429 imediato
+    - sem slot dentro do prazo → 503
+    - geração além do prazo → 504 (o slot só é liberado quando a thread termina)
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        slots: int,
+        max_queue: int = LLM_MAX_QUEUE,
+        deadline: float = LLM_REQUEST_DEADLINE,
+    ):
+        self.backend = backend
+        self.slots = slots
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self._semaphore = asyncio.Semaphore(slots)
+        self._waiting = 0
+        self._active = 0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def check_admission(self):
+        """Rejeita na hora (429) se a fila de espera já está cheia."""
+        if self._active >= self.slots and self._waiting >= self.max_queue:
+            llm_rejected.labels(backend=self.backend, reason="queue_full").inc()
+            log_warning(
+                f"🚦 Fila do backend '{self.backend}' cheia ({self._waiting} aguardando), rejeitando."
+            )
+            raise HTTPException(
+                status_code=429,
+                detail="Polaris está ocupada no momento. Tente novamente em instantes.",
+            )
+
+    async def acquire(self, deadline: Optional[float] = None) -> float:
+        """Espera um slot de geração; retorna o instante limite da requisição."""
+        self.check_admission()
+        start = time.time()
+        expires_at = start + (self.deadline if deadline is None else deadline)
+
+        self._waiting += 1
+        llm_queue_depth.labels(backend=self.backend).set(self._waiting)
+        try:
+            await asyncio.wait_for(
+                self._semaphore.acquire(), timeout=max(0.0, expires_at - start)
+            )
+        except asyncio.TimeoutError:
+            llm_rejected.labels(backend=self.backend, reason="deadline").inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Tempo de espera por um slot de inferência esgotado.",
+            )
+        finally:
+            self._waiting -= 1
+            llm_queue_depth.labels(backend=self.backend).set(self._waiting)
+            llm_queue_wait.labels(backend=self.backend).observe(time.time() - start)
+
+        self._active += 1
+        llm_active_generations.labels(backend=self.backend).set(self._active)
+        return expires_at
+
+    def release(self):
+        self._active -= 1
+        llm_active_generations.labels(backend=self.backend).set(self._active)
+        self._semaphore.release()
+
+    async def run(self, func: Callable, *args, deadline: Optional[float] = None):
+        """Executa uma geração bloqueante numa thread, dentro de um slot."""
+        expires_at = await self.acquire(deadline)
+        loop = asyncio.get_running_loop()
+        try:
+            future = loop.run_in_executor(None, func, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(lambda _: self.release())
+
+        try:
+            return await asyncio.wait_for(
+                asyncio.shield(future), timeout=max(0.0, expires_at - time.time())
+            )
+        except asyncio.TimeoutError:
+            llm_rejected.labels(backend=self.backend, reason="timeout").inc()
+            raise HTTPException(
+                status_code=504, detail="A geração excedeu o prazo da requisição."
+            )
+
+    async def run_async(
+        self, func: Callable[..., Awaitable], *args, deadline: Optional[float] = None
+    ):
+        """Executa uma geração assíncrona nativa dentro de um slot, sem thread."""
+        expires_at = await self.acquire(deadline)
+        try:
+            return await asyncio.wait_for(
+                func(*args), timeout=max(0.0, expires_at - time.time())
+            )
+        except asyncio.TimeoutError:
+            llm_rejected.labels(backend=self.backend, reason="timeout").inc()
+            raise HTTPException(
+                status_code=504, detail="A geração excedeu o prazo da requisição."
+            )
+        finally:
+            self.release()
+
+    async def open_stream(
+        self, producer: Callable[[], Iterable[str]], deadline: Optional[float] = None
+    ) -> TokenBridge:
+        """Inicia um streaming dentro de um slot; o slot é liberado quando o produtor termina."""
+        await self.acquire(deadline)
+        try:
+            bridge = TokenBridge(producer).start()
+        except BaseException:
+            self.release()
+            raise
+        bridge.future.add_done_callback(lambda _: self.release())
+        return bridge
+
+    async def open_async_stream(
+        self,
+        producer: Callable[[], AsyncIterator[str]],
+        deadline: Optional[float] = None,
+    ) -> AsyncTokenStream:
+        """Como open_stream, mas para geradores assíncronos nativos (sem thread)."""
+        await self.acquire(deadline)
+        try:
+            return AsyncTokenStream(producer(), on_close=self.release)
+        except BaseException:
+            self.release()
+            raise
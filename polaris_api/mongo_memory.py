@@ -0,0 +1,268 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import List
+
+from pymongo import ASCENDING, DESCENDING, AsyncMongoClient, MongoClient, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from pymongo.monitoring import ConnectionPoolListener
+
+from content_index import content_hash
+from polaris_logger import log_info, log_success, log_warning
+from polaris_metrics import (
+    mongo_cache_requests,
+    mongo_pool_connections,
+    mongo_pool_checked_out,
+    mongo_pool_max_size,
+    mongo_pool_checkout_seconds,
+    mongo_pool_checkout_failures,
+)
+
+MONGODB_HISTORY = int(os.getenv("MONGODB_HISTORY", 4))
+MONGODB_CACHE_SESSIONS = int(os.getenv("MONGODB_CACHE_SESSIONS", 1000))
+# Outros workers também gravam: o cache local vale no máximo isso (0 desativa)
+MONGODB_CACHE_TTL = float(os.getenv("MONGODB_CACHE_TTL", 30))
+
+# Pool de conexões (por worker)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", 0))
+MONGODB_MAX_IDLE_MS = int(os.getenv("MONGODB_MAX_IDLE_MS", 60000))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 2000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", 2000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 2000)
+)
+MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", 5000))
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Exporta a ocupação do pool de conexões do driver para o Prometheus."""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        mongo_pool_connections.inc()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        mongo_pool_connections.dec()
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.labels(reason=event.reason).inc()
+
+    def connection_checked_out(self, event):
+        mongo_pool_checked_out.inc()
+        if event.duration is not None:
+            mongo_pool_checkout_seconds.observe(event.duration)
+
+    def connection_checked_in(self, event):
+        mongo_pool_checked_out.dec()
+
+
+def open_client(uri: str, async_driver: bool = True):
+    """Cliente único do worker, com pool e timeouts configuráveis.
+
+    Nada conecta aqui: a primeira operação abre as conexões. Com o
+    driver assíncrono as consultas não ocupam threads nem o event loop.
+    """
+    client_class = AsyncMongoClient if async_driver else MongoClient
+    mongo_pool_max_size.set(MONGODB_MAX_POOL_SIZE)
+    return client_class(
+        uri,
+        maxPoolSize=MONGODB_MAX_POOL_SIZE,
+        minPoolSize=MONGODB_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGODB_MAX_IDLE_MS,
+        waitQueueTimeoutMS=MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGODB_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MONGODB_SOCKET_TIMEOUT_MS,
+        event_listeners=[PoolMetrics()],
+    )
+
+
+def _recent_query(collection, session_id: str, history: int):
+    return (
+        collection.find({"session_id": session_id}, {"text": 1})
+        .sort("timestamp", -1)
+        .limit(history)
+    )
+
+
+def _upsert_args(session_id: str, text: str):
+    return (
+        {"session_id": session_id, "text_hash": content_hash(text)},
+        {"$setOnInsert": {"text": text, "timestamp": datetime.utcnow()}},
+    )
+
+
+def _backfill_ops(missing) -> List[UpdateOne]:
+    return [
+        UpdateOne(
+            {"_id": doc["_id"]},
+            {"$set": {"text_hash": content_hash(doc.get("text", ""))}},
+        )
+        for doc in missing
+    ]
+
+
+_MISSING_HASH = {"text_hash": {"$exists": False}}
+_RECENT_INDEX = [("session_id", ASCENDING), ("timestamp", DESCENDING)]
+_HASH_INDEX = [("session_id", ASCENDING), ("text_hash", ASCENDING)]
+
+
+class _RecentCache:
+    """LRU por sessão das últimas memórias, com TTL e invalidação na escrita."""
+
+    def __init__(
+        self,
+        collection,
+        history: int = MONGODB_HISTORY,
+        cache_sessions: int = MONGODB_CACHE_SESSIONS,
+        cache_ttl: float = MONGODB_CACHE_TTL,
+    ):
+        self.collection = collection
+        self.history = history
+        self.cache_sessions = cache_sessions
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()  # session_id -> (horário, [textos])
+        self._writes = 0  # leituras iniciadas antes de uma escrita não entram no cache
+        self._lock = threading.Lock()
+
+    def _cached(self, session_id: str):
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is None:
+                mongo_cache_requests.labels(result="miss").inc()
+                return None, self._writes
+            if self.cache_ttl and time.monotonic() - entry[0] > self.cache_ttl:
+                del self._cache[session_id]
+                mongo_cache_requests.labels(result="miss").inc()
+                return None, self._writes
+            self._cache.move_to_end(session_id)
+            mongo_cache_requests.labels(result="hit").inc()
+            return list(entry[1]), self._writes
+
+    def _remember(self, session_id: str, writes: int, texts: List[str]):
+        with self._lock:
+            if writes == self._writes:
+                self._cache[session_id] = (time.monotonic(), texts)
+                self._cache.move_to_end(session_id)
+                while len(self._cache) > self.cache_sessions:
+                    self._cache.popitem(last=False)
+        return list(texts)
+
+    def invalidate(self, session_id: str):
+        with self._lock:
+            self._writes += 1
+            self._cache.pop(session_id, None)
+
+
+class MongoMemory(_RecentCache):
+    """Memórias de longo prazo no MongoDB, com índices e cache de leitura.
+
+    - índices compostos criados no startup: (session_id, timestamp desc)
+      para as últimas memórias e único (session_id, text_hash) para
+      deduplicar;
+    - save() é um único upsert com $setOnInsert (sem find_one antes);
+    - recent() guarda por sessão as últimas `history` memórias num LRU;
+      uma gravação nova invalida a sessão e as entradas expiram após
+      `cache_ttl` segundos (gravações de outros workers).
+
+    Usa o driver síncrono (MongoClient); AsyncMongoMemory é a versão
+    para o AsyncMongoClient.
+    """
+
+    def ensure_indexes(self):
+        """Cria os índices (idempotente) e completa text_hash de documentos antigos."""
+        missing = list(self.collection.find(_MISSING_HASH, {"text": 1}))
+        if missing:
+            self.collection.bulk_write(_backfill_ops(missing), ordered=False)
+            log_info(f"🔧 text_hash preenchido em {len(missing)} memórias antigas.")
+        self.collection.create_index(_RECENT_INDEX, name="session_recent")
+        try:
+            self.collection.create_index(
+                _HASH_INDEX, name="session_text_hash", unique=True
+            )
+        except OperationFailure as e:
+            # Duplicatas antigas impedem o índice único; o upsert continua
+            # deduplicando pelo filtro, só sem a garantia do banco
+            log_warning(f"⚠️ Índice único de memórias não criado: {e}")
+        log_success("🗂️ Índices do MongoDB verificados.")
+
+    def recent(self, session_id: str) -> List[str]:
+        """Últimas `history` memórias da sessão (mais novas primeiro)."""
+        texts, writes = self._cached(session_id)
+        if texts is not None:
+            return texts
+        memories = _recent_query(self.collection, session_id, self.history)
+        return self._remember(session_id, writes, [mem["text"] for mem in memories])
+
+    def save(self, session_id: str, text: str) -> bool:
+        """Grava a memória; devolve False se a sessão já tinha esse texto."""
+        try:
+            result = self.collection.update_one(
+                *_upsert_args(session_id, text), upsert=True
+            )
+        except DuplicateKeyError:
+            # Dois upserts simultâneos do mesmo texto: o outro venceu
+            return False
+        if result.upserted_id is None:
+            return False
+        self.invalidate(session_id)
+        return True
+
+
+class AsyncMongoMemory(_RecentCache):
+    """MongoMemory sobre o AsyncMongoClient: consultas não bloqueiam o event loop."""
+
+    async def ensure_indexes(self):
+        missing = await self.collection.find(_MISSING_HASH, {"text": 1}).to_list()
+        if missing:
+            await self.collection.bulk_write(_backfill_ops(missing), ordered=False)
+            log_info(f"🔧 text_hash preenchido em {len(missing)} memórias antigas.")
+        await self.collection.create_index(_RECENT_INDEX, name="session_recent")
+        try:
+            await self.collection.create_index(
+                _HASH_INDEX, name="session_text_hash", unique=True
+            )
+        except OperationFailure as e:
+            log_warning(f"⚠️ Índice único de memórias não criado: {e}")
+        log_success("🗂️ Índices do MongoDB verificados.")
+
+    async def recent(self, session_id: str) -> List[str]:
+        texts, writes = self._cached(session_id)
+        if texts is not None:
+            return texts
+        memories = await _recent_query(
+            self.collection, session_id, self.history
+        ).to_list()
+        return self._remember(session_id, writes, [mem["text"] for mem in memories])
+
+    async def save(self, session_id: str, text: str) -> bool:
+        try:
+            result = await self.collection.update_one(
+                *_upsert_args(session_id, text), upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        if result.upserted_id is None:
+            return False
+        self.invalidate(session_id)
+        return True
@@ -0,0 +1,502 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from polaris_metrics import vector_partitions_open, vector_partition_opens
+
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float16")  # float16 | int8
+VECTOR_MMAP = os.getenv("VECTOR_MMAP", "false").lower() == "true"
+# Até quantos vetores a sessão usa busca exata; acima disso, o índice IVF
+VECTOR_EXACT_THRESHOLD = int(os.getenv("VECTOR_EXACT_THRESHOLD", 5000))
+# Listas do IVF consultadas por busca (mais = recall maior, busca mais lenta)
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", 16))
+VECTOR_IVF_LISTS = int(os.getenv("VECTOR_IVF_LISTS", 0))  # 0 = 4·√n
+VECTOR_PARTITION_CACHE = int(os.getenv("VECTOR_PARTITION_CACHE", 256))
+
+DEFAULT_SESSION = "default_session"
+INT8_SCALE = 127.0
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _matches(metadata: dict, where: Optional[dict]) -> bool:
+    return not where or all(metadata.get(k) == v for k, v in where.items())
+
+
+class IVFIndex:
+    """Índice aproximado por listas invertidas (IVF) para busca por cosseno.
+
+    Os vetores são agrupados por k-means em `nlist` centroides; a busca
+    compara a consulta com os centroides e faz busca exata só nas
+    `nprobe` listas mais próximas. Tudo em operações vetorizadas do
+    NumPy. Vetores adicionados depois da construção ficam numa lista de
+    pendentes, sempre varrida, até a próxima reconstrução.
+    """
+
+    def __init__(self, nprobe: int = VECTOR_IVF_NPROBE, nlist: int = VECTOR_IVF_LISTS):
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self.centroids = None
+        self.lists = []
+        self.pending = []
+        self.size = 0
+
+    @staticmethod
+    def _blocks(vectors, rows=None, block: int = 8192):
+        rows = np.arange(len(vectors)) if rows is None else rows
+        for start in range(0, len(rows), block):
+            chunk = rows[start : start + block]
+            yield chunk, vectors[chunk].astype(np.float32)
+
+    def build(self, vectors, iterations: int = 10, seed: int = 0):
+        n = len(vectors)
+        # Mais listas que vetores não cabe no sorteio dos centroides
+        nlist = min(self.nlist or max(1, int(4 * np.sqrt(n))), n)
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(n, size=min(n, 64 * nlist), replace=False)
+        data = vectors[np.sort(sample)].astype(np.float32)
+        centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+        for _ in range(iterations):
+            assign = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, data)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+
+        assign = np.empty(n, dtype=np.int64)
+        for rows, chunk in self._blocks(vectors):
+            assign[rows] = np.argmax(chunk @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        bounds = np.searchsorted(assign[order], np.arange(nlist + 1))
+        self.centroids = centroids
+        self.lists = [order[bounds[i] : bounds[i + 1]] for i in range(nlist)]
+        self.pending = []
+        self.size = n
+
+    def add(self, node: int):
+        self.pending.append(node)
+
+    @property
+    def stale(self) -> bool:
+        return len(self.pending) > 0.1 * max(1, self.size)
+
+    def search(self, vectors, query, k: int):
+        probe = np.argsort(-(self.centroids @ query))[: self.nprobe]
+        rows = np.concatenate(
+            [self.lists[i] for i in probe] + [np.asarray(self.pending, dtype=np.int64)]
+        )
+        sims = vectors[rows].astype(np.float32) @ query
+        top = np.argsort(-sims)[:k]
+        return rows[top]
+
+
+class _Partition:
+    """Vetores de uma sessão: matriz contígua em disco + documentos em JSONL."""
+
+    def __init__(self, directory: str, dtype: str, mmap: bool, threshold: int):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.mmap = mmap
+        self.threshold = threshold
+        self.ids, self.documents, self.metadatas = [], [], []
+        self.rows = {}  # id -> linha da matriz
+        self.dim = None
+        self.count = 0
+        self._vectors = None
+        self.index = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        try:
+            with open(self._path("meta.json")) as f:
+                self.dim = json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            return
+        with open(self._path("records.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break  # linha truncada por queda no meio da escrita
+                self.ids.append(record["id"])
+                self.documents.append(record["document"])
+                self.metadatas.append(record["metadata"])
+        if not os.path.exists(self._path("vectors.bin")):
+            self.ids, self.documents, self.metadatas = [], [], []
+            return
+        rows = os.path.getsize(self._path("vectors.bin")) // (
+            self.dim * self.dtype.itemsize
+        )
+        self.count = min(rows, len(self.ids))
+        del (
+            self.ids[self.count :],
+            self.documents[self.count :],
+            self.metadatas[self.count :],
+        )
+        self.rows = {record_id: i for i, record_id in enumerate(self.ids)}
+        self._open_vectors()
+
+    def _open_vectors(self):
+        if not self.count:
+            self._vectors = np.zeros((0, self.dim), dtype=self.dtype)
+        elif self.mmap:
+            self._vectors = np.memmap(
+                self._path("vectors.bin"),
+                dtype=self.dtype,
+                mode="r",
+                shape=(self.count, self.dim),
+            )
+        else:
+            self._vectors = np.fromfile(self._path("vectors.bin"), dtype=self.dtype)[
+                : self.count * self.dim
+            ].reshape(self.count, self.dim)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[: self.count]
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        return vectors.astype(self.dtype)
+
+    def _query(self, vector) -> np.ndarray:
+        query = _normalize(np.asarray([vector], dtype=np.float32))[0]
+        return query * INT8_SCALE if self.dtype == np.int8 else query
+
+    def add(self, texts, vectors, metadatas) -> List[str]:
+        encoded = self._encode(vectors)
+        ids = [uuid.uuid4().hex for _ in texts]
+        with self._lock:
+            if self.dim is None:
+                self.dim = encoded.shape[1]
+                with open(self._path("meta.json"), "w") as f:
+                    json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+            # Vetores antes dos registros: um registro no disco sempre tem vetor
+            with open(self._path("vectors.bin"), "ab") as f:
+                f.write(encoded.tobytes())
+            with open(self._path("records.jsonl"), "a", encoding="utf-8") as f:
+                for record_id, text, metadata in zip(ids, texts, metadatas):
+                    f.write(
+                        json.dumps(
+                            {"id": record_id, "document": text, "metadata": metadata},
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+
+            first = self.count
+            self.rows.update((record_id, first + i) for i, record_id in enumerate(ids))
+            self.ids.extend(ids)
+            self.documents.extend(texts)
+            self.metadatas.extend(metadatas)
+            self.count += len(texts)
+            if self.mmap:
+                self._open_vectors()
+            else:
+                if self._vectors is None or len(self._vectors) < self.count:
+                    # Capacidade dobra: append amortizado sem realocar a cada lote
+                    old = 0 if self._vectors is None else len(self._vectors)
+                    grown = np.empty((max(self.count, 2 * old), self.dim), self.dtype)
+                    grown[:first] = self._vectors[:first] if first else grown[:0]
+                    self._vectors = grown
+                self._vectors[first : self.count] = encoded
+
+            if self.index is not None:
+                for node in range(first, self.count):
+                    self.index.add(node)
+        return ids
+
+    def remove(self, ids) -> int:
+        """Reescreve a partição sem os ids dados; devolve quantos saíram.
+
+        Os arquivos novos são gravados num diretório ao lado e trocados por
+        rename, então uma queda no meio nunca deixa vetores e registros
+        desalinhados (NumpyVectorStore._open completa ou desfaz a troca).
+        """
+        doomed = set(ids)
+        with self._lock:
+            keep = [
+                i for i, record_id in enumerate(self.ids) if record_id not in doomed
+            ]
+            removed = self.count - len(keep)
+            if not removed:
+                return 0
+            temp, old = self.directory + ".tmp", self.directory + ".old"
+            shutil.rmtree(temp, ignore_errors=True)
+            os.makedirs(temp)
+            with open(os.path.join(temp, "vectors.bin"), "wb") as f:
+                f.write(np.ascontiguousarray(self.vectors[keep]).tobytes())
+            with open(os.path.join(temp, "records.jsonl"), "w", encoding="utf-8") as f:
+                for i in keep:
+                    f.write(
+                        json.dumps(
+                            {
+                                "id": self.ids[i],
+                                "document": self.documents[i],
+                                "metadata": self.metadatas[i],
+                            },
+                            ensure_ascii=False,
+                        )
+                        + "\n"
+                    )
+            with open(os.path.join(temp, "meta.json"), "w") as f:
+                json.dump({"dim": self.dim, "dtype": self.dtype.name}, f)
+            os.rename(self.directory, old)
+            os.rename(temp, self.directory)
+            shutil.rmtree(old, ignore_errors=True)
+
+            self.ids, self.documents, self.metadatas = [], [], []
+            self.rows = {}
+            self.count = 0
+            self._vectors = None
+            self.index = None
+            self._load()
+            return removed
+
+    def vectors_for(self, ids) -> List[Optional[np.ndarray]]:
+        """Vetores guardados (normalizados, float32) dos ids; None se não existe."""
+        with self._lock:
+            rows = [self.rows.get(record_id) for record_id in ids]
+            return [
+                None if row is None else self.vectors[row].astype(np.float32)
+                for row in rows
+            ]
+
+    def _build_index(self):
+        index = IVFIndex()
+        index.build(self.vectors)
+        self.index = index
+
+    def search(self, vector, k: int, where: Optional[dict] = None, exact: bool = False):
+        query = self._query(vector)
+        with self._lock:
+            vectors = self.vectors
+            if not self.count:
+                return []
+            if where:
+                # Filtro extra: candidatos restritos, busca exata entre eles
+                rows = np.array(
+                    [i for i, m in enumerate(self.metadatas) if _matches(m, where)],
+                    dtype=np.int64,
+                )
+                if not len(rows):
+                    return []
+                sims = vectors[rows].astype(np.float32) @ query
+                top = rows[np.argsort(-sims)[:k]]
+            elif exact or self.count <= self.threshold:
+                sims = np.empty(self.count, dtype=np.float32)
+                for rows, chunk in IVFIndex._blocks(vectors):
+                    sims[rows] = chunk @ query
+                top = np.argpartition(-sims, min(k, self.count) - 1)[:k]
+                top = top[np.argsort(-sims[top])]
+            else:
+                if self.index is None or self.index.stale:
+                    self._build_index()
+                top = self.index.search(vectors, query, k)
+            return [(self.documents[i], self.metadatas[i], self.ids[i]) for i in top]
+
+
+class NumpyVectorStore:
+    """Vectorstore em processo: vetores de cada sessão em arrays NumPy contíguos.
+
+    Alternativa ao Chroma com a mesma interface usada pela Polaris
+    (similarity_search, add_texts, get, delete_session). Os vetores são
+    normalizados e guardados em float16 ou int8 (VECTOR_DTYPE), opcionalmente
+    via memmap. Sessões com até VECTOR_EXACT_THRESHOLD vetores usam busca
+    exata (produto matriz-vetor em blocos); acima disso, um índice IVF
+    construído sob demanda. Partições abertas ficam numa LRU.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embedding_function,
+        dtype: str = VECTOR_DTYPE,
+        mmap: bool = VECTOR_MMAP,
+        exact_threshold: int = VECTOR_EXACT_THRESHOLD,
+        cache_size: int = VECTOR_PARTITION_CACHE,
+    ):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"VECTOR_DTYPE inválido: {dtype}")
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.dtype = dtype
+        self.mmap = mmap
+        self.exact_threshold = exact_threshold
+        self.cache_size = cache_size
+        self._partitions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def partition_name(self, session_id: str) -> str:
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8)
+        return f"polaris_s{digest.hexdigest()}"
+
+    def _partition(self, session_id: str, create: bool = True) -> Optional[_Partition]:
+        return self._open(self.partition_name(session_id), create)
+
+    def _recover(self, path: str):
+        """Completa ou desfaz uma reescrita interrompida de _Partition.remove."""
+        if not os.path.isdir(path) and os.path.isdir(path + ".old"):
+            os.rename(path + ".old", path)
+        shutil.rmtree(path + ".old", ignore_errors=True)
+        shutil.rmtree(path + ".tmp", ignore_errors=True)
+
+    def _open(self, name: str, create: bool = True) -> Optional[_Partition]:
+        with self._lock:
+            partition = self._partitions.get(name)
+            if partition is not None:
+                self._partitions.move_to_end(name)
+                vector_partition_opens.labels(result="cached").inc()
+                return partition
+            path = os.path.join(self.directory, name)
+            self._recover(path)
+            if not create and not os.path.isdir(path):
+                return None
+            partition = _Partition(path, self.dtype, self.mmap, self.exact_threshold)
+            vector_partition_opens.labels(result="opened").inc()
+            self._partitions[name] = partition
+            while len(self._partitions) > self.cache_size:
+                self._partitions.popitem(last=False)
+            vector_partitions_open.set(len(self._partitions))
+            return partition
+
+    @staticmethod
+    def _split_filter(where: Optional[dict]):
+        if not where or "session_id" not in where:
+            raise ValueError("Consultas ao vectorstore precisam de session_id.")
+        rest = {k: v for k, v in where.items() if k != "session_id"}
+        return where["session_id"], rest
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs
+    ) -> List[Document]:
+        session_id, rest = self._split_filter(filter)
+        partition = self._partition(session_id, create=False)
+        if partition is None or not partition.count:
+            return []
+        vector = self.embedding_function.embed_query(query)
+        return [
+            Document(page_content=text, metadata=metadata, id=record_id)
+            for text, metadata, record_id in partition.search(vector, k, rest)
+        ]
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        """Embute o lote de uma vez e grava um bloco contíguo por sessão."""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(
+            self.embedding_function.embed_documents(texts), dtype=np.float32
+        )
+        groups = OrderedDict()
+        for row, metadata in enumerate(metadatas):
+            groups.setdefault(metadata.get("session_id", DEFAULT_SESSION), []).append(
+                row
+            )
+
+        ids = []
+        for session_id, rows in groups.items():
+            ids.extend(
+                self._partition(session_id).add(
+                    [texts[i] for i in rows],
+                    vectors[rows],
+                    [metadatas[i] for i in rows],
+                )
+            )
+        return ids
+
+    def get(
+        self,
+        where: Optional[dict] = None,
+        include=None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        **kwargs,
+    ) -> dict:
+        session_id, rest = self._split_filter(where)
+        partition = self._partition(session_id, create=False)
+        result = {"ids": [], "documents": [], "metadatas": []}
+        if partition is None:
+            return result
+        with partition._lock:
+            records = list(zip(partition.ids, partition.documents, partition.metadatas))
+        matched = [r for r in records if _matches(r[2], rest)]
+        end = None if limit is None else offset + limit
+        for record_id, text, metadata in matched[offset:end]:
+            result["ids"].append(record_id)
+            result["documents"].append(text)
+            result["metadatas"].append(metadata)
+        return result
+
+    def count(self, session_id: str) -> int:
+        partition = self._partition(session_id, create=False)
+        return 0 if partition is None else partition.count
+
+    def embeddings(self, session_id: str, ids) -> List[Optional[np.ndarray]]:
+        """Vetores já gravados dos ids da sessão (evita recalcular embeddings)."""
+        partition = self._partition(session_id, create=False)
+        if partition is None:
+            return [None] * len(ids)
+        return partition.vectors_for(ids)
+
+    def delete_session(self, session_id: str):
+        """Apaga todos os vetores da sessão."""
+        name = self.partition_name(session_id)
+        with self._lock:
+            self._partitions.pop(name, None)
+            vector_partitions_open.set(len(self._partitions))
+        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # Manutenção (retenção e compactação)
+    # ------------------------------------------------------------------
+
+    def partition_names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        names = set()
+        for entry in os.listdir(self.directory):
+            if entry.startswith("polaris_"):
+                names.add(entry.split(".")[0])
+        return sorted(names)
+
+    def partition_records(self, name: str) -> dict:
+        partition = self._open(name, create=False)
+        if partition is None:
+            return {"ids": [], "metadatas": []}
+        with partition._lock:
+            return {"ids": list(partition.ids), "metadatas": list(partition.metadatas)}
+
+    def delete_records(self, name: str, ids: List[str]):
+        partition = self._open(name, create=False)
+        if partition is not None and ids:
+            partition.remove(ids)
+
+    def compact_partition(self, name: str):
+        """remove() já reescreve os arquivos; aqui só descarta o índice IVF."""
+        partition = self._open(name, create=False)
+        if partition is not None:
+            with partition._lock:
+                partition.index = None
+
+    def migrate_legacy(self, *args, **kwargs) -> int:
+        """Sem coleção global para migrar: o backend NumPy começa vazio."""
+        return 0
@@ -0,0 +1,182 @@
+import os
+import time
+import uuid
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from fastapi import UploadFile
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from polaris_logger import log_info, log_success, estimate_tokens
+from polaris_metrics import pdf_pages_ingested, pdf_chunks_ingested, pdf_ingest_duration
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "temp_uploads")
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", 1024 * 1024))
+# MiniLM trunca em 256 wordpieces; a estimativa (~4 chars/token) deixa folga
+PDF_CHUNK_TOKENS = int(os.getenv("PDF_CHUNK_TOKENS", 200))
+PDF_CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", 30))
+PDF_EMBED_BATCH = int(os.getenv("PDF_EMBED_BATCH", 128))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 16))
+
+
+async def save_upload(file: UploadFile, directory: str = UPLOAD_DIR) -> str:
+    """Grava o upload em disco em pedaços, sem carregar o arquivo inteiro na memória."""
+    os.makedirs(directory, exist_ok=True)
+    # Prefixo único: uploads simultâneos com o mesmo nome não se sobrescrevem
+    filename = os.path.basename(file.filename or "upload.pdf")
+    path = os.path.join(directory, f"{uuid.uuid4().hex}_{filename}")
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            f.write(chunk)
+    return path
+
+
+def make_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=PDF_CHUNK_TOKENS,
+        chunk_overlap=PDF_CHUNK_OVERLAP,
+        length_function=estimate_tokens,
+    )
+
+
+def count_pages(path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(path) as doc:
+        return doc.page_count
+
+
+def extract_page_range(path: str, start: int, stop: int) -> List[Tuple[str, int]]:
+    """Extrai e divide as páginas [start, stop); roda num processo do pool.
+
+    Devolve só texto, então o resultado é barato de serializar de volta.
+    """
+    import pymupdf
+
+    splitter = make_splitter()
+    chunks = []
+    with pymupdf.open(path) as doc:
+        for number in range(start, stop):
+            for text in splitter.split_text(doc[number].get_text()):
+                chunks.append((text, number))
+    return chunks
+
+
+def _page_ranges(pages: int, per_task: int):
+    return [
+        (start, min(start + per_task, pages)) for start in range(0, pages, per_task)
+    ]
+
+
+def _extract_in_order(
+    path, ranges, executor, window
+) -> Iterator[List[Tuple[str, int]]]:
+    """Resultados por faixa de páginas, na ordem, com no máximo `window` em voo."""
+    if executor is None:
+        for start, stop in ranges:
+            yield extract_page_range(path, start, stop)
+        return
+
+    pending = deque()
+    try:
+        for start, stop in ranges:
+            pending.append(executor.submit(extract_page_range, path, start, stop))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def ingest_pdf(
+    path: str,
+    session_id: str,
+    store,
+    prepare_text: Callable[[str], str] = lambda text: text,
+    batch_size: int = PDF_EMBED_BATCH,
+    source: Optional[str] = None,
+    executor=None,
+    window: int = 4,
+    progress: Optional[Callable[[int, int], None]] = None,
+    pages: Optional[int] = None,
+    index=None,
+    file_digest: Optional[str] = None,
+) -> int:
+    """Indexa o PDF em lotes: um embed_documents + uma escrita no Chroma por lote.
+
+    A extração roda em faixas de PDF_PAGES_PER_TASK páginas (no `executor`,
+    se houver) enquanto este processo embute e grava. A memória fica
+    limitada a `window` faixas + um lote. `progress(páginas, trechos)` é
+    chamado a cada avanço. Retorna quantos trechos foram gravados.
+
+    Com um `index` (ContentIndex), trechos que a sessão já tem são pulados
+    antes do embedding. `file_digest` vai só nos metadados do último lote:
+    ele marca o arquivo como indexado por completo. Por isso um lote só é
+    gravado quando já existe o próximo trecho novo; o último trecho nunca
+    sai sem o digest, mesmo com trechos múltiplos de `batch_size` ou com
+    duplicatas no final do arquivo.
+    """
+    start = time.time()
+    source = source or os.path.basename(path)
+    texts, metadatas = [], []
+    total = 0
+    skipped = 0
+
+    def flush(last=False):
+        nonlocal texts, metadatas, total
+        size = len(texts) if last else batch_size
+        batch, batch_metadatas = texts[:size], metadatas[:size]
+        if last and file_digest:
+            for metadata in batch_metadatas:
+                metadata["file_hash"] = file_digest
+        store.add_texts(texts=batch, metadatas=batch_metadatas)
+        total += len(batch)
+        pdf_chunks_ingested.inc(len(batch))
+        if progress:
+            progress(0, len(batch))
+        log_info(f"📚 {total} trechos do PDF indexados...", session_id=session_id)
+        texts, metadatas = texts[size:], metadatas[size:]
+
+    if pages is None:
+        pages = count_pages(path)
+    ranges = _page_ranges(pages, PDF_PAGES_PER_TASK)
+    for (first, last), chunks in zip(
+        ranges, _extract_in_order(path, ranges, executor, window)
+    ):
+        for text, page in chunks:
+            text = prepare_text(text)
+            metadata = {
+                "session_id": session_id,
+                "source": source,
+                "page": page,
+                "kind": "document",
+                "created_at": start,
+            }
+            if index is not None:
+                hashes = index.claim(session_id, text, kind="pdf_chunk")
+                if hashes is None:
+                    skipped += 1
+                    continue
+                metadata.update(hashes)
+            texts.append(text)
+            metadatas.append(metadata)
+            if len(texts) > batch_size:
+                flush()
+        pdf_pages_ingested.inc(last - first)
+        if progress:
+            progress(last - first, 0)
+    if texts:
+        flush(last=True)
+
+    duration = time.time() - start
+    pdf_ingest_duration.observe(duration)
+    log_success(
+        f"📖 PDF indexado: {total} trechos ({skipped} duplicados ignorados)",
+        session_id=session_id,
+        duration=duration,
+    )
+    return total
@@ -0,0 +1,67 @@
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from polaris_logger import log_warning, log_error
+
+CONTEXT_SOURCE_TIMEOUT = float(os.getenv("CONTEXT_SOURCE_TIMEOUT", 2.0))
+
+
+class ContextSource:
+    """Fonte de contexto com prazo próprio.
+
+    Funções bloqueantes rodam fora do event loop (numa thread); funções
+    `async` (ex.: driver assíncrono do Mongo) são aguardadas direto.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        default: Any = None,
+    ):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.timeout = CONTEXT_SOURCE_TIMEOUT if timeout is None else timeout
+        self.default = default
+
+
+async def _run_source(source: ContextSource, session_id: Optional[str]):
+    start = time.time()
+    try:
+        if inspect.iscoroutinefunction(source.func):
+            call = source.func(*source.args)
+        else:
+            call = asyncio.to_thread(source.func, *source.args)
+        return await asyncio.wait_for(call, timeout=source.timeout)
+    except asyncio.TimeoutError:
+        log_warning(
+            f"⏱️ Fonte de contexto '{source.name}' excedeu {source.timeout:.2f}s, seguindo sem ela.",
+            session_id=session_id,
+            duration=time.time() - start,
+        )
+    except Exception as e:
+        log_error(
+            f"Erro na fonte de contexto '{source.name}': {e}", session_id=session_id
+        )
+    return source.default
+
+
+async def gather_context(
+    sources: List[ContextSource], session_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """Executa todas as fontes em paralelo e devolve {nome: resultado}.
+
+    Cada fonte respeita o próprio prazo; em caso de timeout ou erro o valor
+    padrão da fonte é usado, então o tempo total fica limitado pela fonte
+    mais lenta (ou pelo maior prazo), nunca pela soma delas.
+    """
+    results = await asyncio.gather(
+        *(_run_source(source, session_id) for source in sources)
+    )
+    return {source.name: result for source, result in zip(sources, results)}
@@ -2,8 +2,9 @@ import time
 import logging
 import requests
 import asyncio
+import inspect
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Body
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Depends, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi import UploadFile, File, Form
 from fastapi.responses import StreamingResponse
@@ -11,11 +12,7 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from pydantic import BaseModel
 from typing import Optional, Dict
-from langchain_chroma import Chroma
-from langchain_classic.memory.buffer import ConversationBufferMemory
-from langchain_community.chat_message_histories import ChatMessageHistory
 from langchain_huggingface import HuggingFaceEmbeddings
-from pymongo import MongoClient
 import uvicorn
 import os
 from colorama import Fore, Style, init
@@ -29,12 +26,33 @@ from polaris_logger import (
     log_prompt,
 )
 from auth import jwt_auth, log_auth_attempt
-from prometheus_client import (
-    CollectorRegistry,
-    Gauge,
-    Counter,
-    Summary,
-    push_to_gateway,
+from polaris_context import ContextSource, gather_context, CONTEXT_SOURCE_TIMEOUT
+from embedding_cache import CachedEmbeddings
+from session_vectorstore import SessionVectorStore
+from numpy_vectorstore import NumpyVectorStore
+from retrieval import HybridRetriever
+from retention import RetentionEngine
+from session_store import (
+    SessionStore,
+    SQLiteSessionStore,
+    RedisSessionStore,
+    Message,
+    USER,
+    ASSISTANT,
+)
+from vector_writer import VectorWriter
+from content_index import ContentIndex, FileDigestStore, DEDUP_ENABLED
+from mongo_memory import MongoMemory, AsyncMongoMemory, open_client
+from resilience import CircuitBreaker, CircuitOpenError, llm_is_failure
+from pdf_ingest import save_upload
+from ingest_jobs import IngestJobManager
+from prometheus_client import push_to_gateway
+from polaris_metrics import (
+    registry,
+    inference_duration,
+    inference_total,
+    inference_failures,
+    inference_cancelled,
 )
 
 init(autoreset=True)
@@ -51,35 +69,11 @@ LOGO = f"""
  {STAR_COLOR}*{Style.RESET_ALL}      .     .      .     
      .     .        .    *    
 """
-print(LOGO)
 
 # Mapa temporário em memória para respostas pendentes por sessão
 resposta_pendente_por_sessao = {}
 
 
-registry = CollectorRegistry()
-
-inference_duration = Summary(
-    "inference_duration_seconds",
-    "Tempo de resposta da inferência em segundos",
-    ["session_id"],
-    registry=registry,
-)
-
-inference_total = Counter(
-    "inference_total",
-    "Número total de inferências processadas",
-    ["session_id"],
-    registry=registry,
-)
-
-inference_failures = Counter(
-    "inference_failures_total",
-    "Número total de falhas de inferência",
-    ["session_id"],
-    registry=registry,
-)
-
 # Logging configurado centralmente em polaris_logger.py
 # Silencia loggers de terceiros que poluem o output
 logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -90,7 +84,9 @@ logging.getLogger("sentence_transformers").setLevel(logging.WARNING)
 load_dotenv()
 
 CACHED_PROMPT = None
+CACHED_PROMPT_MTIME = None
 CACHED_KEYWORDS = None
+PRIMED_PREFIX = None
 
 USE_LOCAL_LLM = os.getenv("USE_LOCAL_LLM", "False").lower() == "true"
 
@@ -114,31 +110,103 @@ SEED = int(os.getenv("SEED", 42))
 MONGO_URI = os.getenv("MONGO_URI")
 
 USE_MONGODB = os.getenv("USE_MONGODB", "false").lower() == "true"
+# Driver assíncrono: consultas ao Mongo não bloqueiam o event loop
+MONGODB_ASYNC = os.getenv("MONGODB_ASYNC", "true").lower() == "true"
+
+VECTORSTORE_TIMEOUT = float(os.getenv("VECTORSTORE_TIMEOUT", CONTEXT_SOURCE_TIMEOUT))
+MONGODB_TIMEOUT = float(os.getenv("MONGODB_TIMEOUT", CONTEXT_SOURCE_TIMEOUT))
+# Prazo de cada chamada protegida pelo circuit breaker (abaixo do prazo da fonte
+# de contexto, para que o estouro conte como falha da dependência)
+MONGODB_CALL_TIMEOUT = float(os.getenv("MONGODB_CALL_TIMEOUT", 1.5))
+VECTORSTORE_CALL_TIMEOUT = float(os.getenv("VECTORSTORE_CALL_TIMEOUT", 1.5))
+# Intervalo (s) entre checagens de desconexão do cliente durante o streaming
+STREAM_DISCONNECT_CHECK_INTERVAL = float(
+    os.getenv("STREAM_DISCONNECT_CHECK_INTERVAL", 0.25)
+)
 
 USE_PUSHGATEWAY = os.getenv("USE_PUSHGATEWAY", "false").lower() == "true"
 PUSHGATEWAY_URL = os.getenv("PUSHGATEWAY_URL", "http://10.10.10.20:9091")
 
 
-if USE_MONGODB:
-    try:
-        client = MongoClient(MONGO_URI)
-        db = client["polaris_db"]
-        collection = db["user_memory"]
-        log_success("🔌 Conectado ao MongoDB com sucesso.")
-    except Exception as e:
-        log_error(f"❌ Erro ao conectar ao MongoDB: {str(e)}")
-        USE_MONGODB = False
-else:
-    log_warning("⛔ Uso do MongoDB desativado por configuração.")
+# Conversa recente por sessão: SQLite (sobrevive a restarts e é visto por
+# todos os workers), Redis (vários hosts) ou só memória do processo
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "./session_db/sessions.sqlite3")
 
-memory_store = {}
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Uma partição por sessão: a busca só percorre os vetores do próprio usuário
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+VECTORSTORE_ENABLED = True
 
-log_info("Configurando memória do LangChain...")
 
-embedder = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-vectorstore = Chroma(persist_directory="./chroma_db", embedding_function=embedder)
-VECTORSTORE_ENABLED = True
-log_success("✅ VectorStore configurado com sucesso!")
+def init_services():
+    """Abre as dependências do serviço (Mongo, sessões, embeddings, vectorstore, LLM).
+
+    Fica numa função para não rodar no import: os workers de extração de
+    PDF (spawn) reimportam este arquivo como __mp_main__ e não podem abrir
+    outro cliente do Chroma no mesmo diretório nem carregar modelos.
+    """
+    global USE_MONGODB, client, db, collection, mongo_memory, memory_store
+    global embedder, vectorstore, retriever, content_index, vector_writer
+    global ingest_jobs, retention, llm, scheduler
+
+    print(LOGO)
+
+    if USE_MONGODB:
+        try:
+            # Cliente único do worker (pool compartilhado, inclusive pelo /health)
+            client = open_client(MONGO_URI, async_driver=MONGODB_ASYNC)
+            db = client["polaris_db"]
+            collection = db["user_memory"]
+            memory_class = AsyncMongoMemory if MONGODB_ASYNC else MongoMemory
+            mongo_memory = memory_class(collection, history=MONGODB_HISTORY)
+            log_success("🔌 Conectado ao MongoDB com sucesso.")
+        except Exception as e:
+            log_error(f"❌ Erro ao conectar ao MongoDB: {str(e)}")
+            USE_MONGODB = False
+    else:
+        log_warning("⛔ Uso do MongoDB desativado por configuração.")
+
+    if SESSION_BACKEND == "redis":
+        memory_store = RedisSessionStore(history=LANGCHAIN_HISTORY)
+    elif SESSION_BACKEND == "sqlite":
+        memory_store = SQLiteSessionStore(SESSION_DB_PATH, history=LANGCHAIN_HISTORY)
+    else:
+        memory_store = SessionStore(history=LANGCHAIN_HISTORY)
+    log_info(f"💬 Memória de sessões: backend '{SESSION_BACKEND}'.")
+
+    log_info("Configurando memória do LangChain...")
+
+    # Cache por hash do texto: busca e ingestão não recalculam o mesmo embedding
+    embedder = CachedEmbeddings(
+        HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL), namespace=EMBEDDING_MODEL
+    )
+    if VECTOR_BACKEND == "numpy":
+        vectorstore = NumpyVectorStore("./vector_db", embedding_function=embedder)
+    else:
+        vectorstore = SessionVectorStore("./chroma_db", embedding_function=embedder)
+    # Vetorial + BM25, rerank, MMR e corte por relevância antes de entrar no prompt
+    retriever = HybridRetriever(lambda: vectorstore, embedder)
+    # Hashes do que cada sessão já tem no Chroma: reenvios não são reindexados
+    content_index = (
+        ContentIndex(lambda: vectorstore, digests=FileDigestStore())
+        if DEDUP_ENABLED
+        else None
+    )
+    # Inserções do caminho da resposta são gravadas em lote por uma thread
+    vector_writer = VectorWriter(lambda: vectorstore, index=content_index)
+    # Indexação de PDFs em segundo plano (extração num pool de processos)
+    ingest_jobs = IngestJobManager(lambda: vectorstore, index=content_index)
+    # Expira respostas antigas e compacta partições em segundo plano
+    retention = RetentionEngine(
+        lambda: vectorstore,
+        on_change=[retriever.forget]
+        + ([content_index.forget] if content_index is not None else []),
+    )
+    log_success("✅ VectorStore configurado com sucesso!")
+
+    llm = load_llm()
+    scheduler = load_scheduler()
 
 
 def injetar_session_id(texto: str, session_id: str) -> str:
@@ -148,13 +216,64 @@ def injetar_session_id(texto: str, session_id: str) -> str:
     return f"[session_id={session_id}]\n{texto.strip()}"
 
 
-from llm_loader import load_llm
+def response_metadata(session_id: str) -> dict:
+    """Metadados de resposta salva automaticamente (sujeita à retenção)."""
+    return {"session_id": session_id, "kind": "response", "created_at": time.time()}
+
+
+from llm_loader import load_llm, load_scheduler
+
+# O processo do serviço (python polaris_main.py ou import pelo uvicorn/testes)
+# sobe as dependências; um worker do pool de PDFs só precisa das funções
+if __name__ != "__mp_main__":
+    init_services()
+
+# Dependência fora do ar: depois de algumas falhas seguidas o circuito abre e
+# as chamadas são puladas na hora, até uma chamada de teste voltar a passar
+mongo_breaker = CircuitBreaker("mongodb", timeout=MONGODB_CALL_TIMEOUT)
+vector_breaker = CircuitBreaker("vectorstore", timeout=VECTORSTORE_CALL_TIMEOUT)
+llm_breaker = CircuitBreaker("llm", is_failure=llm_is_failure)
+
+
+def has_async_backend():
+    """Backends com cliente assíncrono nativo (Groq) dispensam thread do executor."""
+    return inspect.isasyncgenfunction(getattr(llm, "astream_chunks", None))
+
 
-llm = load_llm()
+LLM_UNAVAILABLE = (
+    "Polaris está temporariamente indisponível. Tente novamente em instantes."
+)
+
+
+async def call_llm(func, *args):
+    """Chama o scheduler pelo circuit breaker do LLM (aberto → 503 na hora)."""
+    try:
+        return await llm_breaker.call(func, *args)
+    except CircuitOpenError:
+        raise HTTPException(status_code=503, detail=LLM_UNAVAILABLE)
+
+
+async def generate_response(prompt, session_id=None):
+    """Gera a resposta completa dentro de um slot do scheduler."""
+    if has_async_backend():
+        return await call_llm(scheduler.run_async, llm.ainvoke, prompt, session_id)
+    return await call_llm(scheduler.run, llm.invoke, prompt, session_id)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global PRIMED_PREFIX
+    if USE_MONGODB:
+        try:
+            await call_mongo(mongo_memory.ensure_indexes)
+        except Exception as e:
+            log_error(f"Erro ao criar os índices do MongoDB: {str(e)}")
+    # Coleção global antiga -> coleções por sessão (no-op depois da primeira vez)
+    try:
+        await asyncio.to_thread(vectorstore.migrate_legacy)
+    except Exception as e:
+        log_error(f"Erro ao migrar o ChromaDB para coleções por sessão: {str(e)}")
+    retention.start()
     llm.load()
     # Warmup
     try:
@@ -171,8 +290,27 @@ Responda apenas 'ok'.
         )
     except Exception as e:
         log_error(f"Erro no warmup: {str(e)}")
+    # Pré-avalia o prefixo de sistema comum a todas as requisições
+    try:
+        PRIMED_PREFIX = build_system_prefix()
+        llm.prime_prefix(PRIMED_PREFIX)
+    except Exception as e:
+        log_error(f"Erro ao pré-avaliar o prefixo de sistema: {str(e)}")
     yield
     llm.close()
+    if USE_MONGODB:
+        closing = client.close()
+        if inspect.isawaitable(closing):
+            await closing
+    ingest_jobs.close()
+    retention.stop(timeout=5)
+    await asyncio.to_thread(vector_writer.close)
+    await asyncio.to_thread(memory_store.close)
+    if content_index is not None:
+        content_index.digests.close()
+    embedder.close()
+    if inspect.iscoroutinefunction(getattr(llm, "aclose", None)):
+        await llm.aclose()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -183,114 +321,98 @@ class InferenceRequest(BaseModel):
     session_id: Optional[str] = "default_session"
 
 
-def get_memories(session_id):
+async def call_mongo(func, *args):
+    """Driver assíncrono é aguardado direto; o síncrono roda numa thread."""
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    return await asyncio.to_thread(func, *args)
+
+
+async def get_memories(session_id):
     if not USE_MONGODB:
         return []
     try:
-        memories = (
-            collection.find({"session_id": session_id})
-            .sort("timestamp", -1)
-            .limit(MONGODB_HISTORY)
-        )
-        texts = [mem["text"] for mem in memories]
+        texts = await mongo_breaker.call(mongo_memory.recent, session_id)
         log_info(
             f"📌 Recuperadas {len(texts)} memórias do MongoDB para sessão {session_id}."
         )
         return texts
+    except CircuitOpenError:
+        return []
     except Exception as e:
         log_error(f"Erro ao buscar memórias no MongoDB: {str(e)}")
         return []
 
 
 def get_recent_memories(session_id):
-    if session_id not in memory_store:
-        memory_store[session_id] = ConversationBufferMemory(
-            chat_memory=ChatMessageHistory(), return_messages=True
-        )
-
-    history = memory_store[session_id].load_memory_variables({})["history"]
-
-    if not isinstance(history, list):
-        return []
+    history = memory_store.messages(session_id)
 
     recent_memories = "\n".join(
         [
             (
                 f"Usuário: {msg.content}"
-                if isinstance(msg, HumanMessage)
+                if msg.role == USER
                 else f"Polaris: {msg.content}"
             )
             for msg in history
         ]
     )
 
-    log_info(
-        f"📌 Recuperadas {len(history)} mensagens da memória temporária do LangChain."
-    )
+    log_info(f"📌 Recuperadas {len(history)} mensagens da memória temporária.")
     return recent_memories
 
 
 async def save_to_langchain_memory(user_input, response, session_id):
     try:
-        if session_id not in memory_store:
-            memory_store[session_id] = ConversationBufferMemory(
-                chat_memory=ChatMessageHistory(), return_messages=True
-            )
-
-        memory_store[session_id].save_context(
-            {"input": user_input}, {"output": response}
+        # O ring buffer da sessão já descarta as mensagens mais antigas (FIFO)
+        await asyncio.to_thread(
+            memory_store.save_turn, session_id, user_input, response
         )
-        # history = memory_store[session_id].load_memory_variables({})["history"]
-
-        # if len(history) > LANGCHAIN_HISTORY:
-        #    log_warning(f"🧹 Memória cheia para sessão '{session_id}', compactando...")
+        # if len(memory_store.messages(session_id)) >= LANGCHAIN_HISTORY:
         #    await trim_langchain_memory(session_id)
 
-        trim_langchain_memory_fifo(session_id)
-
-        log_success(
-            f"✅ Memória temporária do LangChain atualizada para sessão '{session_id}'!"
-        )
+        log_success(f"✅ Memória temporária atualizada para sessão '{session_id}'!")
 
     except Exception as e:
-        log_error(f"Erro ao salvar na memória temporária do LangChain: {str(e)}")
+        log_error(f"Erro ao salvar na memória temporária: {str(e)}")
 
 
-def save_to_mongo(user_input, session_id):
+async def save_to_mongo(user_input, session_id):
+    """Grava a memória; devolve True só se ela foi inserida agora."""
     if not USE_MONGODB:
-        return
+        return False
     try:
-        existing_entry = collection.find_one(
-            {"text": user_input, "session_id": session_id}
-        )
-        if existing_entry:
+        # Upsert por (session_id, text_hash): deduplica sem um find_one antes
+        if not await mongo_breaker.call(mongo_memory.save, session_id, user_input):
             log_warning(
                 f"Entrada duplicada detectada para sessão {session_id}, não será salva: {user_input}"
             )
-            return
-
-        doc = {
-            "text": user_input,
-            "session_id": session_id,
-            "timestamp": datetime.utcnow(),
-        }
-        result = collection.insert_one(doc)
-        if result.inserted_id:
-            log_success(
-                f"Informação armazenada no MongoDB para sessão {session_id}: {user_input}"
-            )
+            return False
+        log_success(
+            f"Informação armazenada no MongoDB para sessão {session_id}: {user_input}"
+        )
+        return True
 
+    except CircuitOpenError:
+        log_warning(f"⛔ MongoDB indisponível, memória da sessão {session_id} não salva.")
     except Exception as e:
         log_error(f"Erro ao salvar no MongoDB: {str(e)}")
+    return False
 
 
 def load_prompt_from_file(file_path="polaris_prompt.txt"):
-    global CACHED_PROMPT
-    if CACHED_PROMPT:
+    global CACHED_PROMPT, CACHED_PROMPT_MTIME
+    try:
+        mtime = os.path.getmtime(file_path)
+    except OSError:
+        mtime = None
+    # Relê o arquivo só quando ele muda em disco
+    if CACHED_PROMPT and mtime == CACHED_PROMPT_MTIME:
         return CACHED_PROMPT
     try:
         with open(file_path, "r", encoding="utf-8") as file:
             CACHED_PROMPT = file.read().strip()
+            CACHED_PROMPT_MTIME = mtime
             return CACHED_PROMPT
     except FileNotFoundError:
         log_warning(f"Arquivo {file_path} não encontrado! Usando prompt padrão.")
@@ -318,48 +440,27 @@ def load_keywords_from_file(file_path="polaris_keywords.txt"):
         return CACHED_KEYWORDS
 
 
-def trim_langchain_memory_fifo(session_id):
-    """Mantém apenas as últimas N mensagens na memória do LangChain."""
-
-    if session_id not in memory_store:
-        return
-
-    memory = memory_store[session_id]
-    history = memory.chat_memory.messages
-
-    if len(history) <= LANGCHAIN_HISTORY:
-        return
-
-    excesso = len(history) - LANGCHAIN_HISTORY
-    memory.chat_memory.messages = history[excesso:]
-
-    log_success(f"✅ FIFO aplicado na sessão '{session_id}', memória enxugada.")
-
-
 async def trim_langchain_memory(session_id):
-    """Compacta a memória do LangChain resumindo mensagens antigas."""
-
-    if session_id not in memory_store:
-        return
+    """Compacta a memória da sessão resumindo as mensagens antigas."""
 
-    memory = memory_store[session_id]
-    history = memory.load_memory_variables({})["history"]
+    history = memory_store.messages(session_id)
+    recentes = LANGCHAIN_HISTORY // 2
 
-    # Se não ultrapassou o limite, não faz nada
-    if len(history) <= LANGCHAIN_HISTORY:
+    # Só resume quando o ring buffer está cheio
+    if len(history) < LANGCHAIN_HISTORY:
         return
 
     try:
         log_warning(
-            f"✂️ Iniciando compactação da memória LangChain da sessão '{session_id}'..."
+            f"✂️ Iniciando compactação da memória da sessão '{session_id}'..."
         )
 
         # Junta todas as mensagens antigas em um único texto
         textos_antigos = []
-        for msg in history[:-LANGCHAIN_HISTORY]:  # pega tudo, exceto as mais recentes
-            if isinstance(msg, HumanMessage):
+        for msg in history[:-recentes]:  # pega tudo, exceto as mais recentes
+            if msg.role == USER:
                 textos_antigos.append(f"Usuário: {msg.content}")
-            elif isinstance(msg, AIMessage):
+            else:
                 textos_antigos.append(f"Polaris: {msg.content}")
 
         bloco_antigo = "\n".join(textos_antigos)
@@ -375,66 +476,98 @@ Resumo:"""
         # Gera o resumo usando a própria Polaris
         resumo = llm.invoke(prompt_resumo)
 
-        # Remove todas as mensagens antigas
-        memory.chat_memory.messages = memory.chat_memory.messages[-LANGCHAIN_HISTORY:]
-
-        # Insere o resumo como nova memória
-        memory.chat_memory.add_user_message("Resumo da conversa anterior:")
-        memory.chat_memory.add_ai_message(resumo.strip())
+        # Resumo como nova memória + as mensagens mais recentes
+        memory_store.replace(
+            session_id,
+            [
+                Message(USER, "Resumo da conversa anterior:"),
+                Message(ASSISTANT, resumo.strip()),
+            ]
+            + history[-recentes:],
+        )
 
         log_success(f"✅ Memória da sessão '{session_id}' compactada com sucesso!")
 
     except Exception as e:
-        log_error(f"Erro ao resumir a memória do LangChain: {str(e)}")
+        log_error(f"Erro ao resumir a memória da sessão: {str(e)}")
 
 
-from langchain_core.messages import HumanMessage, AIMessage
+def search_documents(user_prompt, session_id):
+    """Busca trechos relevantes da sessão no vectorstore."""
+    if not VECTORSTORE_ENABLED:
+        log_info("📚 VectorStore desabilitado - pulando busca de documentos.")
+        return ""
 
+    try:
+        retrieved_docs = vector_breaker.call_sync(
+            retriever.search, user_prompt, session_id
+        )
+    except CircuitOpenError:
+        return ""
+    docs_context = "\n".join([doc.page_content for doc in retrieved_docs])
+    if not docs_context:
+        log_info("📚 Nenhum documento relevante encontrado no vectorstore.")
+        return ""
 
-@app.post("/inference/")
-async def inference(
-    prompt: str = Body(...),
-    session_id: str = Body("default_session"),
-    current_user: Optional[Dict] = None,
-):
-    user_prompt = injetar_session_id(prompt, session_id)
-    start_time = time.time()
+    log_info(f"📚 {len(retrieved_docs)} trechos relevantes encontrados no vectorstore.")
+    return f"📚 Conteúdo relevante dos documentos:\n{docs_context}\n\n"
 
-    log_info(f"📥 Nova solicitação de inferência", session_id=session_id)
 
-    inference_total.labels(session_id=session_id).inc()
-    erro = False
+def build_system_prefix():
+    """Início fixo de todo prompt: cabeçalho de sistema + instruções do arquivo."""
+    prompt_instrucoes = load_prompt_from_file()
+    return f"<|start_header_id|>system<|end_header_id|>\n{prompt_instrucoes}\n\n"
 
-    keywords = load_keywords_from_file()
 
-    if any(kw in user_prompt.lower() for kw in keywords):
-        save_to_mongo(user_prompt, session_id)
+async def refresh_prefix_cache(system_prefix):
+    """Recalcula o snapshot do prefixo no backend quando o prompt muda em disco."""
+    global PRIMED_PREFIX
+    PRIMED_PREFIX = system_prefix
+    log_info("🧊 Prompt de sistema alterado, recalculando prefixo em cache...")
+    try:
+        await asyncio.to_thread(llm.prime_prefix, system_prefix)
+    except Exception as e:
+        log_error(f"Erro ao pré-avaliar o prefixo de sistema: {str(e)}")
+
+
+async def build_full_prompt(user_prompt, session_id):
+    """Monta o prompt completo buscando documentos e memórias em paralelo."""
+    sources = [
+        ContextSource(
+            "docs",
+            search_documents,
+            user_prompt,
+            session_id,
+            timeout=VECTORSTORE_TIMEOUT,
+            default="",
+        ),
+        ContextSource(
+            "mongo", get_memories, session_id, timeout=MONGODB_TIMEOUT, default=[]
+        ),
+        ContextSource("recent", get_recent_memories, session_id, default=""),
+    ]
 
-    docs_context = ""
-    if VECTORSTORE_ENABLED:
-        try:
-            retrieved_docs = vectorstore.similarity_search(
-                user_prompt, k=3, filter={"session_id": session_id}
+    keywords = load_keywords_from_file()
+    if any(kw in user_prompt.lower() for kw in keywords):
+        sources.append(
+            ContextSource(
+                "save_mongo",
+                save_to_mongo,
+                user_prompt,
+                session_id,
+                timeout=MONGODB_TIMEOUT,
+                default=False,
             )
-            docs_context = "\n".join([doc.page_content for doc in retrieved_docs])
-            if docs_context:
-                log_info(
-                    f"📚 {len(retrieved_docs)} trechos relevantes encontrados no vectorstore."
-                )
-                docs_context = (
-                    f"📚 Conteúdo relevante dos documentos:\n{docs_context}\n\n"
-                )
-            else:
-                docs_context = ""
-                log_info("📚 Nenhum documento relevante encontrado no vectorstore.")
-        except Exception as e:
-            log_error(f"Erro ao buscar no vectorstore: {e}")
-            docs_context = ""
-    else:
-        log_info("📚 VectorStore desabilitado - pulando busca de documentos.")
+        )
 
-    mongo_memories = get_memories(session_id)
-    recent_memories = get_recent_memories(session_id)
+    results = await gather_context(sources, session_id=session_id)
+    docs_context = results["docs"]
+    mongo_memories = results["mongo"]
+    recent_memories = results["recent"]
+    # A gravação corre junto com a leitura, que pode não tê-la visto: o
+    # fato que o usuário acabou de pedir para guardar já entra neste turno
+    if results.get("save_mongo") and user_prompt not in mongo_memories:
+        mongo_memories = ([user_prompt] + mongo_memories)[:MONGODB_HISTORY]
 
     context_pieces = []
     if mongo_memories:
@@ -444,13 +577,15 @@ async def inference(
 
     context = "\n".join(context_pieces)
 
-    prompt_instrucoes = load_prompt_from_file()
-
-    full_prompt = f"""<|start_header_id|>system<|end_header_id|>
-{prompt_instrucoes}
+    system_prefix = build_system_prefix()
+    if PRIMED_PREFIX is not None and system_prefix != PRIMED_PREFIX:
+        await refresh_prefix_cache(system_prefix)
 
+    # Ordem do mais estável para o mais volátil: a conversa recente cresce
+    # turno a turno e os documentos mudam a cada pergunta, então o backend
+    # local reaproveita o KV da sessão até o início dos documentos
+    return f"""{system_prefix}{context}
 {docs_context}
-{context}
 
 <|eot_id|>
 <|start_header_id|>user<|end_header_id|>
@@ -458,19 +593,37 @@ async def inference(
 <|start_header_id|>assistant<|end_header_id|>
 """
 
+
+@app.post("/inference/")
+async def inference(
+    prompt: str = Body(...),
+    session_id: str = Body("default_session"),
+    current_user: Optional[Dict] = None,
+):
+    user_prompt = injetar_session_id(prompt, session_id)
+    start_time = time.time()
+
+    log_info(f"📥 Nova solicitação de inferência", session_id=session_id)
+
+    inference_total.labels(session_id=session_id).inc()
+    erro = False
+
+    # Rejeita cedo, antes de gastar Mongo/Chroma, se a fila já está cheia
+    scheduler.check_admission()
+
+    full_prompt = await build_full_prompt(user_prompt, session_id)
+
     log_prompt("📏 Prompt construído para inferência", full_prompt, session_id=session_id)
 
     try:
-        resposta = llm.invoke(full_prompt)
+        resposta = await generate_response(full_prompt, session_id)
         duration = time.time() - start_time
 
         if "shellPolaris" in resposta:
             # ⚡ Salvar como novo prompt no Chroma com session_id
             if VECTORSTORE_ENABLED:
                 comando = injetar_session_id(resposta, session_id)
-                vectorstore.add_texts(
-                    texts=[comando], metadatas=[{"session_id": session_id}]
-                )
+                vector_writer.submit(comando, response_metadata(session_id))
 
             log_info(
                 "🧠 Polaris em modo executivo — aguardando retorno do comando.",
@@ -487,11 +640,9 @@ async def inference(
         if VECTORSTORE_ENABLED:
             try:
                 resposta_com_id = injetar_session_id(resposta, session_id)
-                vectorstore.add_texts(
-                    texts=[resposta_com_id], metadatas=[{"session_id": session_id}]
-                )
+                vector_writer.submit(resposta_com_id, response_metadata(session_id))
                 log_success(
-                    f"🧠 Resposta registrada no ChromaDB", session_id=session_id
+                    f"🧠 Resposta enfileirada para o ChromaDB", session_id=session_id
                 )
             except Exception as e:
                 log_error(
@@ -501,6 +652,13 @@ async def inference(
         # Log estruturado da inferência bem-sucedida
         log_request(session_id, prompt, resposta, duration, "llama3")
 
+    except HTTPException as e:
+        # Rejeições do scheduler (429/503/504) chegam ao cliente como estão
+        duration = time.time() - start_time
+        inference_failures.labels(session_id=session_id).inc()
+        log_request_error(session_id, prompt, str(e.detail), duration)
+        raise
+
     except Exception as e:
         duration = time.time() - start_time
         erro = True
@@ -526,12 +684,16 @@ async def inference(
 
 @app.post("/inference/stream/")
 async def inference_stream(
+    request: Request,
     prompt: str = Body(...),
     session_id: str = Body("default_session"),
     current_user: Optional[Dict] = Depends(jwt_auth.get_current_user),
 ):
     """Endpoint de streaming usando Server-Sent Events"""
 
+    # Fila saturada: responde 429 antes de abrir o stream
+    scheduler.check_admission()
+
     async def generate():
         try:
             user_prompt = injetar_session_id(prompt, session_id)
@@ -541,96 +703,67 @@ async def inference_stream(
 
             inference_total.labels(session_id=session_id).inc()
 
-            keywords = load_keywords_from_file()
-
-            if any(kw in user_prompt.lower() for kw in keywords):
-                save_to_mongo(user_prompt, session_id)
-
-            # Busca no vectorstore
-            docs_context = ""
-            if VECTORSTORE_ENABLED:
-                try:
-                    retrieved_docs = vectorstore.similarity_search(
-                        user_prompt, k=3, filter={"session_id": session_id}
-                    )
-                    docs_context = "\n".join(
-                        [doc.page_content for doc in retrieved_docs]
-                    )
-                    if docs_context:
-                        log_info(
-                            f"📚 {len(retrieved_docs)} trechos relevantes encontrados no vectorstore."
-                        )
-                        docs_context = (
-                            f"📚 Conteúdo relevante dos documentos:\n{docs_context}\n\n"
-                        )
-                    else:
-                        docs_context = ""
-                except Exception as e:
-                    log_error(f"Erro ao buscar no vectorstore: {e}")
-                    docs_context = ""
-
-            # Memória
-            mongo_memories = get_memories(session_id)
-            recent_memories = get_recent_memories(session_id)
-
-            context_pieces = []
-            if mongo_memories:
-                context_pieces.append(
-                    "Memória do Usuário:\n" + "\n".join(mongo_memories)
-                )
-            if recent_memories:
-                context_pieces.append("Conversa recente:\n" + recent_memories)
-
-            context = "\n".join(context_pieces)
-            prompt_instrucoes = load_prompt_from_file()
-
-            full_prompt = f"""<|start_header_id|>system<|end_header_id|>
-{prompt_instrucoes}
-
-{docs_context}
-{context}
-
-<|eot_id|>
-<|start_header_id|>user<|end_header_id|>
-{user_prompt}<|eot_id|>
-<|start_header_id|>assistant<|end_header_id|>
-"""
+            full_prompt = await build_full_prompt(user_prompt, session_id)
 
             log_prompt("📏 Prompt construído para streaming", full_prompt, session_id=session_id)
 
             yield "data: [START]\n\n"
 
-            # Streaming real: yield cada token conforme chega do Groq
-            # stream_chunks() é síncrono — rodamos em thread pra não bloquear o event loop
-            import queue
-
-            chunk_queue = queue.Queue()
-            SENTINEL = object()
-
-            def _run_sync_stream():
+            # Streaming real: backends assíncronos entregam os tokens direto no
+            # event loop; stream_chunks() síncrono roda numa thread do executor
+            # e a TokenBridge acorda o event loop a cada token.
+            # O circuit breaker só decide quando o stream termina: abrir o
+            # stream não prova que o modelo está gerando
+            try:
+                if not llm_breaker.allow():
+                    raise HTTPException(status_code=503, detail=LLM_UNAVAILABLE)
                 try:
-                    for c in llm.stream_chunks(full_prompt):
-                        chunk_queue.put(c)
+                    if has_async_backend():
+                        bridge = await scheduler.open_async_stream(
+                            lambda: llm.astream_chunks(
+                                full_prompt, session_id=session_id
+                            ),
+                        )
+                    else:
+                        bridge = await scheduler.open_stream(
+                            lambda: llm.stream_chunks(
+                                full_prompt, session_id=session_id
+                            ),
+                        )
+                except asyncio.CancelledError:
+                    llm_breaker.release()
+                    raise
                 except Exception as e:
-                    chunk_queue.put(e)
-                finally:
-                    chunk_queue.put(SENTINEL)
-
-            loop = asyncio.get_event_loop()
-            loop.run_in_executor(None, _run_sync_stream)
+                    llm_breaker.record_error(e)
+                    raise
+            except HTTPException as e:
+                inference_failures.labels(session_id=session_id).inc()
+                log_request_error(
+                    session_id, prompt, str(e.detail), time.time() - start_time
+                )
+                yield f"data: [ERROR] {e.detail}\n\n"
+                yield "data: [DONE]\n\n"
+                return
 
-            resposta_completa = ""
+            partes = []
+            settled = False
+            next_check = time.monotonic() + STREAM_DISCONNECT_CHECK_INTERVAL
             try:
-                while True:
-                    # Espera chunk sem bloquear o event loop
-                    while chunk_queue.empty():
-                        await asyncio.sleep(0.01)
-                    item = chunk_queue.get()
-                    if item is SENTINEL:
-                        break
-                    if isinstance(item, Exception):
-                        raise item
-                    resposta_completa += item
+                async for item in bridge:
+                    # Checar a conexão a cada token custa uma volta no ASGI
+                    now = time.monotonic()
+                    if now >= next_check:
+                        next_check = now + STREAM_DISCONNECT_CHECK_INTERVAL
+                        if await request.is_disconnected():
+                            bridge.close()
+                            inference_cancelled.labels(session_id=session_id).inc()
+                            log_warning(
+                                f"🔌 Cliente desconectou, geração interrompida após {len(partes)} tokens.",
+                                session_id=session_id,
+                                duration=time.time() - start_time,
+                            )
+                            return
+                    partes.append(item)
                     # SSE data lines can't contain raw newlines — encode them
                     safe_item = (
                         item.replace("\r\n", "\\n")
@@ -639,12 +772,14 @@ async def inference_stream(
                     )
                     yield f"data: {safe_item}\n\n"
 
+                llm_breaker.record_success()
+                settled = True
+                resposta_completa = "".join(partes)
+
                 if "shellPolaris" in resposta_completa:
                     if VECTORSTORE_ENABLED:
                         comando = injetar_session_id(resposta_completa, session_id)
-                        vectorstore.add_texts(
-                            texts=[comando], metadatas=[{"session_id": session_id}]
-                        )
+                        vector_writer.submit(comando, response_metadata(session_id))
                     log_info("🧠 Polaris em modo executivo.", session_id=session_id)
                     yield "data: [EXEC_MODE]\n\n"
                     yield "data: [DONE]\n\n"
@@ -658,9 +793,8 @@ async def inference_stream(
                         resposta_com_id = injetar_session_id(
                             resposta_completa, session_id
                         )
-                        vectorstore.add_texts(
-                            texts=[resposta_com_id],
-                            metadatas=[{"session_id": session_id}],
+                        vector_writer.submit(
+                            resposta_com_id, response_metadata(session_id)
                         )
                     except Exception as e:
                         log_error(
@@ -675,12 +809,32 @@ async def inference_stream(
 
                 yield "data: [DONE]\n\n"
 
+            except asyncio.CancelledError:
+                # Starlette cancela o gerador quando o cliente desconecta
+                if not bridge.cancelled:
+                    inference_cancelled.labels(session_id=session_id).inc()
+                    log_warning(
+                        "🔌 Streaming cancelado pelo servidor, interrompendo geração.",
+                        session_id=session_id,
+                    )
+                raise
+
             except Exception as e:
                 duration = time.time() - start_time
+                if not settled:
+                    # ValueError/TypeError do pedido não contam como falha do LLM
+                    llm_breaker.record_error(e)
+                    settled = True
                 log_request_error(session_id, prompt, str(e), duration)
                 yield f"data: [ERROR] {str(e)}\n\n"
                 yield "data: [DONE]\n\n"
 
+            finally:
+                bridge.close()
+                if not settled:
+                    # Cliente desconectou no meio: nada a concluir sobre o LLM
+                    llm_breaker.release()
+
         except Exception as e:
             log_error(f"Erro geral no streaming: {str(e)}")
             yield f"data: [ERROR] Erro interno do servidor\n\n"
@@ -714,9 +868,10 @@ async def health_check():
         if USE_MONGODB:
             try:
                 log_info("🔍 Testing MongoDB connection in health check...")
-                test_client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-                test_client.admin.command("ping")
-                test_client.close()
+                # Reusa o cliente (e o pool) da aplicação
+                ping = client.admin.command("ping")
+                if inspect.isawaitable(ping):
+                    await ping
                 log_info("✅ MongoDB health check passed")
             except Exception as e:
                 mongo_status = "unhealthy"
@@ -727,7 +882,7 @@ async def health_check():
         # Verificar LLM
         llm_status = "healthy"
         try:
-            test_response = llm.invoke("Test")
+            test_response = await generate_response("Test")
             if not test_response:
                 llm_status = "unhealthy"
         except Exception as e:
@@ -743,6 +898,10 @@ async def health_check():
             "status": overall_status,
             "timestamp": datetime.now().isoformat(),
             "services": {"mongodb": mongo_status, "llm": llm_status},
+            "circuits": {
+                breaker.name: breaker.state
+                for breaker in (mongo_breaker, vector_breaker, llm_breaker)
+            },
             "version": "v2.1",
         }
 
@@ -758,48 +917,58 @@ async def health_check():
         }
 
 
-@app.post("/upload-pdf/")
+@app.post("/upload-pdf/", status_code=202)
 async def upload_pdf(
     file: UploadFile = File(...), session_id: str = Form("default_session")
 ):
+    temp_pdf_path = None
     try:
-        temp_pdf_path = f"temp_uploads/{file.filename}"
-        os.makedirs(os.path.dirname(temp_pdf_path), exist_ok=True)
-        with open(temp_pdf_path, "wb") as f:
-            f.write(await file.read())
+        # Upload gravado em pedaços; o PDF nunca fica inteiro na memória
+        temp_pdf_path = await save_upload(file)
 
         log_info(f"📂 PDF recebido para sessão {session_id}: {temp_pdf_path}")
 
-        from langchain_community.document_loaders import PyMuPDFLoader
-
-        loader = PyMuPDFLoader(temp_pdf_path)
-        documents = loader.load()
-
-        log_info(f"📖 {len(documents)} documentos carregados do PDF.")
-
-        if VECTORSTORE_ENABLED:
-            for doc in documents:
-                texto_pdf = injetar_session_id(doc.page_content, session_id)
-                vectorstore.add_texts(
-                    texts=[texto_pdf], metadatas=[{"session_id": session_id}]
-                )
-        else:
+        if not VECTORSTORE_ENABLED:
             log_warning("⚠️ VectorStore desabilitado - PDF não será indexado.")
-
+            os.remove(temp_pdf_path)
+            return {"message": "VectorStore desabilitado - PDF não foi indexado."}
+
+        # A indexação segue em segundo plano; o job remove o arquivo ao terminar
+        job = ingest_jobs.submit(
+            temp_pdf_path,
+            session_id,
+            source=os.path.basename(file.filename or temp_pdf_path),
+            prepare_text=lambda texto: injetar_session_id(texto, session_id),
+        )
         log_success(
-            f"✅ Conteúdo do PDF adicionado ao VectorStore para sessão '{session_id}'!"
+            f"✅ PDF enfileirado para indexação (job {job.id})", session_id=session_id
         )
 
-        os.remove(temp_pdf_path)
-        log_info(f"🗑️ Arquivo temporário removido: {temp_pdf_path}")
-
-        return {"message": "PDF processado e indexado com sucesso para a sessão!"}
+        return {
+            "message": "PDF recebido; indexação em andamento para a sessão.",
+            "job_id": job.id,
+            "status_url": f"/upload-pdf/{job.id}",
+        }
 
     except Exception as e:
         log_error(f"Erro ao processar o PDF: {str(e)}")
+        if temp_pdf_path:
+            try:
+                os.remove(temp_pdf_path)
+            except FileNotFoundError:
+                pass
         raise HTTPException(status_code=500, detail="Erro ao processar o PDF.")
 
 
+@app.get("/upload-pdf/{job_id}")
+async def upload_pdf_status(job_id: str):
+    """Progresso de uma indexação de PDF: páginas, trechos e vazão"""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de indexação não encontrado.")
+    return job.to_dict()
+
+
 # Endpoints de Autenticação
 @app.post("/auth/token")
 async def get_token(client_name: str, client_secret: str):
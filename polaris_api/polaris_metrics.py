@@ -0,0 +1,366 @@
+from prometheus_client import CollectorRegistry, Gauge, Counter, Summary
+
+# Registry único compartilhado por todos os módulos da API
+registry = CollectorRegistry()
+
+inference_duration = Summary(
+    "inference_duration_seconds",
+    "Tempo de resposta da inferência em segundos",
+    ["session_id"],
+    registry=registry,
+)
+
+inference_total = Counter(
+    "inference_total",
+    "Número total de inferências processadas",
+    ["session_id"],
+    registry=registry,
+)
+
+inference_failures = Counter(
+    "inference_failures_total",
+    "Número total de falhas de inferência",
+    ["session_id"],
+    registry=registry,
+)
+
+inference_cancelled = Counter(
+    "inference_cancelled_total",
+    "Número total de streamings cancelados por desconexão do cliente",
+    ["session_id"],
+    registry=registry,
+)
+
+llm_queue_depth = Gauge(
+    "llm_queue_depth",
+    "Requisições aguardando um slot de geração",
+    ["backend"],
+    registry=registry,
+)
+
+llm_active_generations = Gauge(
+    "llm_active_generations",
+    "Gerações em andamento por backend",
+    ["backend"],
+    registry=registry,
+)
+
+llm_queue_wait = Summary(
+    "llm_queue_wait_seconds",
+    "Tempo de espera na fila antes de iniciar a geração",
+    ["backend"],
+    registry=registry,
+)
+
+llm_rejected = Counter(
+    "llm_rejected_total",
+    "Requisições rejeitadas pelo controle de admissão",
+    ["backend", "reason"],
+    registry=registry,
+)
+
+llm_batch_active_sequences = Gauge(
+    "llm_batch_active_sequences",
+    "Sequências ocupando slots no lote do llama.cpp",
+    registry=registry,
+)
+
+llm_generated_tokens = Counter(
+    "llm_generated_tokens_total",
+    "Tokens gerados por backend",
+    ["backend"],
+    registry=registry,
+)
+
+llama_state_cache_bytes = Gauge(
+    "llama_state_cache_bytes",
+    "Bytes ocupados pelos estados KV por sessão do llama.cpp",
+    registry=registry,
+)
+
+llama_state_cache_lookups = Counter(
+    "llama_state_cache_lookups_total",
+    "Consultas ao cache de estados KV por sessão",
+    ["result"],
+    registry=registry,
+)
+
+llm_time_to_headers = Summary(
+    "llm_time_to_headers_seconds",
+    "Tempo até os cabeçalhos da resposta do backend remoto (conexão + TLS + fila do provedor)",
+    ["backend"],
+    registry=registry,
+)
+
+llm_time_to_first_token = Summary(
+    "llm_time_to_first_token_seconds",
+    "Tempo entre o envio da requisição e o primeiro token gerado",
+    ["backend"],
+    registry=registry,
+)
+
+llm_retries = Counter(
+    "llm_retries_total",
+    "Repetições de requisições ao backend após falhas transitórias",
+    ["backend", "reason"],
+    registry=registry,
+)
+
+llm_router_requests = Counter(
+    "llm_router_requests_total",
+    "Gerações atendidas por backend escolhido pelo roteador",
+    ["backend"],
+    registry=registry,
+)
+
+llm_router_failovers = Counter(
+    "llm_router_failovers_total",
+    "Trocas de backend antes do primeiro token",
+    ["backend", "reason"],
+    registry=registry,
+)
+
+llm_router_hedges = Counter(
+    "llm_router_hedges_total",
+    "Requisições duplicadas (hedge) em um segundo backend",
+    registry=registry,
+)
+
+llm_router_latency = Gauge(
+    "llm_router_ttft_ewma_seconds",
+    "Média móvel do tempo até o primeiro token usada pelo roteador",
+    ["backend"],
+    registry=registry,
+)
+
+llm_tokens_per_second = Summary(
+    "llm_tokens_per_second",
+    "Velocidade de geração (tokens/s) por backend",
+    ["backend"],
+    registry=registry,
+)
+
+llm_draft_tokens = Counter(
+    "llm_draft_tokens_total",
+    "Tokens propostos pelo modelo de rascunho, por resultado da verificação",
+    ["result"],
+    registry=registry,
+)
+
+llm_draft_acceptance = Gauge(
+    "llm_draft_acceptance_ratio",
+    "Fração acumulada dos tokens de rascunho aceitos pelo modelo principal",
+    registry=registry,
+)
+
+embedding_cache_lookups = Counter(
+    "embedding_cache_lookups_total",
+    "Consultas ao cache de embeddings por resultado",
+    ["result"],
+    registry=registry,
+)
+
+embedding_cache_entries = Gauge(
+    "embedding_cache_entries",
+    "Vetores guardados no cache de embeddings por tier",
+    ["tier"],
+    registry=registry,
+)
+
+vector_write_queue_depth = Gauge(
+    "vector_write_queue_depth",
+    "Textos aguardando gravação em lote no vectorstore",
+    registry=registry,
+)
+
+vector_writes = Counter(
+    "vector_writes_total",
+    "Textos enviados ao vectorstore pelo write-behind, por resultado",
+    ["result"],
+    registry=registry,
+)
+
+vector_write_duration = Summary(
+    "vector_write_batch_seconds",
+    "Tempo de cada gravação em lote (embedding + escrita no Chroma)",
+    registry=registry,
+)
+
+pdf_pages_ingested = Counter(
+    "pdf_pages_ingested_total",
+    "Páginas de PDF extraídas para indexação",
+    registry=registry,
+)
+
+pdf_chunks_ingested = Counter(
+    "pdf_chunks_ingested_total",
+    "Trechos de PDF gravados no vectorstore",
+    registry=registry,
+)
+
+pdf_ingest_duration = Summary(
+    "pdf_ingest_seconds",
+    "Tempo total de indexação de um PDF",
+    registry=registry,
+)
+
+pdf_jobs = Counter(
+    "pdf_ingest_jobs_total",
+    "Jobs de indexação de PDF por estado (queued, done, failed)",
+    ["status"],
+    registry=registry,
+)
+
+pdf_jobs_active = Gauge(
+    "pdf_ingest_jobs_active",
+    "Jobs de indexação de PDF em execução",
+    registry=registry,
+)
+
+dedup_skipped = Counter(
+    "dedup_skipped_total",
+    "Textos não reindexados por já existirem na sessão (exato ou quase-duplicata)",
+    ["kind", "match"],
+    registry=registry,
+)
+
+dedup_sessions = Gauge(
+    "dedup_index_sessions",
+    "Sessões com índice de hashes carregado em memória",
+    registry=registry,
+)
+
+vector_partitions_open = Gauge(
+    "vector_partitions_open",
+    "Coleções de sessão com handle aberto no cache LRU",
+    registry=registry,
+)
+
+vector_partition_opens = Counter(
+    "vector_partition_opens_total",
+    "Acessos a partições do vectorstore (cached ou opened)",
+    ["result"],
+    registry=registry,
+)
+
+retrieval_chunks = Summary(
+    "retrieval_chunks",
+    "Trechos de documentos injetados no prompt por busca",
+    registry=registry,
+)
+
+retrieval_dropped = Counter(
+    "retrieval_dropped_total",
+    "Candidatos descartados pelo corte de relevância ou pelo MMR",
+    registry=registry,
+)
+
+retrieval_duration = Summary(
+    "retrieval_seconds",
+    "Tempo da busca híbrida (vetorial + BM25 + rerank)",
+    registry=registry,
+)
+
+retention_deleted = Counter(
+    "retention_deleted_total",
+    "Respostas removidas do vectorstore pela retenção, por motivo",
+    ["reason"],
+    registry=registry,
+)
+
+retention_compactions = Counter(
+    "retention_compactions_total",
+    "Partições do vectorstore compactadas",
+    registry=registry,
+)
+
+retention_last_run = Gauge(
+    "retention_last_run_timestamp",
+    "Horário (epoch) da última passada de retenção",
+    registry=registry,
+)
+
+session_store_sessions = Gauge(
+    "session_store_sessions",
+    "Sessões com conversa recente residente em memória",
+    registry=registry,
+)
+
+session_store_bytes = Gauge(
+    "session_store_bytes",
+    "Bytes aproximados das mensagens residentes no SessionStore",
+    registry=registry,
+)
+
+session_evictions = Counter(
+    "session_store_evictions_total",
+    "Sessões descartadas da memória por motivo (ttl, lru, discard)",
+    ["reason"],
+    registry=registry,
+)
+
+session_store_writes = Counter(
+    "session_store_writes_total",
+    "Mensagens gravadas pelo write-behind do SQLite de sessões por resultado",
+    ["result"],
+    registry=registry,
+)
+
+mongo_cache_requests = Counter(
+    "mongo_cache_requests_total",
+    "Leituras de memórias do MongoDB por resultado do cache (hit, miss)",
+    ["result"],
+    registry=registry,
+)
+
+mongo_pool_connections = Gauge(
+    "mongo_pool_connections",
+    "Conexões abertas no pool do MongoDB",
+    registry=registry,
+)
+
+mongo_pool_checked_out = Gauge(
+    "mongo_pool_checked_out",
+    "Conexões do pool do MongoDB em uso neste momento",
+    registry=registry,
+)
+
+mongo_pool_max_size = Gauge(
+    "mongo_pool_max_size",
+    "Tamanho máximo do pool do MongoDB (maxPoolSize)",
+    registry=registry,
+)
+
+mongo_pool_checkout_seconds = Summary(
+    "mongo_pool_checkout_seconds",
+    "Espera para obter uma conexão do pool do MongoDB",
+    registry=registry,
+)
+
+mongo_pool_checkout_failures = Counter(
+    "mongo_pool_checkout_failures_total",
+    "Falhas ao obter conexão do pool do MongoDB por motivo",
+    ["reason"],
+    registry=registry,
+)
+
+circuit_state = Gauge(
+    "circuit_state",
+    "Estado do circuit breaker por dependência (0 fechado, 1 meio-aberto, 2 aberto)",
+    ["dependency"],
+    registry=registry,
+)
+
+circuit_failures = Counter(
+    "circuit_failures_total",
+    "Falhas (erros ou timeouts) registradas pelo circuit breaker",
+    ["dependency"],
+    registry=registry,
+)
+
+circuit_rejected = Counter(
+    "circuit_rejected_total",
+    "Chamadas puladas porque o circuito da dependência estava aberto",
+    ["dependency"],
+    registry=registry,
+)
@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 64))
+STREAM_MAX_WORKERS = int(os.getenv("STREAM_MAX_WORKERS", 256))
+
+# Executor dedicado: produtores de streaming passam a maior parte do tempo
+# esperando I/O e não devem disputar o executor padrão do event loop
+stream_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=STREAM_MAX_WORKERS, thread_name_prefix="polaris-stream"
+)
+
+_SENTINEL = object()
+
+
+class TokenBridge:
+    """Ponte produtor/consumidor entre um gerador síncrono de tokens e o event loop.
+
+    O gerador roda numa thread do executor e entrega cada token direto na
+    fila asyncio (via run_coroutine_threadsafe), acordando o consumidor sem
+    polling. A fila é limitada: se o cliente lê devagar, o produtor espera.
+    close() cancela o produtor e encerra o gerador upstream (stream do Groq
+    ou loop de tokens do llama.cpp), liberando a thread na hora.
+    """
+
+    def __init__(
+        self, producer: Callable[[], Iterable[str]], maxsize: int = STREAM_QUEUE_SIZE
+    ):
+        self._producer = producer
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self._future = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    @property
+    def future(self):
+        """Future da thread produtora; conclui quando o gerador upstream termina."""
+        return self._future
+
+    def start(self, executor=stream_executor):
+        self._future = self._loop.run_in_executor(executor, self._run)
+        return self
+
+    def close(self):
+        """Cancela o produtor; deve ser chamado a partir do event loop."""
+        if self._cancelled.is_set():
+            return
+        self._cancelled.set()
+        # Esvazia a fila para destravar um produtor parado esperando vaga
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def _put(self, item) -> bool:
+        """Entrega um item ao consumidor; retorna False se o stream foi cancelado."""
+        if self._cancelled.is_set():
+            return False
+        try:
+            asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+            return True
+        except (RuntimeError, concurrent.futures.CancelledError):
+            return False
+
+    def _run(self):
+        chunks = None
+        try:
+            chunks = iter(self._producer())
+            for chunk in chunks:
+                if not self._put(chunk):
+                    break
+        except Exception as e:
+            self._put(e)
+        finally:
+            # Fecha o gerador para interromper a geração no backend
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            self._put(_SENTINEL)
+
+    async def __aiter__(self):
+        while True:
+            item = await self._queue.get()
+            if item is _SENTINEL:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class AsyncTokenStream:
+    """Mesma interface da TokenBridge para backends com streaming assíncrono nativo.
+
+    Os tokens vêm direto de um gerador assíncrono no próprio event loop, sem
+    thread nem fila intermediária. on_close é chamado uma única vez, quando o
+    gerador termina ou quando o stream é fechado.
+    """
+
+    def __init__(
+        self, chunks: AsyncIterator[str], on_close: Optional[Callable[[], None]] = None
+    ):
+        self._chunks = chunks
+        self._on_close = on_close
+        self._cancelled = False
+        self._finished = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def close(self):
+        """Cancela o stream; deve ser chamado a partir do event loop."""
+        if self._cancelled:
+            return
+        self._cancelled = True
+        asyncio.ensure_future(self._aclose())
+
+    async def _aclose(self):
+        try:
+            # Fecha o gerador upstream, encerrando a resposta HTTP do backend
+            await self._chunks.aclose()
+        except RuntimeError:
+            pass
+        finally:
+            self._finish()
+
+    def _finish(self):
+        if self._finished:
+            return
+        self._finished = True
+        if self._on_close is not None:
+            self._on_close()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._chunks:
+                yield chunk
+        finally:
+            self._finish()
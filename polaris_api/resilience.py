@@ -0,0 +1,183 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from polaris_logger import log_info, log_warning
+from polaris_metrics import circuit_state, circuit_failures, circuit_rejected
+
+# Falhas seguidas que abrem o circuito
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+# Tempo com o circuito aberto antes de deixar passar uma chamada de teste
+CIRCUIT_RECOVERY_SECONDS = float(os.getenv("CIRCUIT_RECOVERY_SECONDS", 30))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Erros do próprio pedido (ex.: prompt maior que o contexto), não do LLM
+_REQUEST_ERRORS = (ValueError, TypeError)
+
+
+class CircuitOpenError(Exception):
+    """A dependência está com o circuito aberto; a chamada nem foi feita."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuito '{name}' aberto")
+        self.name = name
+
+
+def llm_is_failure(exc: BaseException) -> bool:
+    """Falhas que contam para o circuito do LLM.
+
+    Fila cheia / sem slot (429/503) e pedidos inválidos não dizem nada
+    sobre a saúde do LLM; estouro de prazo (504) e os demais erros sim.
+    """
+    if isinstance(exc, HTTPException):
+        return exc.status_code == 504
+    return not isinstance(exc, _REQUEST_ERRORS)
+
+
+class CircuitBreaker:
+    """Circuit breaker com timeout por chamada para uma dependência externa.
+
+    - fechado: chamadas passam; `failure_threshold` falhas seguidas
+      (exceções ou chamadas além de `timeout`) abrem o circuito;
+    - aberto: chamadas falham na hora com CircuitOpenError, sem tocar
+      na dependência, por `recovery_timeout` segundos;
+    - meio-aberto: uma única chamada de teste passa; sucesso fecha o
+      circuito, falha o reabre por mais `recovery_timeout` segundos.
+
+    `is_failure(exc)` decide quais exceções contam como falha da
+    dependência (ex.: fila cheia do scheduler não conta).
+
+    Streams não cabem em call(): reserve com allow() antes de abrir e
+    registre record_success() / record_error(exc) quando o stream termina
+    (release() se ele for abandonado no meio).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_SECONDS,
+        timeout: Optional[float] = None,
+        is_failure: Callable[[BaseException], bool] = lambda exc: True,
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.timeout = timeout
+        self.is_failure = is_failure
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        circuit_state.labels(dependency=name).set(_STATE_VALUE[CLOSED])
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def _set_state(self, state: str):
+        if state == self._state:
+            return
+        self._state = state
+        circuit_state.labels(dependency=self.name).set(_STATE_VALUE[state])
+        if state == OPEN:
+            log_warning(
+                f"🔌 Circuito '{self.name}' aberto após {self._failures} falhas; "
+                f"nova tentativa em {self.recovery_timeout:.0f}s."
+            )
+        elif state == CLOSED:
+            log_info(f"✅ Circuito '{self.name}' fechado, dependência respondendo.")
+
+    def allow(self) -> bool:
+        """Reserva uma chamada; False se o circuito está aberto."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if (
+                self._state == OPEN
+                and time.monotonic() - self._opened_at >= self.recovery_timeout
+            ):
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+        circuit_rejected.labels(dependency=self.name).inc()
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probing = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        circuit_failures.labels(dependency=self.name).inc()
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+    def release(self):
+        """Chamada que não diz nada sobre a saúde da dependência."""
+        with self._lock:
+            self._probing = False
+
+    def record_error(self, exc: BaseException):
+        """Conta a exceção como falha só se `is_failure(exc)`."""
+        if self.is_failure(exc):
+            self.record_failure()
+        else:
+            self.release()
+
+    async def call(self, func: Callable, *args):
+        """Executa func (async, ou síncrona numa thread) protegida pelo circuito."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        if inspect.iscoroutinefunction(func):
+            call = func(*args)
+        else:
+            call = asyncio.to_thread(func, *args)
+        try:
+            if self.timeout is None:
+                result = await call
+            else:
+                result = await asyncio.wait_for(call, timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.record_failure()
+            raise
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception as e:
+            self.record_error(e)
+            raise
+        self.record_success()
+        return result
+
+    def call_sync(self, func: Callable, *args):
+        """Versão bloqueante: a chamada não é interrompida, mas passar do
+        `timeout` conta como falha."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        start = time.monotonic()
+        try:
+            result = func(*args)
+        except Exception as e:
+            self.record_error(e)
+            raise
+        if self.timeout is not None and time.monotonic() - start > self.timeout:
+            self.record_failure()
+        else:
+            self.record_success()
+        return result
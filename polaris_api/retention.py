@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, Iterable, Optional
+
+from polaris_logger import log_info, log_success, log_error
+from polaris_metrics import retention_deleted, retention_compactions, retention_last_run
+
+# 0 desativa cada limite
+RETENTION_MAX_AGE_DAYS = float(os.getenv("RETENTION_MAX_AGE_DAYS", 90))
+RETENTION_MAX_RESPONSES = int(os.getenv("RETENTION_MAX_RESPONSES", 2000))
+RETENTION_MAX_TOTAL = int(os.getenv("RETENTION_MAX_TOTAL", 0))
+# Compacta a partição quando a fração apagada desde a última compactação passa disso
+RETENTION_COMPACT_RATIO = float(os.getenv("RETENTION_COMPACT_RATIO", 0.2))
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", 6))
+
+
+def is_response(metadata: dict) -> bool:
+    """Respostas salvas automaticamente; documentos enviados nunca expiram.
+
+    Registros anteriores ao campo "kind" não são tocados: o upload_pdf
+    antigo gravava os trechos só com {"session_id"}, igual às respostas,
+    então não dá para distingui-los e a retenção fica do lado seguro.
+    """
+    return metadata.get("kind") == "response"
+
+
+class RetentionEngine:
+    """Expira respostas antigas do vectorstore e compacta as partições.
+
+    A cada passada, por partição:
+      - respostas mais velhas que `max_age_days` saem;
+      - cada sessão fica com no máximo `max_responses` respostas (as mais
+        novas);
+      - com `max_total`, o total de respostas do deployment também é
+        limitado, removendo as mais antigas de todas as sessões.
+    Documentos enviados (PDFs) e registros sem "kind" (anteriores a este
+    campo) não são tocados. Respostas sem "created_at" não expiram por
+    idade, mas contam como as mais antigas nos limites por quantidade.
+
+    `on_change(session_id)` é chamado para cada sessão alterada, para
+    invalidar caches (índice de duplicatas, BM25).
+    """
+
+    def __init__(
+        self,
+        get_store: Callable,
+        max_age_days: float = RETENTION_MAX_AGE_DAYS,
+        max_responses: int = RETENTION_MAX_RESPONSES,
+        max_total: int = RETENTION_MAX_TOTAL,
+        compact_ratio: float = RETENTION_COMPACT_RATIO,
+        interval_hours: float = RETENTION_INTERVAL_HOURS,
+        on_change: Iterable[Callable[[str], None]] = (),
+    ):
+        self._get_store = get_store
+        self.max_age = max_age_days * 86400
+        self.max_responses = max_responses
+        self.max_total = max_total
+        self.compact_ratio = compact_ratio
+        self.interval = interval_hours * 3600
+        self.on_change = list(on_change)
+        self._deleted = defaultdict(int)  # partição -> apagados desde a compactação
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _delete(self, store, name: str, doomed: dict, reason: str):
+        """Apaga {id: session_id} da partição e avisa as sessões afetadas."""
+        if not doomed:
+            return
+        store.delete_records(name, list(doomed))
+        self._deleted[name] += len(doomed)
+        retention_deleted.labels(reason=reason).inc(len(doomed))
+        for session_id in set(doomed.values()):
+            for callback in self.on_change:
+                callback(session_id)
+
+    def run_once(self, now: Optional[float] = None) -> dict:
+        """Uma passada completa de retenção + compactação. Devolve estatísticas."""
+        now = time.time() if now is None else now
+        store = self._get_store()
+        stats = {"deleted": 0, "compacted": 0}
+        survivors = []  # (created_at, partição, id, session_id) para o limite global
+        sizes = {}
+
+        for name in store.partition_names():
+            records = store.partition_records(name)
+            sizes[name] = len(records["ids"])
+            expired, by_session = {}, defaultdict(list)
+            for record_id, metadata in zip(records["ids"], records["metadatas"]):
+                metadata = metadata or {}
+                if not is_response(metadata):
+                    continue
+                session_id = metadata.get("session_id", "")
+                created = metadata.get("created_at")
+                if (
+                    created is not None
+                    and self.max_age
+                    and now - created > self.max_age
+                ):
+                    expired[record_id] = session_id
+                else:
+                    by_session[session_id].append((created or 0.0, record_id))
+            self._delete(store, name, expired, "age")
+
+            over = {}
+            for session_id, items in by_session.items():
+                items.sort()
+                if self.max_responses and len(items) > self.max_responses:
+                    cut = len(items) - self.max_responses
+                    over.update({rid: session_id for _, rid in items[:cut]})
+                    items = items[cut:]
+                survivors.extend((c, name, rid, session_id) for c, rid in items)
+            self._delete(store, name, over, "session_limit")
+            stats["deleted"] += len(expired) + len(over)
+
+        if self.max_total and len(survivors) > self.max_total:
+            survivors.sort()
+            by_partition = defaultdict(dict)
+            for _, name, rid, session_id in survivors[
+                : len(survivors) - self.max_total
+            ]:
+                by_partition[name][rid] = session_id
+            for name, doomed in by_partition.items():
+                self._delete(store, name, doomed, "global_limit")
+                stats["deleted"] += len(doomed)
+
+        for name, deleted in list(self._deleted.items()):
+            if name not in sizes:
+                del self._deleted[name]  # partição apagada (purga da sessão)
+                continue
+            if deleted < self.compact_ratio * max(1, sizes[name]):
+                continue
+            try:
+                store.compact_partition(name)
+            except Exception as e:
+                log_error(f"Erro ao compactar a partição {name}: {e}")
+                continue
+            del self._deleted[name]
+            retention_compactions.inc()
+            stats["compacted"] += 1
+
+        retention_last_run.set(now)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Execução em segundo plano
+    # ------------------------------------------------------------------
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="polaris-retention", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        # Primeira passada um minuto após o boot (fora do warmup), depois a cada intervalo
+        if self._stop.wait(60):
+            return
+        while True:
+            start = time.time()
+            try:
+                stats = self.run_once()
+                if stats["deleted"] or stats["compacted"]:
+                    log_success(
+                        f"🧹 Retenção: {stats['deleted']} respostas expiradas, "
+                        f"{stats['compacted']} partições compactadas",
+                        duration=time.time() - start,
+                    )
+                else:
+                    log_info("🧹 Retenção: nada a expirar.")
+            except Exception as e:
+                log_error(f"Erro na retenção do vectorstore: {e}")
+            if self._stop.wait(self.interval):
+                return
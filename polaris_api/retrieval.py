@@ -0,0 +1,319 @@
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Callable, List
+
+import numpy as np
+from langchain_core.documents import Document
+from polaris_logger import log_info, log_warning
+from polaris_metrics import retrieval_chunks, retrieval_dropped, retrieval_duration
+
+RETRIEVAL_K = int(os.getenv("RETRIEVAL_K", 3))
+# Candidatos buscados em cada índice (vetorial e BM25) antes da fusão
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+# Trechos com score final abaixo disso não entram no prompt
+RETRIEVAL_MIN_SCORE = float(os.getenv("RETRIEVAL_MIN_SCORE", 0.35))
+# Peso do cosseno no score final (o resto é BM25 normalizado)
+RETRIEVAL_VECTOR_WEIGHT = float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", 0.7))
+# 1.0 = só relevância; menor = mais diversidade entre os trechos escolhidos
+RETRIEVAL_MMR_LAMBDA = float(os.getenv("RETRIEVAL_MMR_LAMBDA", 0.7))
+RETRIEVAL_BM25 = os.getenv("RETRIEVAL_BM25", "true").lower() == "true"
+# Cross-encoder opcional para o rerank (ex.: cross-encoder/ms-marco-MiniLM-L-6-v2)
+RETRIEVAL_RERANK_MODEL = os.getenv("RETRIEVAL_RERANK_MODEL", "")
+RETRIEVAL_BM25_SESSIONS = int(os.getenv("RETRIEVAL_BM25_SESSIONS", 256))
+
+RRF_K = 60
+_TOKEN = re.compile(r"\w{2,}", re.UNICODE)
+# Prefixo "[session_id=X]" que injetar_session_id põe em perguntas e respostas
+_SESSION_PREFIX = re.compile(r"^\s*\[session_id=[^\]]*\]\s*")
+
+
+def strip_session_prefix(text: str) -> str:
+    """Remove o prefixo de sessão: ele casaria com todo documento da sessão."""
+    return _SESSION_PREFIX.sub("", text or "", count=1)
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos: "Ação" e "acao" viram o mesmo termo."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+class BM25Index:
+    """Índice invertido BM25 de uma sessão, atualizado incrementalmente."""
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents = []
+        self.metadatas = []
+        self.ids = []
+        self.lengths = []
+        self.postings = {}  # termo -> ([doc], [tf])
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, documents, metadatas, ids=None):
+        ids = ids or [None] * len(documents)
+        for text, metadata, record_id in zip(documents, metadatas, ids):
+            doc = len(self.documents)
+            terms = Counter(tokenize(strip_session_prefix(text)))
+            for term, tf in terms.items():
+                docs, tfs = self.postings.setdefault(term, ([], []))
+                docs.append(doc)
+                tfs.append(tf)
+            length = sum(terms.values())
+            self.documents.append(text)
+            self.metadatas.append(metadata or {})
+            self.ids.append(record_id)
+            self.lengths.append(length)
+            self._total_length += length
+
+    def search(self, query: str, k: int):
+        """Devolve [(índice do documento, score)] dos k melhores."""
+        n = len(self.documents)
+        if not n:
+            return []
+        lengths = np.asarray(self.lengths, dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / n))
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs = np.asarray(posting[0])
+            tfs = np.asarray(posting[1], dtype=np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+        hits = np.flatnonzero(scores)
+        top = hits[np.argsort(-scores[hits])][:k]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class _SessionBM25:
+    """Índice BM25 de uma sessão com lock próprio: carga e busca de uma
+    sessão não seguram as das outras."""
+
+    __slots__ = ("index", "lock")
+
+    def __init__(self):
+        self.index = BM25Index()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+
+class HybridRetriever:
+    """Busca híbrida: vetorial + BM25, fusão, rerank, MMR e corte por relevância.
+
+    1. candidatos do vectorstore e do índice BM25 da sessão, unidos por
+       Reciprocal Rank Fusion;
+    2. rerank por cosseno (vetores já gravados no vectorstore) com o BM25
+       normalizado, ou por um cross-encoder se RETRIEVAL_RERANK_MODEL
+       estiver definido;
+    3. MMR para não repetir trechos quase iguais;
+    4. trechos abaixo de `min_score` são descartados: sem nada relevante,
+       nenhum token de documento entra no prompt.
+
+    O índice BM25 de cada sessão é montado a partir do vectorstore e
+    completado com os documentos novos quando a contagem da sessão cresce.
+    O prefixo "[session_id=X]" da pergunta e dos documentos fica fora do
+    BM25 e do embedding da pergunta.
+    """
+
+    def __init__(
+        self,
+        get_store: Callable,
+        embeddings,
+        k: int = RETRIEVAL_K,
+        candidates: int = RETRIEVAL_CANDIDATES,
+        min_score: float = RETRIEVAL_MIN_SCORE,
+        vector_weight: float = RETRIEVAL_VECTOR_WEIGHT,
+        mmr_lambda: float = RETRIEVAL_MMR_LAMBDA,
+        use_bm25: bool = RETRIEVAL_BM25,
+        rerank_model: str = RETRIEVAL_RERANK_MODEL,
+        max_sessions: int = RETRIEVAL_BM25_SESSIONS,
+    ):
+        self._get_store = get_store
+        self.embeddings = embeddings
+        self.k = k
+        self.candidates = candidates
+        self.min_score = min_score
+        self.vector_weight = vector_weight
+        self.mmr_lambda = mmr_lambda
+        self.use_bm25 = use_bm25
+        self.rerank_model = rerank_model
+        self.max_sessions = max_sessions
+        self._cross_encoder = None
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # BM25
+    # ------------------------------------------------------------------
+
+    def _bm25(self, session_id: str, query: str, k: int):
+        """[(texto, metadados, id, score)] dos k melhores no BM25 da sessão.
+
+        O lock global cobre só a LRU; leitura do vectorstore, tokenização e
+        busca seguram apenas o lock da própria sessão.
+        """
+        store = self._get_store()
+        total = store.count(session_id)
+        with self._lock:
+            entry = self._indexes.get(session_id)
+            if entry is None:
+                entry = self._indexes[session_id] = _SessionBM25()
+            self._indexes.move_to_end(session_id)
+            while len(self._indexes) > self.max_sessions:
+                self._indexes.popitem(last=False)
+
+        with entry.lock:
+            if len(entry.index) > total:
+                # Sessão encolheu (retenção/purga): remonta
+                entry.index = BM25Index()
+            index = entry.index
+            if len(index) < total:
+                fresh = store.get(
+                    where={"session_id": session_id},
+                    include=["documents", "metadatas"],
+                    offset=len(index),
+                    limit=total - len(index),
+                )
+                index.add(fresh["documents"], fresh["metadatas"], fresh["ids"])
+            return [
+                (index.documents[i], index.metadatas[i], index.ids[i], score)
+                for i, score in index.search(query, k)
+            ]
+
+    def forget(self, session_id: str):
+        """Descarta o índice BM25 da sessão (remontado na próxima busca)."""
+        with self._lock:
+            self._indexes.pop(session_id, None)
+
+    # ------------------------------------------------------------------
+    # Rerank
+    # ------------------------------------------------------------------
+
+    def _get_cross_encoder(self):
+        if self._cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+
+            log_info(f"🔁 Carregando reranker {self.rerank_model}...")
+            self._cross_encoder = CrossEncoder(self.rerank_model)
+        return self._cross_encoder
+
+    def _vectors(self, store, session_id: str, texts: List[str], ids: list):
+        """Vetores dos candidatos: os já gravados no vectorstore; só os que
+        faltam (sem id ou backend sem vetores) são recalculados."""
+        vectors = [None] * len(texts)
+        if hasattr(store, "embeddings") and any(ids):
+            vectors = list(store.embeddings(session_id, ids))
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            fresh = self.embeddings.embed_documents(
+                [strip_session_prefix(texts[i]) for i in missing]
+            )
+            for i, vector in zip(missing, fresh):
+                vectors[i] = vector
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(
+            np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+        )
+
+    def _rerank(
+        self, query: str, texts: List[str], vectors: np.ndarray, lexical: np.ndarray
+    ):
+        """Scores finais (0..1) e a matriz de similaridade entre candidatos."""
+        pairwise = vectors @ vectors.T
+
+        if self.rerank_model:
+            try:
+                pairs = [(query, strip_session_prefix(t)) for t in texts]
+                logits = self._get_cross_encoder().predict(pairs)
+                return 1 / (1 + np.exp(-np.asarray(logits, dtype=np.float32))), pairwise
+            except Exception as e:
+                log_warning(f"⚠️ Reranker indisponível, usando cosseno: {e}")
+
+        q = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        q /= max(np.linalg.norm(q), 1e-12)
+        cosine = vectors @ q
+        # Sem nenhum termo da pergunta nos candidatos, o BM25 não contribui
+        # (normalizar zeros pelo máximo inflaria todos os scores)
+        top = lexical.max() if len(lexical) else 0.0
+        lexical = lexical / top if top > 0 else np.zeros_like(lexical)
+        scores = self.vector_weight * cosine + (1 - self.vector_weight) * lexical
+        return scores, pairwise
+
+    def _mmr(self, scores: np.ndarray, pairwise: np.ndarray) -> List[int]:
+        remaining = [i for i in np.argsort(-scores) if scores[i] >= self.min_score]
+        chosen = []
+        while remaining and len(chosen) < self.k:
+            if chosen:
+                redundancy = pairwise[np.ix_(remaining, chosen)].max(axis=1)
+            else:
+                redundancy = np.zeros(len(remaining))
+            mmr = (
+                self.mmr_lambda * scores[remaining] - (1 - self.mmr_lambda) * redundancy
+            )
+            chosen.append(remaining.pop(int(np.argmax(mmr))))
+        return chosen
+
+    # ------------------------------------------------------------------
+    # Busca
+    # ------------------------------------------------------------------
+
+    def search(self, query: str, session_id: str) -> List[Document]:
+        start = time.time()
+        store = self._get_store()
+        where = {"session_id": session_id}
+        query = strip_session_prefix(query)
+
+        fused = OrderedDict()  # texto -> [metadados, rrf, bm25, id]
+        for rank, doc in enumerate(
+            store.similarity_search(query, k=self.candidates, filter=where)
+        ):
+            entry = fused.setdefault(
+                doc.page_content, [doc.metadata, 0.0, 0.0, getattr(doc, "id", None)]
+            )
+            entry[1] += 1 / (RRF_K + rank)
+        if self.use_bm25:
+            hits = self._bm25(session_id, query, self.candidates)
+            for rank, (text, metadata, record_id, score) in enumerate(hits):
+                entry = fused.setdefault(text, [metadata, 0.0, 0.0, record_id])
+                entry[1] += 1 / (RRF_K + rank)
+                entry[2] = score
+                entry[3] = entry[3] or record_id
+
+        if not fused:
+            retrieval_chunks.observe(0)
+            return []
+
+        ranked = sorted(fused.items(), key=lambda item: -item[1][1])
+        ranked = ranked[: self.candidates]
+        texts = [text for text, _ in ranked]
+        lexical = np.asarray([entry[2] for _, entry in ranked], dtype=np.float32)
+        vectors = self._vectors(
+            store, session_id, texts, [entry[3] for _, entry in ranked]
+        )
+        scores, pairwise = self._rerank(query, texts, vectors, lexical)
+        chosen = self._mmr(scores, pairwise)
+
+        retrieval_dropped.inc(len(texts) - len(chosen))
+        retrieval_chunks.observe(len(chosen))
+        retrieval_duration.observe(time.time() - start)
+        return [
+            Document(
+                page_content=texts[i],
+                metadata={**ranked[i][1][0], "score": round(float(scores[i]), 4)},
+            )
+            for i in chosen
+        ]
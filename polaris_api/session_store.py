@@ -0,0 +1,487 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from polaris_logger import log_info, log_error
+from polaris_metrics import (
+    session_store_sessions,
+    session_store_bytes,
+    session_evictions,
+    session_store_writes,
+)
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", 10000))
+# Sessões sem atividade por mais que isso são descartadas (0 desativa)
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 86400))
+# Write-behind do backend SQLite: grava quando o lote enche ou após o intervalo
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", 0.5))
+SESSION_FLUSH_BATCH = int(os.getenv("SESSION_FLUSH_BATCH", 64))
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+# Intervalo entre as limpezas de sessões expiradas no SQLite
+_PURGE_INTERVAL = 600
+
+USER = "user"
+ASSISTANT = "assistant"
+
+
+class Message:
+    """Uma mensagem da conversa recente; __slots__ evita um __dict__ por mensagem."""
+
+    __slots__ = ("role", "content", "size")
+
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.size = sys.getsizeof(content)
+
+
+class _Session:
+    __slots__ = ("messages", "last_access", "size")
+
+    def __init__(self, history: int):
+        self.messages = deque(maxlen=history)
+        self.last_access = time.monotonic()
+        self.size = 0
+
+
+class SessionStore:
+    """Conversa recente de cada sessão com memória limitada.
+
+    Cada sessão guarda as últimas `history` mensagens num deque de
+    tamanho fixo (o FIFO acontece no append, sem recriar listas). No
+    máximo `max_sessions` ficam residentes (LRU) e sessões paradas há
+    mais de `ttl` segundos são descartadas; uma sessão descartada só
+    perde o contexto recente — Mongo e vectorstore continuam intactos.
+    """
+
+    def __init__(
+        self,
+        history: int,
+        max_sessions: int = SESSION_MAX,
+        ttl: float = SESSION_TTL_SECONDS,
+    ):
+        self.history = history
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._bytes
+
+    def _drop(self, session_id: str, reason: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.size
+        session_evictions.labels(reason=reason).inc()
+
+    def _evict(self, now: float):
+        # O OrderedDict está em ordem de acesso: as expiradas estão no início
+        while self._sessions and self.ttl:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.ttl:
+                break
+            self._drop(session_id, "ttl")
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)), "lru")
+        session_store_sessions.set(len(self._sessions))
+        session_store_bytes.set(self._bytes)
+
+    def _touch(self, session_id: str, create: bool):
+        now = time.monotonic()
+        session = self._sessions.get(session_id)
+        if session is not None and self.ttl and now - session.last_access > self.ttl:
+            self._drop(session_id, "ttl")
+            session = None
+        if session is None and create:
+            session = self._sessions[session_id] = _Session(self.history)
+        if session is not None:
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+        self._evict(now)
+        return session
+
+    def append(self, session_id: str, role: str, content: str):
+        with self._lock:
+            session = self._touch(session_id, create=True)
+            if len(session.messages) == session.messages.maxlen:
+                dropped = session.messages[0].size
+                session.size -= dropped
+                self._bytes -= dropped
+            message = Message(role, content)
+            session.messages.append(message)
+            session.size += message.size
+            self._bytes += message.size
+            session_store_bytes.set(self._bytes)
+
+    def save_turn(self, session_id: str, user_input: str, response: str):
+        self.append(session_id, USER, user_input)
+        self.append(session_id, ASSISTANT, response)
+
+    def messages(self, session_id: str) -> List[Message]:
+        with self._lock:
+            session = self._touch(session_id, create=False)
+            return list(session.messages) if session is not None else []
+
+    def replace(self, session_id: str, messages: List[Message]):
+        """Troca o histórico da sessão (ex.: por um resumo + mensagens recentes)."""
+        with self._lock:
+            session = self._touch(session_id, create=True)
+            self._bytes -= session.size
+            session.messages.clear()
+            session.messages.extend(messages)
+            session.size = sum(m.size for m in session.messages)
+            self._bytes += session.size
+            session_store_bytes.set(self._bytes)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id, "discard")
+                self._evict(time.monotonic())
+
+    def clear(self):
+        """Esvazia a memória sem contar como evicção (cache invalidado)."""
+        with self._lock:
+            self._sessions.clear()
+            self._bytes = 0
+            self._evict(time.monotonic())
+
+    def close(self):
+        """Nada a persistir: a conversa recente some junto com o processo."""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access);
+"""
+
+
+class SQLiteSessionStore:
+    """Conversa recente persistida num SQLite (WAL), com cache write-behind.
+
+    Leituras e escritas passam por um SessionStore em memória; as
+    mensagens novas são gravadas por uma thread em lotes (quando o lote
+    enche ou `flush_interval` segundos depois), fora do caminho da
+    resposta. O banco mantém só as últimas `history` mensagens de cada
+    sessão e apaga as sessões paradas há mais de `ttl` segundos.
+
+    Vários workers podem abrir o mesmo arquivo: o `PRAGMA data_version`
+    muda quando outro processo grava, e aí o cache local é descartado e
+    a sessão é relida do banco. Uma mensagem ainda não gravada por outro
+    worker fica invisível por no máximo `flush_interval` segundos.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        history: int,
+        max_sessions: int = SESSION_MAX,
+        ttl: float = SESSION_TTL_SECONDS,
+        flush_interval: float = SESSION_FLUSH_INTERVAL,
+        batch_size: int = SESSION_FLUSH_BATCH,
+    ):
+        self.path = path
+        self.history = history
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._cache = SessionStore(history, max_sessions=max_sessions, ttl=ttl)
+        self._pending = []  # (session_id, role, content, horário)
+        # Uma conexão por processo, protegida por lock: leituras, flush e a
+        # verificação de data_version usam a mesma conexão
+        self._db_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._version = self._data_version()
+        self._last_purge = 0.0
+        self._wake = threading.Event()
+        self._closing = False
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def __contains__(self, session_id):
+        return session_id in self._cache
+
+    @property
+    def resident_bytes(self) -> int:
+        return self._cache.resident_bytes
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    # ------------------------------------------------------------------
+    # Cache
+    # ------------------------------------------------------------------
+
+    def _data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync(self):
+        """Descarta o cache se outro processo gravou desde a última leitura."""
+        version = self._data_version()
+        if version != self._version:
+            self._version = version
+            self._cache.clear()
+
+    def _load(self, session_id: str):
+        """Banco + mensagens ainda não gravadas -> cache (com _db_lock)."""
+        rows = self._conn.execute(
+            "SELECT role, content FROM messages WHERE session_id = ? "
+            "ORDER BY id DESC LIMIT ?",
+            (session_id, self.history),
+        ).fetchall()
+        messages = [Message(role, content) for role, content in reversed(rows)]
+        messages += [Message(p[1], p[2]) for p in self._pending if p[0] == session_id]
+        self._cache.replace(session_id, messages[-self.history :])
+
+    def _cached(self, session_id: str):
+        self._sync()
+        if session_id not in self._cache:
+            self._load(session_id)
+
+    def messages(self, session_id: str) -> List[Message]:
+        with self._db_lock:
+            self._cached(session_id)
+            return self._cache.messages(session_id)
+
+    def append(self, session_id: str, role: str, content: str):
+        self._append(session_id, [(role, content)])
+
+    def save_turn(self, session_id: str, user_input: str, response: str):
+        self._append(session_id, [(USER, user_input), (ASSISTANT, response)])
+
+    def _append(self, session_id: str, messages):
+        now = time.time()
+        with self._db_lock:
+            self._cached(session_id)
+            for role, content in messages:
+                self._cache.append(session_id, role, content)
+                self._pending.append((session_id, role, content, now))
+            full = len(self._pending) >= self.batch_size
+        self._ensure_started()
+        if full:
+            self._wake.set()
+
+    def replace(self, session_id: str, messages: List[Message]):
+        """Troca o histórico da sessão, gravando na hora (caminho raro)."""
+        with self._db_lock:
+            self._pending = [p for p in self._pending if p[0] != session_id]
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM messages WHERE session_id = ?", (session_id,)
+                )
+                self._conn.executemany(
+                    "INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                    [(session_id, m.role, m.content) for m in messages],
+                )
+                self._touch_sessions([session_id], time.time())
+            self._cache.replace(session_id, messages)
+
+    def discard(self, session_id: str):
+        """Libera a sessão da memória local; o histórico continua no banco."""
+        self._cache.discard(session_id)
+
+    def delete(self, session_id: str):
+        """Apaga o histórico da sessão do banco e da memória."""
+        with self._db_lock:
+            self._pending = [p for p in self._pending if p[0] != session_id]
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM messages WHERE session_id = ?", (session_id,)
+                )
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE session_id = ?", (session_id,)
+                )
+            self._cache.discard(session_id)
+
+    # ------------------------------------------------------------------
+    # Write-behind
+    # ------------------------------------------------------------------
+
+    def _touch_sessions(self, session_ids, now: float):
+        self._conn.executemany(
+            "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET last_access = excluded.last_access",
+            [(session_id, now) for session_id in session_ids],
+        )
+
+    def flush(self) -> int:
+        """Grava as mensagens pendentes; devolve quantas foram gravadas."""
+        with self._db_lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            sessions = {p[0] for p in pending}
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO messages (session_id, role, content) "
+                        "VALUES (?, ?, ?)",
+                        [p[:3] for p in pending],
+                    )
+                    # Mantém só as últimas `history` mensagens de cada sessão
+                    self._conn.executemany(
+                        "DELETE FROM messages WHERE session_id = ? AND id <= ("
+                        "SELECT id FROM messages WHERE session_id = ? "
+                        "ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                        [(s, s, self.history) for s in sessions],
+                    )
+                    self._touch_sessions(sessions, pending[-1][3])
+            except sqlite3.Error as e:
+                # Devolve para a próxima tentativa, na ordem original
+                self._pending[:0] = pending
+                session_store_writes.labels(result="error").inc(len(pending))
+                log_error(f"Erro ao gravar a memória de sessões no SQLite: {e}")
+                return 0
+        session_store_writes.labels(result="flushed").inc(len(pending))
+        return len(pending)
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Apaga do banco as sessões sem atividade há mais de `ttl` segundos."""
+        if not self.ttl:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.ttl
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_access < ?)",
+                (cutoff,),
+            )
+            return self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (cutoff,)
+            ).rowcount
+
+    def _ensure_started(self):
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="polaris-session-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.time() - self._last_purge > _PURGE_INTERVAL:
+                self._last_purge = time.time()
+                try:
+                    expired = self.purge_expired()
+                    if expired:
+                        log_info(f"🧹 {expired} sessões expiradas apagadas do SQLite.")
+                except sqlite3.Error as e:
+                    log_error(f"Erro ao expirar sessões no SQLite: {e}")
+
+    def close(self):
+        """Grava o que está pendente e fecha o banco."""
+        self._closing = True
+        self._wake.set()
+        with self._thread_lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+
+class RedisSessionStore:
+    """Conversa recente num Redis compartilhado por todos os workers.
+
+    Cada sessão é uma lista (RPUSH + LTRIM mantêm as últimas `history`
+    mensagens) com EXPIRE de `ttl` segundos; cada leitura ou turno é um
+    único round trip. `client` permite injetar outro cliente compatível
+    (ex.: um substituto local nos testes); sem ele, o pacote `redis` é
+    necessário.
+    """
+
+    def __init__(
+        self,
+        history: int,
+        url: str = SESSION_REDIS_URL,
+        ttl: float = SESSION_TTL_SECONDS,
+        client=None,
+        prefix: str = "polaris:session:",
+    ):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.history = history
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = client
+
+    def _key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def _push(self, session_id: str, messages, reset: bool = False):
+        key = self._key(session_id)
+        pipe = self._client.pipeline()
+        if reset:
+            pipe.delete(key)
+        if messages:
+            pipe.rpush(
+                key, *[json.dumps([role, content]) for role, content in messages]
+            )
+            pipe.ltrim(key, -self.history, -1)
+            if self.ttl:
+                pipe.expire(key, int(self.ttl))
+        pipe.execute()
+
+    def messages(self, session_id: str) -> List[Message]:
+        return [
+            Message(*json.loads(raw))
+            for raw in self._client.lrange(self._key(session_id), 0, -1)
+        ]
+
+    def append(self, session_id: str, role: str, content: str):
+        self._push(session_id, [(role, content)])
+
+    def save_turn(self, session_id: str, user_input: str, response: str):
+        self._push(session_id, [(USER, user_input), (ASSISTANT, response)])
+
+    def replace(self, session_id: str, messages: List[Message]):
+        self._push(session_id, [(m.role, m.content) for m in messages], reset=True)
+
+    def discard(self, session_id: str):
+        """Nada em memória local: a sessão continua no Redis."""
+
+    def delete(self, session_id: str):
+        self._client.delete(self._key(session_id))
+
+    def close(self):
+        self._client.close()
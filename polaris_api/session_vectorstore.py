@@ -0,0 +1,337 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import chromadb
+import numpy as np
+from chromadb.config import Settings
+from chromadb.errors import NotFoundError
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from polaris_logger import log_info, log_success
+from polaris_metrics import vector_partitions_open, vector_partition_opens
+
+# "session": uma coleção por sessão; "bucket": sessões espalhadas em
+# VECTOR_PARTITION_BUCKETS coleções por hash (ainda filtradas por session_id)
+VECTOR_PARTITION_MODE = os.getenv("VECTOR_PARTITION_MODE", "session")
+VECTOR_PARTITION_BUCKETS = int(os.getenv("VECTOR_PARTITION_BUCKETS", 64))
+VECTOR_PARTITION_CACHE = int(os.getenv("VECTOR_PARTITION_CACHE", 256))
+# Limite de memória dos índices HNSW carregados pelo Chroma (0 = sem limite)
+VECTOR_MEMORY_LIMIT_MB = int(os.getenv("VECTOR_MEMORY_LIMIT_MB", 0))
+VECTOR_MIGRATE_BATCH = int(os.getenv("VECTOR_MIGRATE_BATCH", 1000))
+
+# Coleção única usada antes do particionamento (padrão do langchain_chroma)
+LEGACY_COLLECTION = "langchain"
+DEFAULT_SESSION = "default_session"
+COMPACT_SUFFIX = "_compact"
+
+
+def make_client(path: str):
+    settings = Settings(anonymized_telemetry=False)
+    if VECTOR_MEMORY_LIMIT_MB > 0:
+        # O Chroma descarrega os índices menos usados ao passar do limite
+        settings = Settings(
+            anonymized_telemetry=False,
+            chroma_segment_cache_policy="LRU",
+            chroma_memory_limit_bytes=VECTOR_MEMORY_LIMIT_MB * 1024 * 1024,
+        )
+    return chromadb.PersistentClient(path=path, settings=settings)
+
+
+class SessionVectorStore:
+    """Vectorstore particionado por sessão sobre um único PersistentClient.
+
+    Cada sessão (ou bucket de sessões) tem sua própria coleção, então a
+    busca percorre só os vetores daquela sessão, não os de todo o
+    deployment. As coleções são abertas sob demanda e os handles ficam
+    numa LRU de `cache_size` entradas. Expõe o subconjunto da API do
+    Chroma usado pela Polaris: similarity_search, add_texts e get.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding_function,
+        mode: str = VECTOR_PARTITION_MODE,
+        buckets: int = VECTOR_PARTITION_BUCKETS,
+        cache_size: int = VECTOR_PARTITION_CACHE,
+        client=None,
+    ):
+        if mode not in ("session", "bucket"):
+            raise ValueError(f"VECTOR_PARTITION_MODE inválido: {mode}")
+        self.client = client or make_client(path)
+        self.embedding_function = embedding_function
+        self.mode = mode
+        self.buckets = buckets
+        self.cache_size = cache_size
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        # Escritas numa partição param enquanto ela é compactada (cópia +
+        # troca); as demais partições seguem gravando
+        self._write_locks = {}
+        # Abrir uma coleção espera a troca (apagar + renomear) da compactação
+        self._swap_lock = threading.Lock()
+
+    def partition_name(self, session_id: str) -> str:
+        """Nome da coleção da sessão (nomes do Chroma aceitam só [a-zA-Z0-9._-])."""
+        digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8)
+        if self.mode == "bucket":
+            return f"polaris_b{int(digest.hexdigest(), 16) % self.buckets:04d}"
+        return f"polaris_s{digest.hexdigest()}"
+
+    def _partition(self, session_id: str, create: bool = True) -> Optional[Chroma]:
+        return self._open(self.partition_name(session_id), create)
+
+    def _open(self, name: str, create: bool = True) -> Optional[Chroma]:
+        with self._lock:
+            store = self._handles.get(name)
+            if store is not None:
+                self._handles.move_to_end(name)
+                vector_partition_opens.labels(result="cached").inc()
+                return store
+
+        with self._swap_lock:
+            if not create:
+                # Leitura de sessão sem dados não deve criar coleção vazia
+                try:
+                    self.client.get_collection(name)
+                except NotFoundError:
+                    return None
+
+            store = Chroma(
+                client=self.client,
+                collection_name=name,
+                embedding_function=self.embedding_function,
+            )
+            vector_partition_opens.labels(result="opened").inc()
+            with self._lock:
+                store = self._handles.setdefault(name, store)
+                self._handles.move_to_end(name)
+                while len(self._handles) > self.cache_size:
+                    self._handles.popitem(last=False)
+                vector_partitions_open.set(len(self._handles))
+        return store
+
+    def _write_lock(self, name: str) -> threading.Lock:
+        """Trava de escrita da partição (uma por nome, criada sob demanda)."""
+        with self._lock:
+            return self._write_locks.setdefault(name, threading.Lock())
+
+    def _session_filter(self, where: Optional[dict]) -> Optional[dict]:
+        """No modo sessão a coleção já é da sessão: o filtro só por session_id cai."""
+        if self.mode == "session" and where and set(where) == {"session_id"}:
+            return None
+        return where
+
+    @staticmethod
+    def _session_of(where: Optional[dict]) -> str:
+        if not where or "session_id" not in where:
+            raise ValueError("Consultas ao vectorstore precisam de session_id.")
+        return where["session_id"]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs
+    ) -> List[Document]:
+        store = self._partition(self._session_of(filter), create=False)
+        if store is None:
+            return []
+        return store.similarity_search(
+            query, k=k, filter=self._session_filter(filter), **kwargs
+        )
+
+    def add_texts(self, texts, metadatas=None, **kwargs) -> List[str]:
+        """Agrupa os textos por sessão e grava um lote por partição."""
+        metadatas = metadatas or [{} for _ in texts]
+        groups = OrderedDict()
+        for text, metadata in zip(texts, metadatas):
+            session_id = metadata.get("session_id", DEFAULT_SESSION)
+            groups.setdefault(session_id, ([], []))
+            groups[session_id][0].append(text)
+            groups[session_id][1].append(metadata)
+
+        ids = []
+        for session_id, (group_texts, group_metadatas) in groups.items():
+            with self._write_lock(self.partition_name(session_id)):
+                ids.extend(
+                    self._partition(session_id).add_texts(
+                        texts=group_texts, metadatas=group_metadatas, **kwargs
+                    )
+                )
+        return ids
+
+    def get(self, where: Optional[dict] = None, **kwargs) -> dict:
+        store = self._partition(self._session_of(where), create=False)
+        if store is None:
+            return {"ids": [], "documents": [], "metadatas": []}
+        return store.get(where=self._session_filter(where), **kwargs)
+
+    def count(self, session_id: str) -> int:
+        """Quantos vetores a sessão tem (barato no modo sessão)."""
+        store = self._partition(session_id, create=False)
+        if store is None:
+            return 0
+        if self.mode == "session":
+            return store._collection.count()
+        return len(store.get(where={"session_id": session_id}, include=[])["ids"])
+
+    def embeddings(self, session_id: str, ids) -> List[Optional[np.ndarray]]:
+        """Vetores já gravados dos ids da sessão (evita recalcular embeddings)."""
+        store = self._partition(session_id, create=False)
+        if store is None or not ids:
+            return [None] * len(ids)
+        found = store._collection.get(ids=list(ids), include=["embeddings"])
+        by_id = {
+            record_id: np.asarray(vector, dtype=np.float32)
+            for record_id, vector in zip(found["ids"], found["embeddings"])
+        }
+        return [by_id.get(record_id) for record_id in ids]
+
+    def delete_session(self, session_id: str):
+        """Apaga todos os vetores da sessão."""
+        name = self.partition_name(session_id)
+        with self._lock:
+            self._handles.pop(name, None)
+            vector_partitions_open.set(len(self._handles))
+        if self.mode == "session":
+            try:
+                self.client.delete_collection(name)
+            except NotFoundError:
+                pass
+            return
+        try:
+            collection = self.client.get_collection(name)
+        except NotFoundError:
+            return
+        collection.delete(where={"session_id": session_id})
+
+    # ------------------------------------------------------------------
+    # Manutenção (retenção e compactação)
+    # ------------------------------------------------------------------
+
+    def partition_names(self) -> List[str]:
+        names = [
+            c if isinstance(c, str) else c.name for c in self.client.list_collections()
+        ]
+        for name in names:
+            base = name[: -len(COMPACT_SUFFIX)]
+            if name.endswith(COMPACT_SUFFIX) and base not in names:
+                # Compactação interrompida depois de apagar a original: restaura
+                self.client.get_collection(name).modify(name=base)
+                names.append(base)
+        return sorted(
+            n
+            for n in names
+            if n.startswith("polaris_") and not n.endswith(COMPACT_SUFFIX)
+        )
+
+    def partition_records(self, name: str) -> dict:
+        """ids e metadados de toda a partição (sem documentos nem vetores)."""
+        store = self._open(name, create=False)
+        if store is None:
+            return {"ids": [], "metadatas": []}
+        return store.get(include=["metadatas"])
+
+    def delete_records(self, name: str, ids: List[str]):
+        store = self._open(name, create=False)
+        if store is not None and ids:
+            with self._write_lock(name):
+                for start in range(0, len(ids), VECTOR_MIGRATE_BATCH):
+                    store.delete(ids=ids[start : start + VECTOR_MIGRATE_BATCH])
+
+    def compact_partition(self, name: str):
+        """Recria a coleção com os vetores vivos, descartando o índice HNSW antigo.
+
+        O Chroma só marca os vetores apagados no índice; copiar para uma
+        coleção nova devolve o espaço e reconstrói o grafo sem os buracos.
+        Os embeddings são copiados, não recalculados.
+        """
+        temp = name + COMPACT_SUFFIX
+        with self._write_lock(name):
+            try:
+                source = self.client.get_collection(name)
+            except NotFoundError:
+                return
+            try:
+                self.client.delete_collection(temp)
+            except NotFoundError:
+                pass
+            target = self.client.create_collection(temp, metadata=source.metadata)
+            offset = 0
+            while True:
+                page = source.get(
+                    include=["documents", "metadatas", "embeddings"],
+                    limit=VECTOR_MIGRATE_BATCH,
+                    offset=offset,
+                )
+                if not page["ids"]:
+                    break
+                offset += len(page["ids"])
+                target.add(
+                    ids=page["ids"],
+                    embeddings=page["embeddings"],
+                    documents=page["documents"],
+                    metadatas=[m or None for m in page["metadatas"]],
+                )
+            # Sem a trava, um _open entre o delete e o rename abriria (ou
+            # criaria vazia) a coleção que está sendo trocada
+            with self._swap_lock:
+                with self._lock:
+                    self._handles.pop(name, None)
+                    vector_partitions_open.set(len(self._handles))
+                self.client.delete_collection(name)
+                target.modify(name=name)
+
+    def migrate_legacy(
+        self,
+        collection_name: str = LEGACY_COLLECTION,
+        batch: int = VECTOR_MIGRATE_BATCH,
+    ) -> int:
+        """Move a coleção global antiga para as partições, sem recalcular embeddings.
+
+        Usa upsert com os ids originais, então pode ser interrompida e
+        executada de novo. A coleção antiga só é apagada no final.
+        """
+        try:
+            legacy = self.client.get_collection(collection_name)
+        except NotFoundError:
+            return 0
+
+        total = legacy.count()
+        if total:
+            log_info(f"🚚 Migrando {total} vetores para coleções por sessão...")
+        moved = 0
+        offset = 0
+        while True:
+            page = legacy.get(
+                include=["documents", "metadatas", "embeddings"],
+                limit=batch,
+                offset=offset,
+            )
+            if not page["ids"]:
+                break
+            offset += len(page["ids"])
+
+            groups = {}
+            for i, record_id in enumerate(page["ids"]):
+                metadata = page["metadatas"][i] or {}
+                session_id = metadata.get("session_id", DEFAULT_SESSION)
+                group = groups.setdefault(session_id, ([], [], [], []))
+                group[0].append(record_id)
+                group[1].append(page["embeddings"][i])
+                group[2].append(page["documents"][i])
+                group[3].append(metadata or None)
+
+            for session_id, (ids, embeddings, documents, metadatas) in groups.items():
+                self._partition(session_id)._collection.upsert(
+                    ids=ids,
+                    embeddings=embeddings,
+                    documents=documents,
+                    metadatas=metadatas,
+                )
+                moved += len(ids)
+
+        self.client.delete_collection(collection_name)
+        log_success(f"✅ {moved} vetores migrados para coleções por sessão")
+        return moved
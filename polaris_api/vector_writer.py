@@ -0,0 +1,146 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from polaris_logger import log_info, log_success, log_warning, log_error
+from polaris_metrics import (
+    vector_write_queue_depth,
+    vector_writes,
+    vector_write_duration,
+)
+
+VECTOR_WRITE_BATCH = int(os.getenv("VECTOR_WRITE_BATCH", 32))
+VECTOR_WRITE_INTERVAL = float(os.getenv("VECTOR_WRITE_INTERVAL", 2.0))
+VECTOR_WRITE_QUEUE = int(os.getenv("VECTOR_WRITE_QUEUE", 10000))
+
+_SENTINEL = object()
+
+
+class VectorWriter:
+    """Write-behind das inserções no vectorstore, fora do caminho da resposta.
+
+    submit() só enfileira; uma thread junta os textos pendentes e grava
+    tudo com um único add_texts (um embed_documents + uma escrita no
+    Chroma) quando o lote enche ou quando `interval` segundos se passam
+    desde o primeiro item. close() drena a fila antes de encerrar.
+
+    Com um `index` (ContentIndex), textos que a sessão já tem no
+    vectorstore são descartados na thread de escrita, antes do embedding.
+    """
+
+    def __init__(
+        self,
+        get_store: Callable,
+        batch_size: int = VECTOR_WRITE_BATCH,
+        interval: float = VECTOR_WRITE_INTERVAL,
+        max_queue: int = VECTOR_WRITE_QUEUE,
+        index=None,
+    ):
+        # Resolve o vectorstore a cada lote (permite trocá-lo em runtime/testes)
+        self._get_store = get_store
+        self.batch_size = batch_size
+        self.interval = interval
+        self.index = index
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="polaris-vector-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, text: str, metadata: Optional[dict] = None) -> bool:
+        """Enfileira um texto para o vectorstore; retorna False se a fila está cheia."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((text, metadata or {}))
+        except queue.Full:
+            vector_writes.labels(result="dropped").inc()
+            log_warning("⚠️ Fila de escrita do ChromaDB cheia, texto descartado.")
+            return False
+        vector_write_queue_depth.set(self._queue.qsize())
+        return True
+
+    def close(self, timeout: Optional[float] = None):
+        """Drena os textos pendentes e para a thread de escrita."""
+        with self._lock:
+            thread = self._thread
+        if thread is None or not thread.is_alive():
+            return
+        log_info(f"💾 Drenando {self.pending} escritas pendentes no ChromaDB...")
+        self._queue.put(_SENTINEL)
+        thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _SENTINEL:
+                return
+
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _SENTINEL:
+                    stop = True
+                    break
+                batch.append(item)
+
+            vector_write_queue_depth.set(self._queue.qsize())
+            self._write(batch)
+            if stop:
+                return
+
+    def _dedupe(self, batch):
+        unique = []
+        for text, metadata in batch:
+            hashes = self.index.claim(
+                metadata.get("session_id", ""), text, kind="response"
+            )
+            if hashes is None:
+                vector_writes.labels(result="duplicate").inc()
+                continue
+            unique.append((text, {**metadata, **hashes}))
+        return unique
+
+    def _write(self, batch):
+        if self.index is not None:
+            batch = self._dedupe(batch)
+            if not batch:
+                return
+        texts = [text for text, _ in batch]
+        metadatas = [metadata for _, metadata in batch]
+        start = time.time()
+        try:
+            self._get_store().add_texts(texts=texts, metadatas=metadatas)
+        except Exception as e:
+            vector_writes.labels(result="failed").inc(len(batch))
+            if self.index is not None:
+                # Os hashes reservados não chegaram ao Chroma
+                for session_id in {m.get("session_id", "") for m in metadatas}:
+                    self.index.forget(session_id)
+            log_error(f"Erro ao gravar lote de {len(batch)} textos no ChromaDB: {e}")
+            return
+        duration = time.time() - start
+        vector_writes.labels(result="written").inc(len(batch))
+        vector_write_duration.observe(duration)
+        log_success(
+            f"🧠 {len(batch)} textos registrados no ChromaDB", duration=duration
+        )
@@ -1,5 +1,6 @@
 import os
 import uuid
+import asyncio
 import shutil
 import logging
 import requests
@@ -163,6 +164,45 @@ async def handle_audio(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("⚠️ Erro ao processar o áudio.")
 
 
+PDF_STATUS_POLL_SECONDS = float(os.getenv("PDF_STATUS_POLL_SECONDS", 5))
+PDF_STATUS_TIMEOUT = float(os.getenv("PDF_STATUS_TIMEOUT", 1800))
+
+
+def upload_pdf_to_polaris(file_path, file_name, chat_id):
+    with open(file_path, "rb") as f:
+        files = {
+            "file": (file_name, f, "application/pdf"),
+            "session_id": (None, str(chat_id)),
+        }
+        return requests.post(
+            POLARIS_API_URL.replace("/inference/", "/upload-pdf/"), files=files
+        )
+
+
+async def notify_pdf_indexed(bot, chat_id, status_url):
+    """Acompanha o job de indexação e avisa o chat quando terminar."""
+    base_url = POLARIS_API_URL.replace("/inference/", "")
+    deadline = time.time() + PDF_STATUS_TIMEOUT
+    while time.time() < deadline:
+        await asyncio.sleep(PDF_STATUS_POLL_SECONDS)
+        try:
+            r = await asyncio.to_thread(requests.get, base_url + status_url, timeout=10)
+            status = r.json()
+        except Exception as e:
+            log_error(f"Erro ao consultar status do PDF: {e}")
+            continue
+        if status.get("status") == "done":
+            await bot.send_message(
+                chat_id,
+                f"✅ PDF indexado: {status.get('pages_processed')} páginas, "
+                f"{status.get('chunks_embedded')} trechos.",
+            )
+            return
+        if status.get("status") == "failed":
+            await bot.send_message(chat_id, "⚠️ Erro ao indexar PDF.")
+            return
+
+
 async def handle_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.message.chat_id
     doc = update.message.document
@@ -175,17 +215,18 @@ async def handle_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
     new_file = await context.bot.get_file(doc.file_id)
     await new_file.download_to_drive(file_path)
 
-    with open(file_path, "rb") as f:
-        files = {
-            "file": (doc.file_name, f, "application/pdf"),
-            "session_id": (None, str(chat_id)),
-        }
-        r = requests.post(
-            POLARIS_API_URL.replace("/inference/", "/upload-pdf/"), files=files
-        )
+    # requests é bloqueante: roda numa thread para não travar o bot
+    r = await asyncio.to_thread(upload_pdf_to_polaris, file_path, doc.file_name, chat_id)
 
-    if r.status_code == 200:
-        await update.message.reply_text("✅ PDF processado com sucesso!")
+    if r.status_code in (200, 202):
+        data = r.json()
+        if data.get("status_url"):
+            await update.message.reply_text("📥 PDF recebido! Indexando em segundo plano...")
+            context.application.create_task(
+                notify_pdf_indexed(context.bot, chat_id, data["status_url"])
+            )
+        else:
+            await update.message.reply_text("✅ PDF processado com sucesso!")
     else:
         await update.message.reply_text("⚠️ Erro ao processar PDF.")
 
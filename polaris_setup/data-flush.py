@@ -1,12 +1,18 @@
+import argparse
 import os
 import shutil
+import sys
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
 load_dotenv(dotenv_path="../polaris_api/.env")
+sys.path.insert(0, "../polaris_api")
 
 MONGO_URI = os.getenv("MONGO_URI")
 CHROMA_DB_PATH = "../polaris_api/chroma_db"
+VECTOR_DB_PATH = "../polaris_api/vector_db"
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+SESSION_DB_PATH = "../polaris_api/session_db"
 
 client = MongoClient(MONGO_URI)
 db = client["polaris_db"]
@@ -17,6 +23,9 @@ def flush_mongo():
     """Apaga todos os documentos do MongoDB"""
     result = collection.delete_many({})
     print(f"🗑️  MongoDB limpo! {result.deleted_count} documentos apagados.")
+    if os.path.exists(SESSION_DB_PATH):
+        shutil.rmtree(SESSION_DB_PATH, ignore_errors=True)
+        print("🗑️  Memória recente das sessões (SQLite) apagada!")
 
 
 def flush_chroma():
@@ -26,6 +35,50 @@ def flush_chroma():
         print("🗑️  Vetores do ChromaDB apagados!")
     else:
         print("ℹ️  Nenhuma pasta chroma_db encontrada.")
+    if os.path.exists(VECTOR_DB_PATH):
+        shutil.rmtree(VECTOR_DB_PATH, ignore_errors=True)
+        print("🗑️  Vetores do backend NumPy apagados!")
+
+
+def open_vectorstore():
+    """Abre o vectorstore particionado da API (sem modelo de embeddings)."""
+    if VECTOR_BACKEND == "numpy":
+        from numpy_vectorstore import NumpyVectorStore
+
+        return NumpyVectorStore(VECTOR_DB_PATH, embedding_function=None)
+    from session_vectorstore import SessionVectorStore
+
+    return SessionVectorStore(CHROMA_DB_PATH, embedding_function=None)
+
+
+def flush_session(session_id):
+    """Apaga conversas e vetores de uma única sessão"""
+    result = collection.delete_many({"session_id": session_id})
+    print(
+        f"🗑️  MongoDB: {result.deleted_count} documentos da sessão '{session_id}' apagados."
+    )
+    if VECTOR_BACKEND == "numpy" or os.path.exists(CHROMA_DB_PATH):
+        open_vectorstore().delete_session(session_id)
+        print(f"🗑️  Vetores da sessão '{session_id}' apagados!")
+    sessions_db = os.path.join(SESSION_DB_PATH, "sessions.sqlite3")
+    if os.path.exists(sessions_db):
+        from session_store import SQLiteSessionStore
+
+        store = SQLiteSessionStore(sessions_db, history=1)
+        store.delete(session_id)
+        store.close()
+        print(f"🗑️  Memória recente da sessão '{session_id}' apagada!")
+
+
+def run_retention():
+    """Executa uma passada de retenção + compactação agora (API pode estar parada)"""
+    from retention import RetentionEngine
+
+    stats = RetentionEngine(open_vectorstore).run_once()
+    print(
+        f"🧹 {stats['deleted']} respostas expiradas, "
+        f"{stats['compacted']} partições compactadas."
+    )
 
 
 def flush_geral():
@@ -35,7 +88,7 @@ def flush_geral():
     print("✅ Polaris zerada e pronta pra nova jornada!")
 
 
-if __name__ == "__main__":
+def menu():
     print(
         """
 ==== Polaris Flush Tool ====
@@ -55,3 +108,21 @@ if __name__ == "__main__":
         flush_geral()
     else:
         print("⚠️ Opção inválida.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Polaris Flush Tool")
+    parser.add_argument("--session", help="apaga só esta sessão (Mongo + vetores)")
+    parser.add_argument(
+        "--retention",
+        action="store_true",
+        help="expira respostas antigas e compacta o vectorstore",
+    )
+    args = parser.parse_args()
+
+    if args.session:
+        flush_session(args.session)
+    elif args.retention:
+        run_retention()
+    else:
+        menu()
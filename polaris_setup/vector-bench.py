@@ -0,0 +1,106 @@
+"""Benchmark dos backends de vetores: Chroma por sessão x NumPy (float16/int8).
+
+Uso: python vector-bench.py [--vectors 2000] [--dim 384] [--queries 200]
+
+Usa embeddings sintéticos (sem baixar modelo) para medir só o custo do
+backend: tempo de gravação, latência de busca (p50/p95) e recall@10 em
+relação à busca exata.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "polaris_api"))
+
+from numpy_vectorstore import NumpyVectorStore  # noqa: E402
+from session_vectorstore import SessionVectorStore  # noqa: E402
+
+
+class TableEmbeddings(Embeddings):
+    """Embeddings pré-calculados: texto "i" -> linha i da tabela."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def embed_documents(self, texts):
+        return [self.table[int(t)].tolist() for t in texts]
+
+    def embed_query(self, text):
+        return self.table[int(text)].tolist()
+
+
+def run(name, store, n, queries, batch=256):
+    start = time.perf_counter()
+    for i in range(0, n, batch):
+        ids = range(i, min(i + batch, n))
+        store.add_texts(
+            [str(j) for j in ids], metadatas=[{"session_id": "bench"} for _ in ids]
+        )
+    add_seconds = time.perf_counter() - start
+
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        docs = store.similarity_search(str(q), k=10, filter={"session_id": "bench"})
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append({int(d.page_content) for d in docs})
+    p50, p95 = np.percentile(latencies, [50, 95])
+    print(
+        f"{name:<16} gravação {n / add_seconds:>9.0f} vet/s   "
+        f"busca p50 {p50:7.2f} ms   p95 {p95:7.2f} ms"
+    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    centers = rng.normal(size=(50, args.dim))
+    data = centers[rng.integers(0, 50, args.vectors)] + 0.7 * rng.normal(
+        size=(args.vectors, args.dim)
+    )
+    query_rows = rng.integers(0, args.vectors, args.queries)
+    table = np.vstack(
+        [data, data[query_rows] + 0.3 * rng.normal(size=(args.queries, args.dim))]
+    ).astype(np.float32)
+    embeddings = TableEmbeddings(table)
+    queries = list(range(args.vectors, args.vectors + args.queries))
+
+    normalized = table / np.linalg.norm(table, axis=1, keepdims=True)
+    exact = [
+        set(np.argsort(-(normalized[: args.vectors] @ normalized[q]))[:10])
+        for q in queries
+    ]
+
+    print(f"📊 {args.vectors} vetores × {args.dim} dims, {args.queries} buscas\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [
+            ("chroma", SessionVectorStore(os.path.join(tmp, "chroma"), embeddings)),
+            (
+                "numpy-float16",
+                NumpyVectorStore(os.path.join(tmp, "f16"), embeddings, dtype="float16"),
+            ),
+            (
+                "numpy-int8",
+                NumpyVectorStore(os.path.join(tmp, "i8"), embeddings, dtype="int8"),
+            ),
+        ]
+        for name, store in backends:
+            results = run(name, store, args.vectors, queries)
+            recall = np.mean([len(r & e) / 10 for r, e in zip(results, exact)])
+            print(f"{'':<16} recall@10 {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,10 @@ import sys
 # Adicionar o diretório polaris_api ao path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "polaris_api"))
 
+# Importar polaris_main não deve criar arquivos em ./session_db
+os.environ.setdefault("SESSION_BACKEND", "memory")
+os.environ.setdefault("DEDUP_DIGEST_DB", ":memory:")
+
 
 @pytest.fixture
 def mock_env_vars():
@@ -0,0 +1,122 @@
+import threading
+from unittest.mock import Mock
+
+# Importar módulos da API
+from content_index import ContentIndex, FileDigestStore, content_hash, simhash
+
+
+def _store(documents=(), metadatas=None):
+    store = Mock()
+    store.get.return_value = {
+        "documents": list(documents),
+        "metadatas": metadatas or [{} for _ in documents],
+    }
+    return store
+
+
+class TestContentIndex:
+    """Testes para o índice de hashes por sessão"""
+
+    def test_exact_duplicate_is_skipped(self):
+        """Testa se o mesmo texto (mesmo com espaços diferentes) é rejeitado"""
+        index = ContentIndex(lambda: _store())
+
+        primeiro = index.claim("s1", "Olá,  mundo\n")
+        assert primeiro == {"content_hash": content_hash("Olá, mundo")}
+        assert index.claim("s1", "Olá, mundo") is None
+        # Outra sessão tem seu próprio índice
+        assert index.claim("s2", "Olá, mundo") is not None
+
+    def test_index_is_rebuilt_from_store(self):
+        """Testa se hashes já gravados (ou documentos antigos sem hash) são carregados"""
+        store = _store(
+            ["antigo sem hash", "novo"],
+            [{"session_id": "s1"}, {"content_hash": content_hash("novo")}],
+        )
+        index = ContentIndex(lambda: store)
+
+        assert index.claim("s1", "antigo sem hash") is None
+        assert index.claim("s1", "novo") is None
+        assert index.claim("s1", "inédito") is not None
+        store.get.assert_called_once_with(
+            where={"session_id": "s1"}, include=["documents", "metadatas"]
+        )
+
+    def test_near_duplicate_with_simhash(self):
+        """Testa se quase-duplicatas são rejeitadas só com simhash ativo"""
+        base = " ".join(f"palavra{i}" for i in range(60))
+        quase = base + " fim"
+        assert bin(simhash(base) ^ simhash(quase)).count("1") <= 6
+
+        exato = ContentIndex(lambda: _store())
+        assert exato.claim("s1", base) is not None
+        assert exato.claim("s1", quase) is not None
+
+        aproximado = ContentIndex(lambda: _store(), simhash_distance=6)
+        assert "simhash" in aproximado.claim("s1", base)
+        assert aproximado.claim("s1", quase) is None
+        assert aproximado.claim("s1", "um assunto completamente diferente") is not None
+
+    def test_lru_and_forget_reload_sessions(self):
+        """Testa se sessões antigas saem da memória e são recarregadas do Chroma"""
+        store = _store()
+        index = ContentIndex(lambda: store, max_sessions=1)
+
+        index.claim("s1", "a")
+        index.claim("s2", "b")
+        index.forget("s2")
+        index.claim("s2", "c")
+
+        assert [c.kwargs["where"] for c in store.get.call_args_list] == [
+            {"session_id": "s1"},
+            {"session_id": "s2"},
+            {"session_id": "s2"},
+        ]
+
+    def test_file_digest(self):
+        """Testa o registro de hash de arquivo inteiro"""
+        index = ContentIndex(lambda: _store([], []))
+        assert not index.has_digest("s1", "abc")
+        index.add_digest("s1", "abc")
+        assert index.has_digest("s1", "abc")
+
+    def test_file_digest_survives_restart(self, tmp_path):
+        """Testa se o hash do arquivo persiste sem nenhum trecho no Chroma"""
+        path = str(tmp_path / "digests.sqlite3")
+        index = ContentIndex(lambda: _store(), digests=FileDigestStore(path))
+        index.add_digest("s1", "abc")
+
+        # Novo processo: o Chroma não tem file_hash (nenhum lote foi gravado)
+        reiniciado = ContentIndex(lambda: _store(), digests=FileDigestStore(path))
+        assert reiniciado.has_digest("s1", "abc")
+        assert not reiniciado.has_digest("s2", "abc")
+
+    def test_cold_load_does_not_block_other_sessions(self):
+        """Testa se a carga lenta de uma sessão não trava o dedup das outras"""
+        liberar = threading.Event()
+        carregando = threading.Event()
+
+        def get(where, include):
+            if where["session_id"] == "lenta":
+                carregando.set()
+                assert liberar.wait(timeout=5)
+            return {"documents": [], "metadatas": []}
+
+        store = Mock()
+        store.get.side_effect = get
+        index = ContentIndex(lambda: store)
+        lenta = threading.Thread(target=index.claim, args=("lenta", "texto"))
+        lenta.start()
+        assert carregando.wait(timeout=5)
+
+        # Com a sessão "lenta" ainda carregando, outra sessão segue
+        resultado = []
+        rapida = threading.Thread(
+            target=lambda: resultado.append(index.claim("rapida", "texto"))
+        )
+        rapida.start()
+        rapida.join(timeout=1)
+        assert resultado and resultado[0] is not None
+        liberar.set()
+        lenta.join(timeout=5)
+        assert index.claim("lenta", "texto") is None
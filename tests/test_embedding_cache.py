@@ -0,0 +1,78 @@
+from unittest.mock import Mock
+
+# Importar módulos da API
+from embedding_cache import CachedEmbeddings
+
+
+def _fake_embeddings():
+    """Embeddings falsos: vetor derivado do tamanho do texto"""
+    embeddings = Mock(spec=["embed_documents", "embed_query"])
+    embeddings.embed_documents.side_effect = lambda texts: [
+        [float(len(t)), 1.0, 0.5] for t in texts
+    ]
+    embeddings.embed_query.side_effect = lambda text: [float(len(text)), 1.0, 0.5]
+    return embeddings
+
+
+class TestCachedEmbeddings:
+    """Testes para o cache de embeddings por hash do conteúdo"""
+
+    def test_query_reuses_document_embedding(self):
+        """Testa se o texto embutido na ingestão não é recalculado na busca"""
+        base = _fake_embeddings()
+        cache = CachedEmbeddings(base, namespace="minilm", cache_dir="")
+
+        cache.embed_documents(["olá polaris"])
+        vector = cache.embed_query("olá polaris")
+
+        assert vector == [11.0, 1.0, 0.5]
+        base.embed_query.assert_not_called()
+
+    def test_batch_only_embeds_missing_texts(self):
+        """Testa se só os textos ausentes (sem repetição) vão para o modelo"""
+        base = _fake_embeddings()
+        cache = CachedEmbeddings(base, namespace="minilm", cache_dir="")
+        cache.embed_documents(["a"])
+
+        result = cache.embed_documents(["a", "bb", "bb"])
+
+        assert result == [[1.0, 1.0, 0.5], [2.0, 1.0, 0.5], [2.0, 1.0, 0.5]]
+        assert base.embed_documents.call_args_list[-1].args == (["bb"],)
+
+    def test_memory_lru_is_bounded(self):
+        """Testa se a LRU em memória respeita a capacidade"""
+        cache = CachedEmbeddings(
+            _fake_embeddings(), namespace="minilm", capacity=2, cache_dir=""
+        )
+
+        cache.embed_documents(["a", "bb", "ccc"])
+
+        assert len(cache._memory) == 2
+
+    def test_disk_tier_survives_restart(self, tmp_path):
+        """Testa se o tier em disco devolve vetores depois de recriar o cache"""
+        cache = CachedEmbeddings(
+            _fake_embeddings(), namespace="minilm", cache_dir=str(tmp_path)
+        )
+        cache.embed_documents(["persistido"])
+        cache.close()
+
+        base = _fake_embeddings()
+        restarted = CachedEmbeddings(base, namespace="minilm", cache_dir=str(tmp_path))
+
+        assert restarted.embed_query("persistido") == [10.0, 1.0, 0.5]
+        base.embed_query.assert_not_called()
+
+    def test_namespace_change_invalidates_disk(self, tmp_path):
+        """Testa se trocar o modelo não reaproveita vetores antigos"""
+        cache = CachedEmbeddings(
+            _fake_embeddings(), namespace="minilm", cache_dir=str(tmp_path)
+        )
+        cache.embed_documents(["texto"])
+        cache.close()
+
+        base = _fake_embeddings()
+        outro = CachedEmbeddings(base, namespace="mpnet", cache_dir=str(tmp_path))
+        outro.embed_query("texto")
+
+        base.embed_query.assert_called_once()
@@ -0,0 +1,199 @@
+import ctypes
+import itertools
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+pytest.importorskip("llama_cpp")
+
+# Importar módulos da API
+import llm_batch
+from llm_batch import BatchedLlamaRunnable
+
+# Token 0 é o fim de geração; os demais viram o texto da lista
+VOCAB = ["", "olá", " mundo", "-", "--", " resto", "x"]
+
+
+class FakeModel:
+    """Imita o LlamaModel: uma palavra do prompt vira um token"""
+
+    vocab = None
+
+    def tokenize(self, text, add_bos, special):
+        return [1] * len(text.decode("utf-8").split())
+
+    def detokenize(self, tokens):
+        return "".join(VOCAB[t] for t in tokens).encode("utf-8")
+
+    def close(self):
+        pass
+
+
+class FakeBatch:
+    """Imita o LlamaBatch com listas no lugar dos arrays do C"""
+
+    def __init__(self, n_tokens):
+        self.batch = self
+        self.token = [0] * n_tokens
+        self.pos = [0] * n_tokens
+        self.seq_id = [[0] for _ in range(n_tokens)]
+        self.n_seq_id = [0] * n_tokens
+        self.logits = [False] * n_tokens
+        self.n_tokens = 0
+
+    def close(self):
+        pass
+
+
+class FakeContext:
+    """Contexto falso: cada seq_id segue um roteiro de tokens e cada decode é registrado"""
+
+    memory = None
+
+    def __init__(self, scripts, error=None):
+        self.scripts = {seq_id: iter(tokens) for seq_id, tokens in scripts.items()}
+        self.error = error
+        self.decodes = []
+        self._batch = None
+        self._logits = []
+
+    def decode(self, batch):
+        self._batch = batch.batch
+        self.decodes.append(
+            {self._batch.seq_id[i][0] for i in range(self._batch.n_tokens)}
+        )
+        if self.error:
+            raise self.error
+
+    def get_logits_ith(self, index):
+        token = next(self.scripts[self._batch.seq_id[index][0]])
+        logits = (ctypes.c_float * len(VOCAB))()
+        logits[token] = 1.0
+        self._logits.append(logits)
+        return ctypes.cast(logits, ctypes.POINTER(ctypes.c_float))
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_llama():
+    """Sampling guloso e funções do llama.cpp trocadas pelas versões falsas"""
+    released = []
+    with patch("llm_batch.TEMPERATURE", 0), patch(
+        "llm_batch.FREQUENCY_PENALTY", 1
+    ), patch.object(
+        llm_batch.llama_lib, "llama_vocab_is_eog", lambda vocab, token: token == 0
+    ), patch.object(
+        llm_batch.llama_lib,
+        "llama_memory_seq_rm",
+        lambda memory, seq_id, p0, p1: released.append(seq_id),
+    ):
+        yield released
+
+
+def _runner(ctx, slots=2, start=True):
+    runner = BatchedLlamaRunnable("modelo.gguf", slots=slots)
+    runner._model = FakeModel()
+    runner._ctx = ctx
+    runner._batch = FakeBatch(runner.n_batch)
+    runner.n_vocab = len(VOCAB)
+    runner._thread = threading.Thread(target=runner._loop, daemon=True)
+    if start:
+        runner._thread.start()
+    return runner
+
+
+def _wait(condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+class TestBatchedLlamaRunnable:
+    """Testes do continuous batching com um contexto falso"""
+
+    def test_stop_sequence_split_across_tokens(self, fake_llama):
+        """Testa se o stop dividido entre dois tokens não chega ao consumidor"""
+        runner = _runner(FakeContext({0: [1, 2, 3, 4, 5, 0]}))
+
+        chunks = list(runner.stream_chunks("oi"))
+        runner.close()
+
+        assert "".join(chunks) == "olá mundo"
+        assert not any("-" in chunk for chunk in chunks)
+
+    def test_partial_stop_is_emitted_when_not_completed(self, fake_llama):
+        """Testa se um '-' que não completa o stop é liberado depois"""
+        runner = _runner(FakeContext({0: [1, 3, 6, 0]}))
+
+        assert runner.invoke("oi") == "olá-x"
+        runner.close()
+
+    def test_slot_freed_on_completion(self, fake_llama):
+        """Testa se o slot volta para a fila ao terminar a geração"""
+        runner = _runner(FakeContext({0: [1, 0]}))
+
+        assert runner.invoke("oi") == "olá"
+        _wait(lambda: sorted(runner._free_ids) == [0, 1])
+        assert fake_llama == [0]
+        assert not runner._active
+        runner.close()
+
+    def test_slot_freed_on_error(self, fake_llama):
+        """Testa se erro no decode chega ao consumidor e libera o slot"""
+        runner = _runner(FakeContext({0: [1]}, error=RuntimeError("decode falhou")))
+
+        with pytest.raises(RuntimeError, match="decode falhou"):
+            runner.invoke("oi")
+        _wait(lambda: sorted(runner._free_ids) == [0, 1])
+        assert fake_llama == [0]
+        runner.close()
+
+    def test_slot_freed_on_consumer_cancel(self, fake_llama):
+        """Testa se fechar o stream no meio libera o slot no próximo passo"""
+        runner = _runner(FakeContext({0: itertools.repeat(1)}))
+
+        stream = runner.stream_chunks("oi")
+        assert next(stream) == "olá"
+        stream.close()
+
+        _wait(lambda: sorted(runner._free_ids) == [0, 1])
+        assert fake_llama == [0]
+        runner.close()
+
+    def test_prompt_over_context_is_rejected(self, fake_llama):
+        """Testa se prompt maior que o contexto falha sem ocupar slot"""
+        runner = _runner(FakeContext({}))
+
+        with patch("llm_batch.MODEL_CONTEXT_SIZE", 4):
+            with pytest.raises(ValueError):
+                runner.invoke("uma frase com mais de quatro palavras")
+
+        assert not runner._pending and not runner._active
+        runner.close()
+
+    def test_concurrent_requests_share_decode_step(self, fake_llama):
+        """Testa se duas requisições simultâneas avançam no mesmo llama_decode"""
+        ctx = FakeContext({0: [1, 2, 0], 1: [6, 6, 0]})
+        runner = _runner(ctx, start=False)
+        results = {}
+
+        def consume(name):
+            results[name] = runner.invoke(f"prompt de {name}")
+
+        consumers = [threading.Thread(target=consume, args=(n,)) for n in "ab"]
+        for consumer in consumers:
+            consumer.start()
+        _wait(lambda: len(runner._pending) == 2)
+        runner._thread.start()
+        for consumer in consumers:
+            consumer.join(timeout=5)
+        runner.close()
+
+        assert sorted(results.values()) == ["olá mundo", "xx"]
+        # Prefill dos dois prompts e cada token gerado num único decode
+        assert ctx.decodes[:3] == [{0, 1}, {0, 1}, {0, 1}]
@@ -0,0 +1,129 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
+
+import httpx
+import pytest
+from groq import APIConnectionError, BadRequestError
+
+# Importar módulos da API
+from llm_groq import GroqLLM, backoff_delay
+
+
+def _chunk(text):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]
+    )
+
+
+class FakeStream:
+    """Stream síncrono do Groq que pode falhar depois de alguns tokens"""
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+        self.closed = False
+
+    def __iter__(self):
+        for token in self.tokens:
+            yield _chunk(token)
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncStream(FakeStream):
+    async def __aiter__(self):
+        for token in self.tokens:
+            yield _chunk(token)
+        if self.error:
+            raise self.error
+
+    async def close(self):
+        self.closed = True
+
+
+def _connection_error():
+    return APIConnectionError(request=httpx.Request("POST", "https://api.groq.com"))
+
+
+@pytest.fixture
+def groq_llm():
+    llm = GroqLLM(api_key="test_groq_key")
+    with patch("llm_groq.time.sleep"), patch("llm_groq.backoff_delay", return_value=0):
+        yield llm
+
+
+class TestGroqLLM:
+    """Testes para o backend remoto com cliente persistente"""
+
+    def test_client_is_reused(self, groq_llm):
+        """Testa se o mesmo cliente com pool atende várias requisições"""
+        assert groq_llm._get_client() is groq_llm._get_client()
+        groq_llm.close()
+        assert groq_llm._client is None
+
+    def test_retries_transient_error_before_first_token(self, groq_llm):
+        """Testa se falha de conexão antes do primeiro token é repetida"""
+        client = Mock()
+        client.chat.completions.create.side_effect = [
+            _connection_error(),
+            FakeStream(["Olá", " mundo"]),
+        ]
+        groq_llm._client = client
+
+        assert groq_llm.invoke("oi") == "Olá mundo"
+        assert client.chat.completions.create.call_count == 2
+
+    def test_no_retry_after_first_token(self, groq_llm):
+        """Testa se falha no meio do stream sobe sem repetir (evita texto duplicado)"""
+        stream = FakeStream(["Olá"], error=_connection_error())
+        client = Mock()
+        client.chat.completions.create.return_value = stream
+        groq_llm._client = client
+
+        with pytest.raises(APIConnectionError):
+            list(groq_llm.stream_chunks("oi"))
+        assert client.chat.completions.create.call_count == 1
+        assert stream.closed
+
+    def test_non_transient_error_is_raised(self, groq_llm):
+        """Testa se erros não transitórios sobem em vez de virar mensagem fixa"""
+        response = httpx.Response(
+            400, request=httpx.Request("POST", "https://api.groq.com")
+        )
+        client = Mock()
+        client.chat.completions.create.side_effect = BadRequestError(
+            "prompt inválido", response=response, body=None
+        )
+        groq_llm._client = client
+
+        with pytest.raises(BadRequestError):
+            groq_llm.invoke("oi")
+        assert client.chat.completions.create.call_count == 1
+
+    def test_async_stream_retries(self, groq_llm):
+        """Testa o streaming assíncrono nativo com repetição antes do primeiro token"""
+        stream = FakeAsyncStream(["a", "b"])
+        client = Mock()
+
+        async def create(**kwargs):
+            if client.calls == 0:
+                client.calls += 1
+                raise _connection_error()
+            return stream
+
+        client.calls = 0
+        client.chat.completions.create = create
+        groq_llm._async_client = client
+
+        assert asyncio.run(groq_llm.ainvoke("oi")) == "ab"
+        assert stream.closed
+
+    def test_backoff_respects_retry_after(self):
+        """Testa se o Retry-After do provedor vira o atraso mínimo"""
+        error = SimpleNamespace(response=SimpleNamespace(headers={"retry-after": "2"}))
+        assert backoff_delay(0, error) >= 2
+        assert 0 <= backoff_delay(0) <= 0.5
@@ -0,0 +1,217 @@
+import pytest
+import numpy as np
+
+pytest.importorskip("llama_cpp")
+
+# Importar módulos da API
+from llm_local import SessionStateCache, DraftModel, LlamaRunnable
+
+
+class FakeState:
+    """Imita o LlamaState do llama.cpp com tamanho controlado"""
+
+    def __init__(self, size):
+        self.llama_state_size = size
+        self.input_ids = np.zeros(0, dtype=np.intc)
+        self.scores = np.zeros((0, 0), dtype=np.single)
+
+
+class TestSessionStateCache:
+    """Testes para o cache LRU de estados KV por sessão"""
+
+    def test_get_returns_stored_state(self):
+        """Testa se o estado salvo é devolvido para a mesma sessão"""
+        cache = SessionStateCache(capacity_bytes=1000)
+        state = FakeState(100)
+
+        cache.put("s1", state)
+
+        assert cache.get("s1") is state
+        assert cache.get("s2") is None
+
+    def test_evicts_least_recently_used(self):
+        """Testa eviction LRU ao ultrapassar a capacidade em bytes"""
+        cache = SessionStateCache(capacity_bytes=250)
+        cache.put("s1", FakeState(100))
+        cache.put("s2", FakeState(100))
+        cache.get("s1")
+
+        cache.put("s3", FakeState(100))
+
+        assert cache.get("s2") is None
+        assert cache.get("s1") is not None
+        assert cache.get("s3") is not None
+        assert cache.size_bytes == 200
+
+    def test_replacing_session_updates_size(self):
+        """Testa se salvar de novo a mesma sessão não duplica o tamanho"""
+        cache = SessionStateCache(capacity_bytes=1000)
+        cache.put("s1", FakeState(100))
+        cache.put("s1", FakeState(300))
+
+        assert len(cache) == 1
+        assert cache.size_bytes == 300
+
+    def test_state_larger_than_capacity_is_not_cached(self):
+        """Testa se um estado maior que o limite é ignorado"""
+        cache = SessionStateCache(capacity_bytes=50)
+        cache.put("s1", FakeState(100))
+
+        assert len(cache) == 0
+        assert cache.size_bytes == 0
+
+
+class TestDraftModel:
+    """Testes para a contagem de aceitação da decodificação especulativa"""
+
+    def _draft(self):
+        # Sem carregar GGUF: só o estado usado na contagem de aceitação
+        draft = DraftModel.__new__(DraftModel)
+        draft._proposal = None
+        draft._proposal_start = 0
+        draft.accepted = 0
+        draft.proposed = 0
+        return draft
+
+    def test_counts_accepted_prefix(self):
+        """Testa se só o prefixo coincidente da proposta conta como aceito"""
+        draft = self._draft()
+        draft._proposal, draft._proposal_start = [7, 8, 9], 3
+
+        # Modelo principal aceitou 7 e 8 e corrigiu o terceiro token
+        draft._score_proposal([1, 2, 3, 7, 8, 5])
+
+        assert (draft.accepted, draft.proposed) == (2, 3)
+
+    def test_begin_discards_pending_proposal(self):
+        """Testa se a proposta da geração anterior não entra na conta"""
+        draft = self._draft()
+        draft._proposal, draft._proposal_start = [7, 8], 3
+        draft.begin()
+
+        draft._score_proposal([1, 2, 3, 7, 8])
+
+        assert draft.proposed == 0
+
+
+class FakeLlama:
+    """Imita o Llama: gera tokens fixos e registra os estados salvos e carregados"""
+
+    def __init__(self, tokens=("olá", " mundo")):
+        self.tokens = tokens
+        self.saved = []
+        self.loaded = []
+        self.evaluated = []
+        self.generator_closed = False
+
+    def __call__(self, prompt, stream=False, **kwargs):
+        return self._stream()
+
+    def _stream(self):
+        try:
+            for token in self.tokens:
+                yield {"choices": [{"text": token}]}
+        finally:
+            self.generator_closed = True
+
+    def save_state(self):
+        state = FakeState(100)
+        self.saved.append(state)
+        return state
+
+    def load_state(self, state):
+        self.loaded.append(state)
+
+    def tokenize(self, text, add_bos=True, special=True):
+        return list(range(len(text.split())))
+
+    def reset(self):
+        pass
+
+    def eval(self, tokens):
+        self.evaluated.append(list(tokens))
+
+
+def _runnable(llm):
+    runner = LlamaRunnable("modelo.gguf")
+    runner.llm = llm
+    return runner
+
+
+class TestLlamaRunnable:
+    """Testes do LlamaRunnable com um Llama falso"""
+
+    def test_closing_stream_releases_generator_and_lock(self):
+        """Testa se desistir do stream fecha o gerador do llama.cpp e libera o lock"""
+        llm = FakeLlama(tokens=("a", "b", "c"))
+        runner = _runnable(llm)
+
+        stream = runner.stream_chunks("oi", session_id="s1")
+        assert next(stream) == "a"
+        assert runner._lock.locked()
+        stream.close()
+
+        assert llm.generator_closed
+        assert not runner._lock.locked()
+        # O próximo pedido não fica bloqueado
+        assert runner.invoke_stream("oi") == "abc"
+
+    def test_returning_session_restores_and_saves_state(self):
+        """Testa se a sessão que volta carrega seu estado e salva o novo ao final"""
+        llm = FakeLlama()
+        runner = _runnable(llm)
+
+        runner.invoke_stream("turno 1", session_id="s1")
+        estado_s1 = llm.saved[-1]
+        runner.invoke_stream("outra conversa", session_id="s2")
+        runner.invoke_stream("turno 2", session_id="s1")
+
+        assert llm.loaded[-1] is estado_s1
+        assert runner._session_states.get("s1") is llm.saved[-1]
+        assert runner._session_states.get("s1") is not estado_s1
+
+    def test_state_from_old_prefix_is_discarded(self):
+        """Testa se o estado salvo sobre um prefixo antigo não é reaproveitado"""
+        llm = FakeLlama()
+        runner = _runnable(llm)
+        runner.prime_prefix("sistema antigo")
+        runner.invoke_stream("turno 1", session_id="s1")
+        estado_s1 = llm.saved[-1]
+        runner.invoke_stream("outra conversa", session_id="s2")
+
+        runner.prime_prefix("sistema novo")
+        novo_prefixo = runner._prefix_state
+        runner.invoke_stream("turno 2", session_id="s1")
+
+        # Voltou do prefixo novo, não do estado salvo sobre o antigo
+        assert llm.loaded[-1] is novo_prefixo
+        assert not any(estado is estado_s1 for estado in llm.loaded)
+
+    def test_new_session_starts_from_primed_prefix(self):
+        """Testa se uma sessão nova carrega o snapshot do prefixo de sistema"""
+        llm = FakeLlama()
+        runner = _runnable(llm)
+
+        runner.prime_prefix("você é o polaris")
+
+        assert llm.evaluated == [[0, 1, 2, 3]]
+        assert runner._prefix_state is llm.saved[-1]
+        runner.invoke_stream("oi", session_id="nova")
+        assert llm.loaded == [runner._prefix_state]
+
+    def test_changed_prefix_is_primed_again(self):
+        """Testa se só um prefixo diferente é reavaliado"""
+        llm = FakeLlama()
+        runner = _runnable(llm)
+
+        runner.prime_prefix("você é o polaris")
+        primeiro = runner._prefix_state
+        runner.prime_prefix("você é o polaris")
+        assert len(llm.evaluated) == 1
+        assert runner._prefix_state is primeiro
+
+        runner.prime_prefix("você é o polaris v2")
+        assert len(llm.evaluated) == 2
+        assert runner._prefix_state is not primeiro
+        runner.invoke_stream("oi", session_id="nova")
+        assert llm.loaded == [runner._prefix_state]
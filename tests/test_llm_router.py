@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+# Importar módulos da API
+from llm_router import RoutedLLM, RouterBackend
+
+
+class FakeLLM:
+    """Backend falso: espera `delay` antes do primeiro token ou falha"""
+
+    def __init__(self, tokens, delay=0.0, error=None, error_after=None):
+        self.tokens = tokens
+        self.delay = delay
+        self.error = error
+        self.error_after = error_after
+        self.calls = 0
+        self.closed = False
+
+    def stream_chunks(self, prompt, session_id=None):
+        self.calls += 1
+        try:
+            time.sleep(self.delay)
+            if self.error and self.error_after is None:
+                raise self.error
+            for index, token in enumerate(self.tokens):
+                if self.error and index == self.error_after:
+                    raise self.error
+                yield token
+        finally:
+            self.closed = True
+
+
+def _router(*backends, **kwargs):
+    return RoutedLLM(
+        [RouterBackend(name, llm, initial_ttft=ttft) for name, llm, ttft in backends],
+        **kwargs,
+    )
+
+
+class TestRoutedLLM:
+    """Testes para o roteamento entre backends de LLM"""
+
+    def test_routes_to_lowest_latency(self):
+        """Testa se a requisição vai para o backend com menor latência recente"""
+        remoto, local = FakeLLM(["remoto"]), FakeLLM(["local"])
+        router = _router(("groq", remoto, 1.0), ("local", local, 0.5))
+
+        assert router.invoke("oi") == "local"
+        assert remoto.calls == 0
+
+    def test_failover_on_error(self):
+        """Testa se erro antes do primeiro token cai no próximo backend"""
+        remoto = FakeLLM([], error=RuntimeError("429 rate limit"))
+        local = FakeLLM(["ok"])
+        router = _router(("groq", remoto, 0.1), ("local", local, 1.0))
+
+        assert router.invoke("oi") == "ok"
+        # Backend com falha fica em cooldown e vai para o fim da fila
+        assert [b.name for b in router.ranked()] == ["local", "groq"]
+
+    def test_failover_on_ttft_budget(self):
+        """Testa troca de backend quando o primeiro token estoura o orçamento"""
+        lento, rapido = FakeLLM(["lento"], delay=0.5), FakeLLM(["rapido"])
+        router = _router(("groq", lento, 0.1), ("local", rapido, 1.0), ttft_budget=0.1)
+
+        start = time.time()
+        assert router.invoke("oi") == "rapido"
+        assert time.time() - start < 0.4
+
+    def test_hedged_request_wins_with_first_token(self):
+        """Testa se o hedge dispara o segundo backend e vence quem responde antes"""
+        lento, rapido = FakeLLM(["lento"], delay=0.5), FakeLLM(["rapido"])
+        router = _router(
+            ("groq", lento, 0.1),
+            ("local", rapido, 1.0),
+            ttft_budget=5,
+            hedge_delay=0.05,
+        )
+
+        assert router.invoke("oi") == "rapido"
+        assert lento.calls == 1 and rapido.calls == 1
+
+    def test_no_failover_after_first_token(self):
+        """Testa se erro no meio do stream sobe sem trocar de backend"""
+        remoto = FakeLLM(["a", "b"], error=RuntimeError("conexão caiu"), error_after=1)
+        local = FakeLLM(["local"])
+        router = _router(("groq", remoto, 0.1), ("local", local, 1.0))
+
+        with pytest.raises(RuntimeError):
+            router.invoke("oi")
+        assert local.calls == 0
+
+    def test_all_backends_failing_raises_last_error(self):
+        """Testa se, sem backend disponível, o último erro sobe"""
+        router = _router(
+            ("groq", FakeLLM([], error=RuntimeError("fora do ar")), 0.1),
+            ("local", FakeLLM([], error=ValueError("sem modelo")), 1.0),
+        )
+
+        with pytest.raises(ValueError):
+            router.invoke("oi")
+
+    def test_last_backend_slower_than_budget_is_awaited(self):
+        """Testa se o último backend é esperado mesmo passando do orçamento de TTFT"""
+        remoto = FakeLLM([], error=RuntimeError("fora do ar"))
+        lento = FakeLLM(["devagar"], delay=0.2)
+        router = _router(("groq", remoto, 0.1), ("local", lento, 1.0), ttft_budget=0.05)
+
+        assert router.invoke("oi") == "devagar"
+        assert lento.calls == 1
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+# Importar módulos da API
+from llm_scheduler import LLMScheduler
+
+
+class TestLLMScheduler:
+    """Testes para o scheduler de admissão do LLM"""
+
+    def test_run_returns_result(self):
+        """Testa execução simples dentro de um slot"""
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1)
+            result = await scheduler.run(lambda p: p.upper(), "ok")
+            return scheduler, result
+
+        scheduler, result = asyncio.run(run())
+        assert result == "OK"
+        assert scheduler.active == 0
+        assert scheduler.waiting == 0
+
+    def test_limits_concurrent_generations(self):
+        """Testa se o número de gerações simultâneas respeita os slots"""
+        lock = threading.Lock()
+        state = {"current": 0, "peak": 0}
+
+        def generate(_):
+            with lock:
+                state["current"] += 1
+                state["peak"] = max(state["peak"], state["current"])
+            time.sleep(0.05)
+            with lock:
+                state["current"] -= 1
+            return "ok"
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=2, max_queue=10)
+            await asyncio.gather(*(scheduler.run(generate, i) for i in range(6)))
+
+        asyncio.run(run())
+        assert state["peak"] == 2
+
+    def test_rejects_with_429_when_queue_is_full(self):
+        """Testa rejeição imediata com fila saturada"""
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1, max_queue=1)
+            busy = asyncio.create_task(scheduler.run(time.sleep, 0.2))
+            await asyncio.sleep(0.01)
+            queued = asyncio.create_task(scheduler.run(time.sleep, 0.01))
+            await asyncio.sleep(0.01)
+
+            with pytest.raises(HTTPException) as exc:
+                await scheduler.run(time.sleep, 0.01)
+            await asyncio.gather(busy, queued)
+            return exc.value
+
+        error = asyncio.run(run())
+        assert error.status_code == 429
+
+    def test_rejects_with_503_when_deadline_expires_in_queue(self):
+        """Testa rejeição quando não há slot dentro do prazo"""
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1)
+            busy = asyncio.create_task(scheduler.run(time.sleep, 0.3))
+            await asyncio.sleep(0.01)
+
+            with pytest.raises(HTTPException) as exc:
+                await scheduler.run(time.sleep, 0.01, deadline=0.05)
+            await busy
+            return exc.value
+
+        error = asyncio.run(run())
+        assert error.status_code == 503
+
+    def test_generation_timeout_keeps_slot_until_thread_ends(self):
+        """Testa 504 e se o slot só volta quando a thread termina"""
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1)
+            with pytest.raises(HTTPException) as exc:
+                await scheduler.run(time.sleep, 0.2, deadline=0.05)
+            active_after_timeout = scheduler.active
+            await asyncio.sleep(0.3)
+            return exc.value, active_after_timeout, scheduler.active
+
+        error, active_after_timeout, active_at_end = asyncio.run(run())
+        assert error.status_code == 504
+        assert active_after_timeout == 1
+        assert active_at_end == 0
+
+    def test_open_stream_releases_slot_when_producer_ends(self):
+        """Testa se o slot do streaming é liberado ao fim do produtor"""
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1)
+            bridge = await scheduler.open_stream(lambda: iter(["a", "b"]))
+            items = [item async for item in bridge]
+            await bridge.future
+            await asyncio.sleep(0)
+            return scheduler, items
+
+        scheduler, items = asyncio.run(run())
+        assert items == ["a", "b"]
+        assert scheduler.active == 0
+
+    def test_run_async_releases_slot(self):
+        """Testa geração assíncrona nativa e liberação do slot"""
+
+        async def generate(prompt):
+            await asyncio.sleep(0)
+            return prompt.upper()
+
+        async def run():
+            scheduler = LLMScheduler(backend="test", slots=1)
+            result = await scheduler.run_async(generate, "ok")
+            return scheduler, result
+
+        scheduler, result = asyncio.run(run())
+        assert result == "OK"
+        assert scheduler.active == 0
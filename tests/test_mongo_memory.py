@@ -0,0 +1,202 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+# Importar módulos da API
+from content_index import content_hash
+from mongo_memory import AsyncMongoMemory, MongoMemory, PoolMetrics, open_client
+from polaris_metrics import mongo_pool_checked_out
+
+
+def _collection(texts=()):
+    """Coleção falsa cujo find().sort().limit() devolve os textos dados"""
+    collection = MagicMock()
+    cursor = collection.find.return_value
+    cursor.sort.return_value.limit.return_value = [{"text": t} for t in texts]
+    return collection
+
+
+class TestRecent:
+    """Testes do cache de leitura"""
+
+    def test_segunda_leitura_nao_consulta_o_mongo(self):
+        """A sessão fica em cache depois da primeira consulta"""
+        collection = _collection(["gosto de café"])
+        memory = MongoMemory(collection, history=4, cache_ttl=0)
+
+        assert memory.recent("s1") == ["gosto de café"]
+        assert memory.recent("s1") == ["gosto de café"]
+
+        collection.find.assert_called_once_with({"session_id": "s1"}, {"text": 1})
+        collection.find.return_value.sort.return_value.limit.assert_called_once_with(4)
+
+    def test_escrita_invalida_a_sessao(self):
+        """Uma memória nova força a releitura só da sessão gravada"""
+        collection = _collection(["a"])
+        collection.update_one.return_value = Mock(upserted_id="novo")
+        memory = MongoMemory(collection, cache_ttl=0)
+        memory.recent("s1")
+        memory.recent("s2")
+
+        memory.save("s1", "b")
+        memory.recent("s1")
+        memory.recent("s2")
+
+        assert collection.find.call_count == 3
+
+    def test_ttl_expira_o_cache(self):
+        """Depois do TTL a sessão é relida (gravações de outros workers)"""
+        collection = _collection(["a"])
+        memory = MongoMemory(collection, cache_ttl=30)
+
+        with patch("mongo_memory.time.monotonic", return_value=100.0):
+            memory.recent("s1")
+        with patch("mongo_memory.time.monotonic", return_value=120.0):
+            memory.recent("s1")
+        assert collection.find.call_count == 1
+        with patch("mongo_memory.time.monotonic", return_value=140.0):
+            memory.recent("s1")
+        assert collection.find.call_count == 2
+
+    def test_lru_limita_as_sessoes(self):
+        """Acima de cache_sessions, a sessão menos usada sai do cache"""
+        memory = MongoMemory(_collection(["a"]), cache_sessions=2, cache_ttl=0)
+        for session_id in ("s1", "s2", "s3"):
+            memory.recent(session_id)
+
+        assert list(memory._cache) == ["s2", "s3"]
+
+
+class TestSave:
+    """Testes do upsert deduplicado"""
+
+    def test_upsert_por_hash(self):
+        """save usa um único update_one com $setOnInsert"""
+        collection = _collection()
+        collection.update_one.return_value = Mock(upserted_id="novo")
+        memory = MongoMemory(collection)
+
+        assert memory.save("s1", "meu nome é Ana") is True
+
+        filtro, update = collection.update_one.call_args[0]
+        assert filtro == {
+            "session_id": "s1",
+            "text_hash": content_hash("meu nome é Ana"),
+        }
+        assert update["$setOnInsert"]["text"] == "meu nome é Ana"
+        assert collection.update_one.call_args[1] == {"upsert": True}
+        collection.find_one.assert_not_called()
+        collection.insert_one.assert_not_called()
+
+    def test_duplicata_nao_invalida(self):
+        """Texto já existente não é gravado nem invalida o cache"""
+        collection = _collection(["a"])
+        collection.update_one.return_value = Mock(upserted_id=None)
+        memory = MongoMemory(collection, cache_ttl=0)
+        memory.recent("s1")
+
+        assert memory.save("s1", "a") is False
+        assert "s1" in memory._cache
+
+    def test_corrida_de_upserts(self):
+        """DuplicateKeyError do índice único conta como duplicata"""
+        collection = _collection()
+        collection.update_one.side_effect = DuplicateKeyError("dup")
+
+        assert MongoMemory(collection).save("s1", "a") is False
+
+
+class TestEnsureIndexes:
+    """Testes da criação de índices"""
+
+    def test_cria_indices_e_preenche_hash(self):
+        """Documentos antigos ganham text_hash antes do índice único"""
+        collection = _collection()
+        collection.find.return_value = [{"_id": 1, "text": "antigo"}]
+        memory = MongoMemory(collection)
+
+        memory.ensure_indexes()
+
+        (requests,), _ = collection.bulk_write.call_args
+        assert requests[0]._doc == {"$set": {"text_hash": content_hash("antigo")}}
+        nomes = [c[1]["name"] for c in collection.create_index.call_args_list]
+        assert nomes == ["session_recent", "session_text_hash"]
+        assert collection.create_index.call_args_list[1][1]["unique"] is True
+
+    def test_indice_unico_com_duplicatas_antigas(self):
+        """Falha no índice único é registrada sem derrubar o startup"""
+        collection = _collection()
+        collection.find.return_value = []
+        collection.create_index.side_effect = [
+            "session_recent",
+            OperationFailure("E11000 duplicate key"),
+        ]
+
+        MongoMemory(collection).ensure_indexes()
+
+        collection.bulk_write.assert_not_called()
+
+
+def _async_collection(texts=()):
+    """Coleção falsa do driver assíncrono (to_list e escritas aguardáveis)"""
+    collection = MagicMock()
+    cursor = collection.find.return_value.sort.return_value.limit.return_value
+    cursor.to_list = AsyncMock(return_value=[{"text": t} for t in texts])
+    collection.update_one = AsyncMock(return_value=Mock(upserted_id="novo"))
+    return collection
+
+
+class TestAsyncMongoMemory:
+    """Testes da versão para o AsyncMongoClient"""
+
+    def test_recent_com_cache(self):
+        """Leitura aguarda o cursor uma vez e depois usa o cache"""
+        collection = _async_collection(["gosto de café"])
+        memory = AsyncMongoMemory(collection, cache_ttl=0)
+
+        async def run():
+            return [await memory.recent("s1"), await memory.recent("s1")]
+
+        assert asyncio.run(run()) == [["gosto de café"], ["gosto de café"]]
+        collection.find.assert_called_once()
+
+    def test_save_invalida(self):
+        """Upsert aguardado invalida a sessão"""
+        collection = _async_collection(["a"])
+        memory = AsyncMongoMemory(collection, cache_ttl=0)
+
+        async def run():
+            await memory.recent("s1")
+            saved = await memory.save("s1", "b")
+            await memory.recent("s1")
+            return saved
+
+        assert asyncio.run(run()) is True
+        assert collection.find.call_count == 2
+        assert collection.update_one.await_args[1] == {"upsert": True}
+
+
+class TestPool:
+    """Testes do cliente compartilhado e das métricas do pool"""
+
+    def test_open_client_configura_o_pool(self):
+        """open_client aplica maxPoolSize e registra o listener de métricas"""
+        with patch("mongo_memory.MONGODB_MAX_POOL_SIZE", 7):
+            client = open_client("mongodb://localhost:27017", async_driver=False)
+        try:
+            assert client.options.pool_options.max_pool_size == 7
+            listeners = client.options.event_listeners
+            assert any(isinstance(l, PoolMetrics) for l in listeners)
+        finally:
+            client.close()
+
+    def test_metricas_de_checkout(self):
+        """Checkout/checkin ajustam as conexões em uso"""
+        listener = PoolMetrics()
+        antes = mongo_pool_checked_out._value.get()
+
+        listener.connection_checked_out(Mock(duration=0.01))
+        assert mongo_pool_checked_out._value.get() == antes + 1
+        listener.connection_checked_in(Mock())
+        assert mongo_pool_checked_out._value.get() == antes
@@ -0,0 +1,97 @@
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# Importar módulos da API
+from numpy_vectorstore import IVFIndex, NumpyVectorStore, _Partition
+
+
+class TestNumpyVectorStore:
+    """Testes para o backend de vetores em NumPy"""
+
+    def test_add_and_search_per_session(self, tmp_path):
+        """Testa gravação agrupada por sessão e busca só na sessão"""
+        store = NumpyVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=16))
+
+        store.add_texts(
+            ["maçã", "banana", "uva"],
+            metadatas=[
+                {"session_id": "s1"},
+                {"session_id": "s2"},
+                {"session_id": "s1"},
+            ],
+        )
+
+        docs = store.similarity_search("maçã", k=5, filter={"session_id": "s1"})
+        assert [d.page_content for d in docs][0] == "maçã"
+        assert sorted(d.page_content for d in docs) == ["maçã", "uva"]
+        assert store.similarity_search("x", filter={"session_id": "nova"}) == []
+        assert store.get(where={"session_id": "s2"})["documents"] == ["banana"]
+
+    def test_extra_filter_and_delete(self, tmp_path):
+        """Testa filtros além do session_id e a remoção da sessão"""
+        store = NumpyVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=16))
+        store.add_texts(
+            ["a", "b"],
+            metadatas=[
+                {"session_id": "s1", "source": "x.pdf"},
+                {"session_id": "s1", "source": "y.pdf"},
+            ],
+        )
+
+        docs = store.similarity_search(
+            "a", k=5, filter={"session_id": "s1", "source": "y.pdf"}
+        )
+        assert [d.page_content for d in docs] == ["b"]
+        store.delete_session("s1")
+        assert store.get(where={"session_id": "s1"})["documents"] == []
+
+    def test_persists_and_reopens_with_mmap(self, tmp_path):
+        """Testa se os vetores sobrevivem a reinício, inclusive via memmap"""
+        embeddings = DeterministicFakeEmbedding(size=16)
+        NumpyVectorStore(str(tmp_path), embeddings, dtype="int8").add_texts(
+            ["um", "dois"], metadatas=[{"session_id": "s1"}] * 2
+        )
+
+        reaberto = NumpyVectorStore(str(tmp_path), embeddings, dtype="int8", mmap=True)
+        docs = reaberto.similarity_search("dois", k=1, filter={"session_id": "s1"})
+        assert docs[0].page_content == "dois"
+        reaberto.add_texts(["tres"], metadatas=[{"session_id": "s1"}])
+        assert len(reaberto.get(where={"session_id": "s1"})["ids"]) == 3
+
+    def test_approximate_index_recall(self, tmp_path):
+        """Testa se o IVF de sessões grandes acha quase os mesmos vizinhos da busca exata"""
+        rng = np.random.default_rng(0)
+        centros = rng.normal(size=(20, 32))
+        vetores = centros[rng.integers(0, 20, 4000)] + 0.5 * rng.normal(size=(4000, 32))
+        partition = _Partition(str(tmp_path), "float16", mmap=False, threshold=500)
+        partition.add([str(i) for i in range(4000)], vetores, [{}] * 4000)
+
+        recall = 0
+        for query in vetores[:50] + 0.1 * rng.normal(size=(50, 32)):
+            aprox = {doc for doc, _, _ in partition.search(query, 10)}
+            exato = {doc for doc, _, _ in partition.search(query, 10, exact=True)}
+            recall += len(aprox & exato) / 10
+        assert partition.index is not None
+        assert recall / 50 > 0.8
+
+    def test_index_with_more_lists_than_vectors(self):
+        """Testa se VECTOR_IVF_LISTS maior que a sessão não quebra a construção"""
+        rng = np.random.default_rng(0)
+        vetores = rng.normal(size=(5, 8)).astype(np.float32)
+        vetores /= np.linalg.norm(vetores, axis=1, keepdims=True)
+        index = IVFIndex(nprobe=8, nlist=64)
+
+        index.build(vetores)
+
+        assert len(index.lists) == 5
+        assert index.search(vetores, vetores[3], 1)[0] == 3
+
+    def test_embeddings_returns_stored_vectors(self, tmp_path):
+        """Testa se os vetores gravados (normalizados) voltam pelos ids"""
+        store = NumpyVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=16))
+        ids = store.add_texts(["a", "b"], metadatas=[{"session_id": "s1"}] * 2)
+
+        vectors = store.embeddings("s1", [ids[1], "inexistente"])
+
+        assert vectors[1] is None
+        assert abs(float(np.linalg.norm(vectors[0])) - 1.0) < 1e-2
@@ -0,0 +1,196 @@
+import asyncio
+import io
+import os
+import runpy
+import time
+from unittest.mock import Mock, patch
+
+import pymupdf
+from fastapi import UploadFile
+
+# Importar módulos da API
+import pdf_ingest
+from pdf_ingest import save_upload, ingest_pdf
+from ingest_jobs import IngestJobManager
+from content_index import ContentIndex
+
+
+def _make_pdf(path, pages):
+    """Cria um PDF real com um parágrafo longo por página"""
+    doc = pymupdf.open()
+    for i in range(pages):
+        page = doc.new_page()
+        texto = f"Pagina {i}. " + "texto de exemplo " * 200
+        page.insert_textbox(pymupdf.Rect(36, 36, 576, 806), texto, fontsize=6)
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+class TestPdfIngest:
+    """Testes para a ingestão de PDFs em lote"""
+
+    def test_save_upload_streams_to_disk(self, tmp_path):
+        """Testa se o upload é gravado em pedaços com nome único"""
+        conteudo = b"%PDF-1.4 " + b"x" * 5000
+        upload = UploadFile(file=io.BytesIO(conteudo), filename="../relatorio.pdf")
+
+        with patch("pdf_ingest.UPLOAD_CHUNK_BYTES", 1024):
+            path = asyncio.run(save_upload(upload, directory=str(tmp_path)))
+
+        assert path.startswith(str(tmp_path))
+        assert path.endswith("_relatorio.pdf")
+        with open(path, "rb") as f:
+            assert f.read() == conteudo
+
+    def test_ingest_writes_in_batches(self, tmp_path):
+        """Testa se os trechos vão ao vectorstore em lotes, com metadados"""
+        path = _make_pdf(tmp_path / "manual.pdf", 3)
+        store = Mock()
+        progresso = []
+
+        total = ingest_pdf(
+            path,
+            "s1",
+            store,
+            prepare_text=lambda t: f"[s1] {t}",
+            batch_size=4,
+            progress=lambda pages, chunks: progresso.append((pages, chunks)),
+        )
+
+        chamadas = store.add_texts.call_args_list
+        textos = [t for c in chamadas for t in c.kwargs["texts"]]
+        metadados = [m for c in chamadas for m in c.kwargs["metadatas"]]
+        assert total == len(textos) > 3
+        assert all(len(c.kwargs["texts"]) <= 4 for c in chamadas)
+        assert all(t.startswith("[s1] ") for t in textos)
+        assert all(len(t[5:]) // 4 <= 200 for t in textos)
+        assert metadados[0] == {
+            "session_id": "s1",
+            "source": "manual.pdf",
+            "page": 0,
+            "kind": "document",
+            "created_at": metadados[0]["created_at"],
+        }
+        assert metadados[-1]["page"] == 2
+        assert sum(p for p, _ in progresso) == 3
+        assert sum(c for _, c in progresso) == total
+
+    def test_file_hash_on_exact_multiple_of_batch(self):
+        """Testa se o digest é gravado quando os trechos completam o lote exato"""
+        store = Mock()
+        trechos = [("primeiro", 0), ("segundo", 0)]
+
+        with patch("pdf_ingest.extract_page_range", return_value=trechos):
+            total = ingest_pdf(
+                "a.pdf", "s1", store, batch_size=2, pages=1, file_digest="abc"
+            )
+
+        assert total == 2
+        assert store.add_texts.call_count == 1
+        metadados = store.add_texts.call_args.kwargs["metadatas"]
+        assert all(m["file_hash"] == "abc" for m in metadados)
+
+    def test_file_hash_with_trailing_duplicates(self):
+        """Testa se o digest é gravado mesmo com duplicatas no fim do arquivo"""
+        store = Mock()
+        store.get.return_value = {"documents": [], "metadatas": []}
+        trechos = [("um", 0), ("dois", 0), ("tres", 0), ("um", 1), ("dois", 1)]
+
+        with patch("pdf_ingest.extract_page_range", return_value=trechos):
+            total = ingest_pdf(
+                "a.pdf",
+                "s1",
+                store,
+                batch_size=2,
+                pages=2,
+                index=ContentIndex(lambda: store),
+                file_digest="abc",
+            )
+
+        assert total == 3
+        ultimo = store.add_texts.call_args.kwargs
+        assert ultimo["texts"] == ["tres"]
+        assert ultimo["metadatas"][0]["file_hash"] == "abc"
+
+
+class TestIngestJobManager:
+    """Testes para os jobs de indexação em segundo plano"""
+
+    def test_job_runs_in_background_and_reports_progress(self, tmp_path):
+        """Testa o job completo com extração no pool de processos"""
+        path = _make_pdf(tmp_path / "relatorio.pdf", 5)
+        store = Mock()
+        manager = IngestJobManager(lambda: store, workers=1, max_jobs=1)
+
+        job = manager.submit(path, "s1", source="relatorio.pdf")
+        deadline = time.time() + 60
+        while manager.get(job.id).status in ("queued", "running"):
+            assert time.time() < deadline
+            time.sleep(0.05)
+        manager.close()
+
+        status = manager.get(job.id).to_dict()
+        assert status["status"] == "done", status["error"]
+        assert status["pages_total"] == status["pages_processed"] == 5
+        assert status["chunks_embedded"] > 0
+        assert status["pages_per_second"] > 0
+        store.add_texts.assert_called()
+        assert not (tmp_path / "relatorio.pdf").exists()
+
+    def test_failed_job_reports_error(self, tmp_path):
+        """Testa se um arquivo inválido vira job com erro, sem derrubar nada"""
+        path = tmp_path / "quebrado.pdf"
+        path.write_bytes(b"isso nao e um pdf")
+        manager = IngestJobManager(lambda: Mock(), workers=1, max_jobs=1)
+
+        job = manager.submit(str(path), "s1", source="quebrado.pdf")
+        deadline = time.time() + 30
+        while manager.get(job.id).status in ("queued", "running"):
+            assert time.time() < deadline
+            time.sleep(0.05)
+        manager.close()
+
+        assert job.status == "failed"
+        assert job.error
+        assert not path.exists()
+
+    def test_resent_pdf_is_not_reindexed(self, tmp_path):
+        """Testa se o mesmo PDF reenviado na sessão é reconhecido pelo hash"""
+        _make_pdf(tmp_path / "a.pdf", 2)
+        (tmp_path / "b.pdf").write_bytes((tmp_path / "a.pdf").read_bytes())
+        store = Mock()
+        store.get.return_value = {"documents": [], "metadatas": []}
+        manager = IngestJobManager(
+            lambda: store, workers=1, max_jobs=1, index=ContentIndex(lambda: store)
+        )
+
+        jobs = []
+        for nome in ("a.pdf", "b.pdf"):
+            jobs.append(manager.submit(str(tmp_path / nome), "s1", source=nome))
+            deadline = time.time() + 60
+            while jobs[-1].status in ("queued", "running"):
+                assert time.time() < deadline
+                time.sleep(0.05)
+        manager.close()
+
+        primeiro, segundo = [job.to_dict() for job in jobs]
+        assert primeiro["status"] == segundo["status"] == "done"
+        assert not primeiro["duplicate"] and segundo["duplicate"]
+        assert segundo["chunks_embedded"] == 0
+        ultimo_lote = store.add_texts.call_args.kwargs["metadatas"]
+        assert all("file_hash" in m for m in ultimo_lote)
+
+    def test_worker_reimport_does_not_start_service(self, tmp_path, monkeypatch):
+        """Testa se o reimport do polaris_main num worker spawn não sobe o serviço"""
+        monkeypatch.chdir(tmp_path)
+        main_path = os.path.join(
+            os.path.dirname(pdf_ingest.__file__), "polaris_main.py"
+        )
+
+        # É assim que o multiprocessing (spawn) reexecuta o script principal
+        namespace = runpy.run_path(main_path, run_name="__mp_main__")
+
+        assert "init_services" in namespace
+        assert "vectorstore" not in namespace and "llm" not in namespace
+        assert os.listdir(tmp_path) == []
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from unittest.mock import patch
+
+# Importar módulos da API
+from polaris_context import ContextSource, gather_context
+
+
+class TestGatherContext:
+    """Testes para a montagem concorrente de contexto"""
+
+    def test_gather_returns_results_by_name(self):
+        """Testa se cada fonte devolve seu resultado pelo nome"""
+        sources = [
+            ContextSource("docs", lambda q: f"docs:{q}", "pergunta", default=""),
+            ContextSource("mongo", lambda: ["memoria"], default=[]),
+        ]
+
+        results = asyncio.run(gather_context(sources))
+
+        assert results == {"docs": "docs:pergunta", "mongo": ["memoria"]}
+
+    def test_sources_run_concurrently(self):
+        """Testa se o tempo total é o da fonte mais lenta, não a soma"""
+        sources = [
+            ContextSource(f"lenta_{i}", time.sleep, 0.2, timeout=2) for i in range(4)
+        ]
+
+        start = time.time()
+        asyncio.run(gather_context(sources))
+        elapsed = time.time() - start
+
+        assert elapsed < 0.6
+
+    def test_timeout_uses_default(self):
+        """Testa se uma fonte que estoura o prazo cai no valor padrão"""
+        sources = [
+            ContextSource(
+                "lenta", lambda: time.sleep(0.5) or "tarde", timeout=0.05, default=""
+            ),
+            ContextSource("rapida", lambda: "ok", default=""),
+        ]
+
+        with patch("polaris_context.log_warning") as mock_warning:
+            results = asyncio.run(gather_context(sources, session_id="s1"))
+
+        assert results == {"lenta": "", "rapida": "ok"}
+        mock_warning.assert_called()
+
+    def test_error_uses_default(self):
+        """Testa se uma fonte com erro cai no valor padrão"""
+
+        def falha():
+            raise RuntimeError("mongo fora do ar")
+
+        sources = [ContextSource("mongo", falha, default=[])]
+
+        with patch("polaris_context.log_error") as mock_error:
+            results = asyncio.run(gather_context(sources))
+
+        assert results == {"mongo": []}
+        mock_error.assert_called()
+
+    def test_async_source_runs_on_event_loop(self):
+        """Testa se fontes async rodam no event loop e respeitam o prazo"""
+        loop_thread = []
+
+        async def rapida():
+            loop_thread.append(threading.current_thread())
+            return ["memoria"]
+
+        async def lenta():
+            await asyncio.sleep(0.5)
+            return "tarde"
+
+        sources = [
+            ContextSource("mongo", rapida, default=[]),
+            ContextSource("lenta", lenta, timeout=0.05, default=""),
+        ]
+
+        with patch("polaris_context.log_warning"):
+            results = asyncio.run(gather_context(sources))
+
+        assert results == {"mongo": ["memoria"], "lenta": ""}
+        assert loop_thread == [threading.main_thread()]
@@ -153,6 +153,129 @@ class TestInferenceEndpoint:
                 mock_log_error.assert_called()
 
 
+class TestBuildFullPrompt:
+    """Testes da montagem do prompt"""
+
+    def test_saved_memory_enters_the_same_turn(self):
+        """Fato salvo por palavra-chave aparece no prompt do próprio turno"""
+        import asyncio
+        from polaris_main import build_full_prompt
+
+        class MemoriaLenta:
+            """Leitura termina antes da gravação, como no gather em paralelo"""
+
+            async def recent(self, session_id):
+                return ["eu gosto de café"]
+
+            async def save(self, session_id, text):
+                await asyncio.sleep(0.01)
+                return True
+
+        with patch("polaris_main.USE_MONGODB", True), patch(
+            "polaris_main.mongo_memory", MemoriaLenta(), create=True
+        ), patch(
+            "polaris_main.load_keywords_from_file", return_value=["meu nome é"]
+        ), patch(
+            "polaris_main.search_documents", return_value=""
+        ):
+            prompt = asyncio.run(build_full_prompt("meu nome é Ana", "s1"))
+
+        assert "Memória do Usuário:\nmeu nome é Ana\neu gosto de café" in prompt
+
+
+class TestInferenceStreamCircuit:
+    """Testes do circuit breaker do LLM no endpoint de streaming"""
+
+    def _stream(self, client):
+        response = client.post(
+            "/inference/stream/", json={"prompt": "oi", "session_id": "s1"}
+        )
+        assert response.status_code == 200
+        return response.text
+
+    def test_failing_streams_open_the_circuit(self):
+        """Streams que falham depois de abertos abrem o circuito"""
+        from auth import jwt_auth
+        from resilience import CircuitBreaker, llm_is_failure, OPEN
+
+        def modelo_fora_do_ar(prompt, session_id=None):
+            raise RuntimeError("modelo fora do ar")
+            yield
+
+        breaker = CircuitBreaker(
+            "llm", failure_threshold=3, recovery_timeout=60, is_failure=llm_is_failure
+        )
+        app.dependency_overrides[jwt_auth.get_current_user] = lambda: {"user_id": "t"}
+        try:
+            with patch("polaris_main.llm") as mock_llm, patch(
+                "polaris_main.llm_breaker", breaker
+            ), patch(
+                "polaris_main.build_full_prompt", AsyncMock(return_value="prompt")
+            ):
+                mock_llm.stream_chunks.side_effect = modelo_fora_do_ar
+                client = TestClient(app)
+
+                for _ in range(3):
+                    assert "[ERROR] modelo fora do ar" in self._stream(client)
+                assert breaker.state == OPEN
+
+                # Circuito aberto: nem chega a abrir o stream
+                texto = self._stream(client)
+                assert "temporariamente indisponível" in texto
+                assert mock_llm.stream_chunks.call_count == 3
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_validation_error_does_not_count(self):
+        """ValueError do pedido (prompt grande demais) não conta como falha"""
+        from auth import jwt_auth
+        from resilience import CircuitBreaker, llm_is_failure, CLOSED
+
+        def prompt_grande(prompt, session_id=None):
+            raise ValueError("prompt excede o contexto")
+            yield
+
+        breaker = CircuitBreaker("llm", failure_threshold=1, is_failure=llm_is_failure)
+        app.dependency_overrides[jwt_auth.get_current_user] = lambda: {"user_id": "t"}
+        try:
+            with patch("polaris_main.llm") as mock_llm, patch(
+                "polaris_main.llm_breaker", breaker
+            ), patch(
+                "polaris_main.build_full_prompt", AsyncMock(return_value="prompt")
+            ):
+                mock_llm.stream_chunks.side_effect = prompt_grande
+                client = TestClient(app)
+
+                assert "[ERROR]" in self._stream(client)
+                assert breaker.state == CLOSED
+        finally:
+            app.dependency_overrides.clear()
+
+    def test_disconnect_check_is_throttled(self):
+        """A desconexão do cliente não é consultada a cada token"""
+        from auth import jwt_auth
+        from starlette.requests import Request
+
+        def muitos_tokens(prompt, session_id=None):
+            yield from ["tok"] * 200
+
+        is_disconnected = AsyncMock(return_value=False)
+        app.dependency_overrides[jwt_auth.get_current_user] = lambda: {"user_id": "t"}
+        try:
+            with patch("polaris_main.llm") as mock_llm, patch(
+                "polaris_main.build_full_prompt", AsyncMock(return_value="prompt")
+            ), patch("polaris_main.STREAM_DISCONNECT_CHECK_INTERVAL", 60), patch.object(
+                Request, "is_disconnected", is_disconnected
+            ):
+                mock_llm.stream_chunks.side_effect = muitos_tokens
+                texto = self._stream(TestClient(app))
+
+            assert texto.count("data: tok") == 200
+            assert is_disconnected.await_count <= 1
+        finally:
+            app.dependency_overrides.clear()
+
+
 class TestAuthEndpoints:
     """Testes para os endpoints de autenticação"""
 
@@ -238,51 +361,71 @@ class TestPDFUpload:
     """Testes para o endpoint de upload de PDF"""
 
     def test_pdf_upload_success(self):
-        """Testa upload de PDF com sucesso"""
+        """Testa upload de PDF: arquivo salvo e job de indexação agendado"""
         with patch("polaris_main.os.makedirs") as mock_makedirs:
             with patch("builtins.open", create=True) as mock_open:
                 mock_file = Mock()
                 mock_open.return_value.__enter__.return_value = mock_file
 
-                with patch(
-                    "langchain_community.document_loaders.PyMuPDFLoader"
-                ) as mock_loader:
-                    mock_doc = Mock()
-                    mock_doc.page_content = "Test PDF content"
-                    mock_loader.return_value.load.return_value = [mock_doc]
-
-                    with patch("polaris_main.vectorstore") as mock_vectorstore:
-                        with patch("polaris_main.os.remove") as mock_remove:
-                            with patch("polaris_main.log_success") as mock_log:
-                                client = TestClient(app)
-
-                                # Criar arquivo PDF mock
-                                pdf_content = b"fake pdf content"
-
-                                response = client.post(
-                                    "/upload-pdf/",
-                                    files={
-                                        "file": (
-                                            "test.pdf",
-                                            pdf_content,
-                                            "application/pdf",
-                                        )
-                                    },
-                                    data={"session_id": "test_session"},
+                with patch("polaris_main.ingest_jobs") as mock_jobs:
+                    mock_jobs.submit.return_value = Mock(id="job123")
+
+                    with patch("polaris_main.log_success") as mock_log:
+                        client = TestClient(app)
+
+                        # Criar arquivo PDF mock
+                        pdf_content = b"fake pdf content"
+
+                        response = client.post(
+                            "/upload-pdf/",
+                            files={
+                                "file": (
+                                    "test.pdf",
+                                    pdf_content,
+                                    "application/pdf",
                                 )
+                            },
+                            data={"session_id": "test_session"},
+                        )
+
+                        assert response.status_code == 202
+                        data = response.json()
+                        assert data["job_id"] == "job123"
+                        assert data["status_url"] == "/upload-pdf/job123"
+
+                        # Verificar se operações foram chamadas
+                        mock_makedirs.assert_called()
+                        mock_open.assert_called()
+                        mock_file.write.assert_called_with(pdf_content)
+                        args, kwargs = mock_jobs.submit.call_args
+                        assert args[1] == "test_session"
+                        assert kwargs["source"] == "test.pdf"
+                        mock_log.assert_called()
+
+    def test_pdf_upload_status(self):
+        """Testa consulta de progresso de um job de indexação"""
+        with patch("polaris_main.ingest_jobs") as mock_jobs:
+            mock_jobs.get.return_value.to_dict.return_value = {
+                "job_id": "job123",
+                "status": "running",
+                "pages_processed": 10,
+            }
+            client = TestClient(app)
+
+            response = client.get("/upload-pdf/job123")
+
+            assert response.status_code == 200
+            assert response.json()["pages_processed"] == 10
+
+    def test_pdf_upload_status_not_found(self):
+        """Testa job inexistente"""
+        with patch("polaris_main.ingest_jobs") as mock_jobs:
+            mock_jobs.get.return_value = None
+            client = TestClient(app)
+
+            response = client.get("/upload-pdf/desconhecido")
 
-                                assert response.status_code == 200
-                                data = response.json()
-                                assert "message" in data
-                                assert "PDF processado" in data["message"]
-
-                                # Verificar se operações foram chamadas
-                                mock_makedirs.assert_called()
-                                mock_open.assert_called()
-                                mock_loader.assert_called()
-                                mock_vectorstore.add_texts.assert_called()
-                                mock_remove.assert_called()
-                                mock_log.assert_called()
+            assert response.status_code == 404
 
     def test_pdf_upload_error(self):
         """Testa upload de PDF com erro"""
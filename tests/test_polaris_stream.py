@@ -0,0 +1,156 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+# Importar módulos da API
+from polaris_stream import TokenBridge, AsyncTokenStream
+
+
+async def _collect(bridge):
+    return [item async for item in bridge]
+
+
+class TestTokenBridge:
+    """Testes para a ponte de tokens do streaming"""
+
+    def test_delivers_tokens_in_order(self):
+        """Testa se todos os tokens chegam na ordem produzida"""
+
+        async def run():
+            bridge = TokenBridge(lambda: iter(["Olá", ", ", "mundo"])).start()
+            return await _collect(bridge)
+
+        assert asyncio.run(run()) == ["Olá", ", ", "mundo"]
+
+    def test_propagates_producer_error(self):
+        """Testa se erro do produtor é relançado no consumidor"""
+
+        def producer():
+            yield "parcial"
+            raise RuntimeError("falha no backend")
+
+        async def run():
+            bridge = TokenBridge(producer).start()
+            recebidos = []
+            with pytest.raises(RuntimeError, match="falha no backend"):
+                async for item in bridge:
+                    recebidos.append(item)
+            return recebidos
+
+        assert asyncio.run(run()) == ["parcial"]
+
+    def test_bounded_queue_applies_backpressure(self):
+        """Testa se o produtor espera quando a fila está cheia"""
+        produzidos = []
+
+        def producer():
+            for i in range(10):
+                produzidos.append(i)
+                yield str(i)
+
+        async def run():
+            bridge = TokenBridge(producer, maxsize=2).start()
+            await asyncio.sleep(0.2)
+            # Fila cheia (2) + um item aguardando vaga no put
+            assert len(produzidos) <= 3
+            return await _collect(bridge)
+
+        assert asyncio.run(run()) == [str(i) for i in range(10)]
+
+    def test_consumer_wakes_without_polling(self):
+        """Testa se o token chega logo após ser produzido"""
+
+        def producer():
+            time.sleep(0.1)
+            yield "token"
+
+        async def run():
+            bridge = TokenBridge(producer).start()
+            start = time.time()
+            items = await _collect(bridge)
+            return items, time.time() - start
+
+        items, elapsed = asyncio.run(run())
+        assert items == ["token"]
+        assert elapsed < 0.5
+
+    def test_close_stops_producer_and_closes_upstream(self):
+        """Testa se close() interrompe o produtor e fecha o gerador upstream"""
+        encerrado = threading.Event()
+        produzidos = []
+
+        def producer():
+            try:
+                i = 0
+                while True:
+                    produzidos.append(i)
+                    yield str(i)
+                    i += 1
+            finally:
+                encerrado.set()
+
+        async def run():
+            bridge = TokenBridge(producer, maxsize=2).start()
+            recebidos = []
+            async for item in bridge:
+                recebidos.append(item)
+                if len(recebidos) == 3:
+                    bridge.close()
+                    break
+            await asyncio.sleep(0.1)
+            return bridge, recebidos
+
+        bridge, recebidos = asyncio.run(run())
+
+        assert recebidos == ["0", "1", "2"]
+        assert bridge.cancelled
+        assert encerrado.wait(timeout=1)
+        assert len(produzidos) < 10
+
+
+class TestAsyncTokenStream:
+    """Testes para o stream de backends assíncronos nativos"""
+
+    def test_delivers_tokens_and_calls_on_close_once(self):
+        """Testa entrega dos tokens e liberação única ao terminar"""
+        closes = []
+
+        async def chunks():
+            for token in ["a", "b"]:
+                yield token
+
+        async def run():
+            stream = AsyncTokenStream(chunks(), on_close=lambda: closes.append(1))
+            items = [item async for item in stream]
+            stream.close()
+            await asyncio.sleep(0)
+            return items
+
+        assert asyncio.run(run()) == ["a", "b"]
+        assert closes == [1]
+
+    def test_close_stops_upstream(self):
+        """Testa se close() encerra o gerador upstream no meio do stream"""
+        state = {"closed": False, "released": False}
+
+        async def chunks():
+            try:
+                while True:
+                    yield "x"
+            finally:
+                state["closed"] = True
+
+        async def run():
+            stream = AsyncTokenStream(
+                chunks(), on_close=lambda: state.update(released=True)
+            )
+            async for _ in stream:
+                stream.close()
+                break
+            await asyncio.sleep(0)
+            return stream.cancelled
+
+        assert asyncio.run(run())
+        assert state == {"closed": True, "released": True}
@@ -0,0 +1,168 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+
+# Importar módulos da API
+from resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    llm_is_failure,
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+)
+
+
+def _falha():
+    raise ConnectionError("fora do ar")
+
+
+class TestCircuitBreaker:
+    """Testes dos estados do circuit breaker"""
+
+    def test_abre_apos_falhas_seguidas(self):
+        """failure_threshold falhas seguidas abrem o circuito"""
+        breaker = CircuitBreaker("teste", failure_threshold=3, recovery_timeout=30)
+
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                breaker.call_sync(_falha)
+
+        assert breaker.state == OPEN
+
+    def test_sucesso_zera_as_falhas(self):
+        """Falhas intercaladas com sucesso não abrem o circuito"""
+        breaker = CircuitBreaker("teste", failure_threshold=2)
+
+        with pytest.raises(ConnectionError):
+            breaker.call_sync(_falha)
+        breaker.call_sync(lambda: "ok")
+        with pytest.raises(ConnectionError):
+            breaker.call_sync(_falha)
+
+        assert breaker.state == CLOSED
+
+    def test_aberto_pula_a_dependencia(self):
+        """Com o circuito aberto a função nem é chamada"""
+        breaker = CircuitBreaker("teste", failure_threshold=1, recovery_timeout=30)
+        with pytest.raises(ConnectionError):
+            breaker.call_sync(_falha)
+
+        chamadas = []
+        start = time.perf_counter()
+        with pytest.raises(CircuitOpenError):
+            breaker.call_sync(chamadas.append, 1)
+
+        assert chamadas == []
+        assert time.perf_counter() - start < 0.01
+
+    def test_meio_aberto_deixa_uma_chamada_de_teste(self):
+        """Após recovery_timeout uma única chamada passa; sucesso fecha"""
+        breaker = CircuitBreaker("teste", failure_threshold=1, recovery_timeout=30)
+        with patch("resilience.time.monotonic", return_value=100.0):
+            with pytest.raises(ConnectionError):
+                breaker.call_sync(_falha)
+
+        with patch("resilience.time.monotonic", return_value=131.0):
+            assert breaker.allow() is True
+            assert breaker.state == HALF_OPEN
+            assert breaker.allow() is False  # só uma chamada de teste por vez
+            breaker.record_success()
+
+        assert breaker.state == CLOSED
+
+    def test_falha_no_meio_aberto_reabre(self):
+        """Chamada de teste com falha reabre o circuito por mais um período"""
+        breaker = CircuitBreaker("teste", failure_threshold=5, recovery_timeout=30)
+        for _ in range(5):
+            with patch("resilience.time.monotonic", return_value=100.0):
+                with pytest.raises(ConnectionError):
+                    breaker.call_sync(_falha)
+
+        with patch("resilience.time.monotonic", return_value=131.0):
+            with pytest.raises(ConnectionError):
+                breaker.call_sync(_falha)
+        assert breaker.state == OPEN
+
+        with patch("resilience.time.monotonic", return_value=150.0):
+            assert breaker.allow() is False
+
+    def test_excecao_ignorada_nao_conta(self):
+        """is_failure=False libera a chamada sem mexer no estado"""
+        breaker = CircuitBreaker(
+            "teste", failure_threshold=1, is_failure=lambda e: False
+        )
+
+        with pytest.raises(ConnectionError):
+            breaker.call_sync(_falha)
+
+        assert breaker.state == CLOSED
+
+    def test_erros_do_pedido_nao_abrem_o_circuito_do_llm(self):
+        """Prompt grande demais e fila cheia não contam; timeout e queda contam"""
+        assert not llm_is_failure(ValueError("prompt excede o contexto"))
+        assert not llm_is_failure(TypeError("argumento inválido"))
+        assert not llm_is_failure(HTTPException(status_code=429))
+        assert llm_is_failure(HTTPException(status_code=504))
+        assert llm_is_failure(ConnectionError("fora do ar"))
+
+        breaker = CircuitBreaker("llm", failure_threshold=1, is_failure=llm_is_failure)
+
+        def _prompt_grande():
+            raise ValueError("prompt excede o contexto")
+
+        with pytest.raises(ValueError):
+            breaker.call_sync(_prompt_grande)
+        assert breaker.state == CLOSED
+
+    def test_chamada_lenta_conta_como_falha(self):
+        """call_sync não interrompe, mas passar do timeout é falha"""
+        breaker = CircuitBreaker("teste", failure_threshold=1, timeout=0.01)
+
+        assert breaker.call_sync(lambda: time.sleep(0.05) or "tarde") == "tarde"
+        assert breaker.state == OPEN
+
+
+class TestCircuitBreakerAsync:
+    """Testes da chamada assíncrona com timeout"""
+
+    def test_timeout_interrompe_e_conta(self):
+        """Corrotina além do timeout é cancelada e conta como falha"""
+        breaker = CircuitBreaker("teste", failure_threshold=1, timeout=0.05)
+
+        async def lenta():
+            await asyncio.sleep(1)
+
+        async def run():
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await breaker.call(lenta)
+            return time.perf_counter() - start
+
+        assert asyncio.run(run()) < 0.5
+        assert breaker.state == OPEN
+
+    def test_funcao_sincrona_roda_em_thread(self):
+        """Funções bloqueantes são executadas fora do event loop"""
+        breaker = CircuitBreaker("teste")
+
+        resultado = asyncio.run(breaker.call(lambda x: x * 2, 21))
+
+        assert resultado == 42
+        assert breaker.state == CLOSED
+
+    def test_aberto_rejeita_sem_await(self):
+        """Com o circuito aberto a corrotina nem é criada"""
+        breaker = CircuitBreaker("teste", failure_threshold=1, recovery_timeout=30)
+        breaker.record_failure()
+        chamadas = []
+
+        async def dependencia():
+            chamadas.append(1)
+
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(breaker.call(dependencia))
+        assert chamadas == []
@@ -0,0 +1,129 @@
+import time
+from unittest.mock import Mock
+
+import chromadb
+from chromadb.config import Settings
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# Importar módulos da API
+from numpy_vectorstore import NumpyVectorStore
+from retention import RetentionEngine, is_response
+from session_vectorstore import SessionVectorStore
+
+DIA = 86400
+
+
+def _popular(store, agora):
+    """Sessão s1 com 5 respostas (uma muito antiga) + 1 PDF antigo; s2 com 2"""
+    textos, metadados = [], []
+    for i in range(5):
+        textos.append(f"resposta {i}")
+        metadados.append(
+            {
+                "session_id": "s1",
+                "kind": "response",
+                "created_at": agora - (400 if i == 0 else 5 - i) * DIA,
+            }
+        )
+    textos.append("pdf antigo")
+    metadados.append(
+        {
+            "session_id": "s1",
+            "source": "a.pdf",
+            "page": 0,
+            "created_at": agora - 900 * DIA,
+        }
+    )
+    for i in range(2):
+        textos.append(f"outra {i}")
+        metadados.append(
+            {"session_id": "s2", "kind": "response", "created_at": agora - i * DIA}
+        )
+    store.add_texts(textos, metadatas=metadados)
+
+
+def _documentos(store, session_id):
+    return sorted(store.get(where={"session_id": session_id})["documents"])
+
+
+class TestRetentionEngine:
+    """Testes para a retenção e compactação do vectorstore"""
+
+    def test_is_response_keeps_documents(self):
+        """Testa a classificação, inclusive de registros antigos sem "kind\" """
+        assert is_response({"kind": "response"})
+        assert not is_response({"kind": "document"})
+        # Registros antigos sem "kind" podem ser trechos de PDF: nunca expiram
+        assert not is_response({"session_id": "s1"})
+        assert not is_response({"session_id": "s1", "source": "a.pdf", "page": 3})
+
+    def test_legacy_records_survive_count_limits(self, tmp_path):
+        """Testa se registros sem "kind" não são removidos pelos limites"""
+        agora = time.time()
+        store = NumpyVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=8))
+        store.add_texts(
+            ["trecho de pdf antigo", "resposta nova"],
+            metadatas=[
+                {"session_id": "s1"},
+                {"session_id": "s1", "kind": "response", "created_at": agora},
+            ],
+        )
+        engine = RetentionEngine(lambda: store, max_responses=1, max_total=1)
+
+        stats = engine.run_once(now=agora)
+
+        assert stats["deleted"] == 0
+        assert _documentos(store, "s1") == ["resposta nova", "trecho de pdf antigo"]
+
+    def test_age_and_session_limits_numpy(self, tmp_path):
+        """Testa idade + limite por sessão sem tocar em documentos enviados"""
+        agora = time.time()
+        store = NumpyVectorStore(str(tmp_path), DeterministicFakeEmbedding(size=8))
+        _popular(store, agora)
+        mudou = Mock()
+        engine = RetentionEngine(
+            lambda: store,
+            max_age_days=90,
+            max_responses=3,
+            compact_ratio=0.2,
+            on_change=[mudou],
+        )
+
+        stats = engine.run_once(now=agora)
+
+        assert stats["deleted"] == 2
+        assert _documentos(store, "s1") == [
+            "pdf antigo",
+            "resposta 2",
+            "resposta 3",
+            "resposta 4",
+        ]
+        assert _documentos(store, "s2") == ["outra 0", "outra 1"]
+        mudou.assert_called_with("s1")
+        # Busca continua funcionando depois da reescrita
+        docs = store.similarity_search("resposta 4", k=1, filter={"session_id": "s1"})
+        assert docs[0].page_content == "resposta 4"
+
+    def test_global_limit_and_compaction_chroma(self, tmp_path):
+        """Testa o limite global e a compactação (coleção recriada) no Chroma"""
+        agora = time.time()
+        client = chromadb.PersistentClient(
+            path=str(tmp_path), settings=Settings(anonymized_telemetry=False)
+        )
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=client
+        )
+        _popular(store, agora)
+        engine = RetentionEngine(
+            lambda: store, max_age_days=0, max_responses=0, max_total=3
+        )
+
+        stats = engine.run_once(now=agora)
+
+        assert stats["deleted"] == 4
+        assert stats["compacted"] == 1
+        assert _documentos(store, "s1") == ["pdf antigo", "resposta 4"]
+        assert _documentos(store, "s2") == ["outra 0", "outra 1"]
+        assert not any(c.name.endswith("_compact") for c in client.list_collections())
+        docs = store.similarity_search("resposta 4", k=1, filter={"session_id": "s1"})
+        assert docs[0].page_content == "resposta 4"
@@ -0,0 +1,184 @@
+import threading
+import zlib
+from unittest.mock import Mock
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+# Importar módulos da API
+from numpy_vectorstore import NumpyVectorStore
+from retrieval import BM25Index, HybridRetriever, tokenize
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    """Embedding determinístico por contagem de termos (similaridade previsível)"""
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def _vector(self, text):
+        vector = np.zeros(self.dim)
+        for term in tokenize(text):
+            # crc32 é estável entre execuções (hash() varia com PYTHONHASHSEED)
+            vector[zlib.crc32(term.encode()) % self.dim] += 1
+        return vector.tolist()
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+def _retriever(tmp_path, textos, **kwargs):
+    embeddings = BagOfWordsEmbeddings()
+    store = NumpyVectorStore(str(tmp_path), embeddings)
+    store.add_texts(textos, metadatas=[{"session_id": "s1"} for _ in textos])
+    return store, HybridRetriever(lambda: store, embeddings, **kwargs)
+
+
+class TestBM25Index:
+    """Testes para o índice lexical"""
+
+    def test_ranks_rare_terms_higher(self):
+        """Testa se termos raros pesam mais e acentos são ignorados"""
+        index = BM25Index()
+        index.add(
+            ["o contrato de locação", "o contrato de compra", "o relatório anual"],
+            [{}, {}, {}],
+        )
+
+        hits = index.search("locacao do contrato", k=3)
+        assert hits[0][0] == 0
+        assert {i for i, _ in hits} == {0, 1}
+        assert index.search("inexistente", k=3) == []
+
+
+class TestHybridRetriever:
+    """Testes para a busca híbrida com rerank, MMR e corte"""
+
+    def test_irrelevant_query_injects_nothing(self, tmp_path):
+        """Testa se sem trecho relevante nenhum documento vai para o prompt"""
+        _, retriever = _retriever(
+            tmp_path, ["receita de bolo de cenoura", "manual da impressora"]
+        )
+
+        assert retriever.search("cotação do dólar hoje", "s1") == []
+
+    def test_relevant_chunk_is_returned_with_score(self, tmp_path):
+        """Testa se o trecho certo é escolhido e carrega o score"""
+        _, retriever = _retriever(
+            tmp_path,
+            ["receita de bolo de cenoura", "manual da impressora laser", "outro texto"],
+        )
+
+        docs = retriever.search("como configurar a impressora laser", "s1")
+        assert docs[0].page_content == "manual da impressora laser"
+        assert docs[0].metadata["score"] >= retriever.min_score
+
+    def test_mmr_skips_near_duplicates(self, tmp_path):
+        """Testa se trechos repetidos não ocupam todas as vagas"""
+        _, retriever = _retriever(
+            tmp_path,
+            [
+                "backup do servidor às 2h",
+                "backup do servidor às 2h!",
+                "backup do banco de dados semanal",
+            ],
+            k=2,
+            mmr_lambda=0.5,
+            min_score=0.1,
+        )
+
+        docs = retriever.search("backup do servidor", "s1")
+        assert len(docs) == 2
+        assert "backup do banco de dados semanal" in [d.page_content for d in docs]
+
+    def test_bm25_index_follows_new_documents(self, tmp_path):
+        """Testa se o índice lexical é completado quando a sessão cresce"""
+        store, retriever = _retriever(tmp_path, ["primeiro documento"])
+        retriever.search("primeiro", "s1")
+
+        store.add_texts(["segundo documento xyzzy"], metadatas=[{"session_id": "s1"}])
+        docs = retriever.search("xyzzy", "s1")
+
+        assert len(retriever._indexes["s1"]) == 2
+        assert docs[0].page_content == "segundo documento xyzzy"
+
+    def test_cold_session_load_does_not_block_others(self, tmp_path):
+        """Testa se carregar o BM25 de uma sessão fria não trava as outras"""
+        store, retriever = _retriever(tmp_path, ["manual da impressora laser"])
+        store.add_texts(["receita de bolo"], metadatas=[{"session_id": "s2"}])
+        retriever._bm25("s1", "impressora", 1)
+
+        release = threading.Event()
+        loading = threading.Event()
+        get = store.get
+
+        def slow_get(*args, **kwargs):
+            if kwargs.get("where") == {"session_id": "s2"}:
+                loading.set()
+                release.wait(timeout=5)
+            return get(*args, **kwargs)
+
+        store.get = slow_get
+        cold = threading.Thread(target=retriever._bm25, args=("s2", "bolo", 1))
+        cold.start()
+        loading.wait(timeout=5)
+
+        warm = threading.Thread(target=retriever._bm25, args=("s1", "impressora", 1))
+        warm.start()
+        warm.join(timeout=1)
+        blocked = warm.is_alive()
+        release.set()
+        cold.join(timeout=5)
+        warm.join(timeout=5)
+
+        assert not blocked
+
+    def test_session_prefix_does_not_match_everything(self, tmp_path):
+        """Testa se o prefixo [session_id=X] não faz toda consulta casar"""
+        _, retriever = _retriever(
+            tmp_path,
+            [
+                "[session_id=s1]\nreceita de bolo de cenoura",
+                "[session_id=s1]\nmanual da impressora laser",
+            ],
+        )
+
+        assert retriever.search("[session_id=s1]\ncotação do dólar hoje", "s1") == []
+        docs = retriever.search("[session_id=s1]\nimpressora laser", "s1")
+        assert docs[0].page_content == "[session_id=s1]\nmanual da impressora laser"
+
+    def test_rerank_reuses_stored_vectors(self, tmp_path):
+        """Testa se o rerank usa os vetores gravados em vez de recalcular"""
+        store, retriever = _retriever(
+            tmp_path, ["manual da impressora laser", "receita de bolo"]
+        )
+        retriever.embeddings = Mock(wraps=retriever.embeddings)
+
+        docs = retriever.search("impressora laser", "s1")
+
+        assert docs[0].page_content == "manual da impressora laser"
+        retriever.embeddings.embed_documents.assert_not_called()
+
+    def test_cross_encoder_scores(self):
+        """Testa o rerank com cross-encoder, com scores em 0..1"""
+        store = Mock()
+        store.similarity_search.return_value = [
+            Document(page_content="a", metadata={}),
+            Document(page_content="b", metadata={}),
+        ]
+        retriever = HybridRetriever(
+            lambda: store,
+            BagOfWordsEmbeddings(),
+            use_bm25=False,
+            rerank_model="fake",
+            min_score=0.5,
+        )
+        retriever._cross_encoder = Mock()
+        retriever._cross_encoder.predict.return_value = [-3.0, 4.0]
+
+        docs = retriever.search("pergunta", "s1")
+        assert [d.page_content for d in docs] == ["b"]
@@ -0,0 +1,339 @@
+import time
+from unittest.mock import patch
+
+# Importar módulos da API
+from session_store import (
+    SessionStore,
+    SQLiteSessionStore,
+    RedisSessionStore,
+    Message,
+    USER,
+    ASSISTANT,
+)
+
+
+class TestRingBuffer:
+    """Testes do histórico limitado por sessão"""
+
+    def test_mantem_apenas_as_ultimas_mensagens(self):
+        """O deque descarta as mensagens mais antigas (FIFO)"""
+        store = SessionStore(history=4, max_sessions=10, ttl=0)
+
+        for i in range(5):
+            store.save_turn("s1", f"pergunta {i}", f"resposta {i}")
+
+        messages = store.messages("s1")
+        assert [m.content for m in messages] == [
+            "pergunta 3",
+            "resposta 3",
+            "pergunta 4",
+            "resposta 4",
+        ]
+        assert [m.role for m in messages] == [USER, ASSISTANT, USER, ASSISTANT]
+
+    def test_sessao_desconhecida_nao_e_criada_na_leitura(self):
+        """Ler uma sessão inexistente devolve [] sem ocupar memória"""
+        store = SessionStore(history=4, max_sessions=10, ttl=0)
+
+        assert store.messages("nova") == []
+        assert "nova" not in store
+        assert len(store) == 0
+
+    def test_mensagem_sem_dict(self):
+        """Mensagens usam __slots__"""
+        assert not hasattr(Message(USER, "oi"), "__dict__")
+
+
+class TestBytes:
+    """Testes da contabilidade de memória"""
+
+    def test_bytes_acompanham_o_ring_buffer(self):
+        """Mensagens descartadas pelo FIFO saem da conta"""
+        store = SessionStore(history=2, max_sessions=10, ttl=0)
+
+        store.save_turn("s1", "a" * 100, "b" * 100)
+        cheio = store.resident_bytes
+        store.save_turn("s1", "c" * 100, "d" * 100)
+
+        assert store.resident_bytes == cheio
+        assert store.resident_bytes == sum(m.size for m in store.messages("s1"))
+
+    def test_replace_recalcula_bytes(self):
+        """replace troca o histórico e ajusta os bytes"""
+        store = SessionStore(history=4, max_sessions=10, ttl=0)
+        store.save_turn("s1", "x" * 1000, "y" * 1000)
+
+        store.replace("s1", [Message(ASSISTANT, "resumo")])
+
+        assert [m.content for m in store.messages("s1")] == ["resumo"]
+        assert store.resident_bytes == Message(ASSISTANT, "resumo").size
+
+    def test_discard_libera_bytes(self):
+        """Descartar a sessão zera sua contribuição"""
+        store = SessionStore(history=4, max_sessions=10, ttl=0)
+        store.save_turn("s1", "oi", "olá")
+
+        store.discard("s1")
+
+        assert len(store) == 0
+        assert store.resident_bytes == 0
+
+
+class TestEviction:
+    """Testes de LRU e TTL"""
+
+    def test_lru_descarta_a_sessao_menos_usada(self):
+        """Acima de max_sessions, sai a sessão acessada há mais tempo"""
+        store = SessionStore(history=4, max_sessions=2, ttl=0)
+        store.save_turn("s1", "oi", "olá")
+        store.save_turn("s2", "oi", "olá")
+        store.messages("s1")  # s1 passa a ser a mais recente
+
+        store.save_turn("s3", "oi", "olá")
+
+        assert "s1" in store
+        assert "s2" not in store
+        assert "s3" in store
+        assert len(store) == 2
+
+    def test_memoria_estavel_com_muitas_sessoes(self):
+        """Milhares de chats distintos não aumentam o número de sessões residentes"""
+        store = SessionStore(history=4, max_sessions=50, ttl=0)
+
+        for i in range(2000):
+            store.save_turn(f"chat-{i}", "pergunta", "resposta")
+
+        assert len(store) == 50
+        assert store.resident_bytes == sum(
+            m.size for i in range(1950, 2000) for m in store.messages(f"chat-{i}")
+        )
+
+    def test_ttl_expira_sessoes_ociosas(self):
+        """Sessões paradas há mais que o TTL são descartadas"""
+        store = SessionStore(history=4, max_sessions=10, ttl=60)
+
+        with patch("session_store.time.monotonic", return_value=1000.0):
+            store.save_turn("velha", "oi", "olá")
+        with patch("session_store.time.monotonic", return_value=1030.0):
+            store.save_turn("nova", "oi", "olá")
+
+        with patch("session_store.time.monotonic", return_value=1080.0):
+            assert store.messages("velha") == []
+            nova = store.messages("nova")
+
+        assert len(nova) == 2
+        assert "velha" not in store
+        assert store.resident_bytes == sum(m.size for m in nova)
+
+
+class TestSQLiteSessionStore:
+    """Testes do backend SQLite com write-behind"""
+
+    def _abrir(self, tmp_path, **kwargs):
+        kwargs.setdefault("flush_interval", 60)
+        return SQLiteSessionStore(
+            str(tmp_path / "sessions.sqlite3"), history=4, ttl=0, **kwargs
+        )
+
+    def _linhas(self, store):
+        return store._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def test_escrita_fica_pendente_ate_o_flush(self, tmp_path):
+        """save_turn só vai para o cache; o banco recebe no flush"""
+        store = self._abrir(tmp_path)
+        store.save_turn("s1", "oi", "olá")
+
+        assert [m.content for m in store.messages("s1")] == ["oi", "olá"]
+        assert self._linhas(store) == 0
+
+        assert store.flush() == 2
+        assert self._linhas(store) == 2
+        store.close()
+
+    def test_sobrevive_a_restart(self, tmp_path):
+        """close grava o pendente; outra instância lê o histórico"""
+        store = self._abrir(tmp_path)
+        store.save_turn("s1", "pergunta", "resposta")
+        store.close()
+
+        reaberto = self._abrir(tmp_path)
+        messages = reaberto.messages("s1")
+        assert [(m.role, m.content) for m in messages] == [
+            (USER, "pergunta"),
+            (ASSISTANT, "resposta"),
+        ]
+        reaberto.close()
+
+    def test_banco_guarda_so_o_historico(self, tmp_path):
+        """O flush apaga as mensagens além de `history` por sessão"""
+        store = self._abrir(tmp_path)
+        for i in range(5):
+            store.save_turn("s1", f"pergunta {i}", f"resposta {i}")
+        store.flush()
+
+        assert self._linhas(store) == 4
+        store.close()
+
+    def test_workers_compartilham_a_sessao(self, tmp_path):
+        """Um segundo processo (outra conexão) vê as gravações do primeiro"""
+        worker_a = self._abrir(tmp_path)
+        worker_b = self._abrir(tmp_path)
+
+        worker_a.save_turn("s1", "oi", "olá")
+        worker_a.flush()
+        assert len(worker_b.messages("s1")) == 2  # agora em cache no worker B
+
+        worker_a.save_turn("s1", "tudo bem?", "tudo!")
+        worker_a.flush()
+        # data_version mudou: o cache do worker B é invalidado
+        assert [m.content for m in worker_b.messages("s1")] == [
+            "oi",
+            "olá",
+            "tudo bem?",
+            "tudo!",
+        ]
+        worker_a.close()
+        worker_b.close()
+
+    def test_pendentes_sobrevivem_a_invalidacao(self, tmp_path):
+        """Mensagens ainda não gravadas continuam visíveis após recarregar"""
+        worker_a = self._abrir(tmp_path)
+        worker_b = self._abrir(tmp_path)
+
+        worker_b.save_turn("s2", "local", "ainda pendente")
+        worker_a.save_turn("s1", "oi", "olá")
+        worker_a.flush()
+
+        assert [m.content for m in worker_b.messages("s2")] == [
+            "local",
+            "ainda pendente",
+        ]
+        worker_a.close()
+        worker_b.close()
+
+    def test_flush_por_lote(self, tmp_path):
+        """Com o lote cheio, a thread grava sem esperar o intervalo"""
+        store = self._abrir(tmp_path, batch_size=2)
+        store.save_turn("s1", "oi", "olá")
+
+        for _ in range(100):
+            if store.pending == 0:
+                break
+            time.sleep(0.01)
+        assert store.pending == 0
+        store.close()
+
+    def test_replace_e_delete(self, tmp_path):
+        """replace grava na hora; delete remove do banco e do cache"""
+        store = self._abrir(tmp_path)
+        store.save_turn("s1", "x", "y")
+        store.replace("s1", [Message(ASSISTANT, "resumo")])
+        store.flush()
+
+        assert self._linhas(store) == 1
+        assert [m.content for m in store.messages("s1")] == ["resumo"]
+
+        store.delete("s1")
+        assert self._linhas(store) == 0
+        assert store.messages("s1") == []
+        store.close()
+
+    def test_expira_sessoes_ociosas(self, tmp_path):
+        """purge_expired apaga sessões sem escrita há mais que o TTL"""
+        store = SQLiteSessionStore(
+            str(tmp_path / "sessions.sqlite3"), history=4, ttl=60, flush_interval=60
+        )
+        with patch("session_store.time.time", return_value=1000.0):
+            store.save_turn("velha", "oi", "olá")
+            store.flush()
+        with patch("session_store.time.time", return_value=1050.0):
+            store.save_turn("nova", "oi", "olá")
+            store.flush()
+
+        assert store.purge_expired(now=1100.0) == 1
+        assert self._linhas(store) == 2
+        store.close()
+
+
+class FakeRedis:
+    """Substituto local do cliente redis (listas + pipeline)"""
+
+    def __init__(self):
+        self.lists = {}
+        self.expires = {}
+
+    def pipeline(self):
+        return _FakePipeline(self)
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(v.encode() for v in values)
+
+    def ltrim(self, key, start, end):
+        items = self.lists.get(key, [])
+        self.lists[key] = items[start : (None if end == -1 else end + 1)]
+
+    def expire(self, key, seconds):
+        self.expires[key] = seconds
+
+    def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+    def delete(self, key):
+        self.lists.pop(key, None)
+
+    def close(self):
+        pass
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.calls.append((name, args))
+
+    def execute(self):
+        for name, args in self.calls:
+            getattr(self.client, name)(*args)
+
+
+class TestRedisSessionStore:
+    """Testes do backend Redis com um cliente local"""
+
+    def test_turnos_e_historico_limitado(self):
+        """RPUSH + LTRIM mantêm as últimas mensagens, com TTL"""
+        client = FakeRedis()
+        store = RedisSessionStore(history=4, ttl=3600, client=client)
+
+        for i in range(3):
+            store.save_turn("s1", f"pergunta {i}", f"resposta {i}")
+
+        messages = store.messages("s1")
+        assert [m.content for m in messages] == [
+            "pergunta 1",
+            "resposta 1",
+            "pergunta 2",
+            "resposta 2",
+        ]
+        assert messages[0].role == USER
+        assert client.expires["polaris:session:s1"] == 3600
+
+    def test_instancias_compartilham_o_cliente(self):
+        """Dois workers apontando para o mesmo Redis veem a mesma conversa"""
+        client = FakeRedis()
+        RedisSessionStore(history=4, client=client).save_turn("s1", "oi", "olá")
+
+        outro = RedisSessionStore(history=4, client=client)
+        assert [m.content for m in outro.messages("s1")] == ["oi", "olá"]
+
+    def test_replace_e_delete(self):
+        """replace reescreve a lista; delete apaga a chave"""
+        store = RedisSessionStore(history=4, client=FakeRedis())
+        store.save_turn("s1", "x", "y")
+
+        store.replace("s1", [Message(ASSISTANT, "resumo")])
+        assert [m.content for m in store.messages("s1")] == ["resumo"]
+
+        store.delete("s1")
+        assert store.messages("s1") == []
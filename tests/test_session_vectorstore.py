@@ -0,0 +1,200 @@
+import threading
+from unittest.mock import patch
+
+import chromadb
+from chromadb.config import Settings
+from langchain_chroma import Chroma
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+# Importar módulos da API
+from session_vectorstore import SessionVectorStore, LEGACY_COLLECTION
+
+
+def _client(tmp_path):
+    return chromadb.PersistentClient(
+        path=str(tmp_path), settings=Settings(anonymized_telemetry=False)
+    )
+
+
+class TestSessionVectorStore:
+    """Testes para o vectorstore particionado por sessão"""
+
+    def test_sessions_live_in_separate_collections(self, tmp_path):
+        """Testa se cada sessão grava e busca só na própria coleção"""
+        client = _client(tmp_path)
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=client
+        )
+
+        store.add_texts(
+            ["da s1", "da s2", "outra da s1"],
+            metadatas=[
+                {"session_id": "s1"},
+                {"session_id": "s2"},
+                {"session_id": "s1"},
+            ],
+        )
+
+        assert client.get_collection(store.partition_name("s1")).count() == 2
+        assert client.get_collection(store.partition_name("s2")).count() == 1
+        docs = store.similarity_search("da s1", k=5, filter={"session_id": "s1"})
+        assert sorted(d.page_content for d in docs) == ["da s1", "outra da s1"]
+        assert store.get(where={"session_id": "s2"})["documents"] == ["da s2"]
+
+    def test_unknown_session_does_not_create_collection(self, tmp_path):
+        """Testa se a leitura de sessão sem dados não cria coleção vazia"""
+        client = _client(tmp_path)
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=client
+        )
+
+        assert store.similarity_search("x", filter={"session_id": "nova"}) == []
+        assert store.get(where={"session_id": "nova"})["documents"] == []
+        assert client.list_collections() == []
+
+    def test_bucket_mode_keeps_session_filter(self, tmp_path):
+        """Testa se no modo bucket sessões que dividem coleção não se misturam"""
+        store = SessionVectorStore(
+            "",
+            DeterministicFakeEmbedding(size=8),
+            mode="bucket",
+            buckets=1,
+            client=_client(tmp_path),
+        )
+
+        store.add_texts(
+            ["da s1", "da s2"],
+            metadatas=[{"session_id": "s1"}, {"session_id": "s2"}],
+        )
+
+        assert store.partition_name("s1") == store.partition_name("s2")
+        docs = store.similarity_search("da", k=5, filter={"session_id": "s2"})
+        assert [d.page_content for d in docs] == ["da s2"]
+        store.delete_session("s2")
+        assert store.get(where={"session_id": "s2"})["documents"] == []
+        assert store.get(where={"session_id": "s1"})["documents"] == ["da s1"]
+
+    def test_handle_cache_is_bounded(self, tmp_path):
+        """Testa a LRU de handles abertos"""
+        store = SessionVectorStore(
+            "",
+            DeterministicFakeEmbedding(size=8),
+            cache_size=2,
+            client=_client(tmp_path),
+        )
+
+        for session_id in ("a", "b", "c"):
+            store.add_texts(["t"], metadatas=[{"session_id": session_id}])
+
+        assert list(store._handles) == [
+            store.partition_name("b"),
+            store.partition_name("c"),
+        ]
+        # Sessão evictada continua acessível (reaberta sob demanda)
+        assert store.get(where={"session_id": "a"})["documents"] == ["t"]
+
+    def test_migrates_legacy_collection(self, tmp_path):
+        """Testa a migração da coleção global sem recalcular embeddings"""
+        client = _client(tmp_path)
+        embeddings = DeterministicFakeEmbedding(size=8)
+        legacy = Chroma(client=client, embedding_function=embeddings)
+        legacy.add_texts(
+            ["um", "dois", "tres"],
+            metadatas=[
+                {"session_id": "s1"},
+                {"session_id": "s2"},
+                {"session_id": "s1"},
+            ],
+        )
+        store = SessionVectorStore("", embeddings, client=client)
+
+        assert store.migrate_legacy(batch=2) == 3
+
+        names = [c.name for c in client.list_collections()]
+        assert LEGACY_COLLECTION not in names
+        assert sorted(store.get(where={"session_id": "s1"})["documents"]) == [
+            "tres",
+            "um",
+        ]
+        docs = store.similarity_search("dois", k=1, filter={"session_id": "s2"})
+        assert docs[0].page_content == "dois"
+        assert store.migrate_legacy() == 0
+
+    def test_embeddings_returns_stored_vectors(self, tmp_path):
+        """Testa se os vetores gravados são devolvidos na ordem dos ids"""
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=_client(tmp_path)
+        )
+        ids = store.add_texts(["a", "b"], metadatas=[{"session_id": "s1"}] * 2)
+
+        vectors = store.embeddings("s1", [ids[1], "inexistente", ids[0]])
+
+        assert vectors[1] is None
+        assert vectors[0].shape == (8,) and vectors[2].shape == (8,)
+        assert store.embeddings("s2", ids) == [None, None]
+
+    def test_open_waits_for_compaction_swap(self, tmp_path):
+        """Testa se uma leitura durante a troca da compactação vê a coleção nova"""
+        client = _client(tmp_path)
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=client
+        )
+        store.add_texts(["a", "b"], metadatas=[{"session_id": "s1"}] * 2)
+        name = store.partition_name("s1")
+        store._handles.clear()
+        lidos, threads = [], []
+        delete_collection = client.delete_collection
+
+        def delete_e_ler(nome):
+            delete_collection(nome)
+            if nome == name:
+                # Leitor concorrente entre o delete e o rename
+                leitor = threading.Thread(
+                    target=lambda: lidos.append(
+                        store.get(where={"session_id": "s1"})["documents"]
+                    )
+                )
+                leitor.start()
+                leitor.join(timeout=0.2)
+                threads.append(leitor)
+
+        with patch.object(client, "delete_collection", delete_e_ler):
+            store.compact_partition(name)
+        threads[0].join(timeout=5)
+
+        assert sorted(lidos[0]) == ["a", "b"]
+        assert sorted(store.get(where={"session_id": "s1"})["documents"]) == [
+            "a",
+            "b",
+        ]
+
+    def test_compaction_does_not_block_other_partitions(self, tmp_path):
+        """Testa se gravar em outra sessão não espera a cópia da compactação"""
+        client = _client(tmp_path)
+        store = SessionVectorStore(
+            "", DeterministicFakeEmbedding(size=8), client=client
+        )
+        store.add_texts(["a", "b"], metadatas=[{"session_id": "s1"}] * 2)
+        gravou = []
+        create_collection = client.create_collection
+
+        def create_e_gravar(*args, **kwargs):
+            # Gravação concorrente durante a cópia da partição de s1
+            escritor = threading.Thread(
+                target=lambda: gravou.append(
+                    store.add_texts(["c"], metadatas=[{"session_id": "s2"}])
+                )
+            )
+            escritor.start()
+            escritor.join(timeout=1)
+            return create_collection(*args, **kwargs)
+
+        with patch.object(client, "create_collection", create_e_gravar):
+            store.compact_partition(store.partition_name("s1"))
+
+        assert len(gravou) == 1
+        assert store.get(where={"session_id": "s2"})["documents"] == ["c"]
+        assert sorted(store.get(where={"session_id": "s1"})["documents"]) == [
+            "a",
+            "b",
+        ]
@@ -0,0 +1,98 @@
+import threading
+import time
+from unittest.mock import Mock
+
+# Importar módulos da API
+from vector_writer import VectorWriter
+from content_index import ContentIndex
+
+
+class TestVectorWriter:
+    """Testes para o write-behind do vectorstore"""
+
+    def test_flushes_full_batch_in_one_write(self):
+        """Testa se um lote cheio vira um único add_texts"""
+        store = Mock()
+        writer = VectorWriter(lambda: store, batch_size=3, interval=5)
+
+        for i in range(3):
+            writer.submit(f"texto {i}", {"session_id": "s1"})
+        writer.close(timeout=2)
+
+        store.add_texts.assert_called_once_with(
+            texts=["texto 0", "texto 1", "texto 2"],
+            metadatas=[{"session_id": "s1"}] * 3,
+        )
+
+    def test_flushes_partial_batch_after_interval(self):
+        """Testa se o lote incompleto é gravado quando o intervalo expira"""
+        written = threading.Event()
+        store = Mock()
+        store.add_texts.side_effect = lambda **kwargs: written.set()
+        writer = VectorWriter(lambda: store, batch_size=100, interval=0.05)
+
+        writer.submit("sozinho", {"session_id": "s1"})
+
+        assert written.wait(timeout=2)
+        writer.close(timeout=2)
+
+    def test_close_drains_pending(self):
+        """Testa se o shutdown grava o que ainda estava na fila"""
+        store = Mock()
+        writer = VectorWriter(lambda: store, batch_size=2, interval=10)
+
+        for i in range(5):
+            writer.submit(f"texto {i}")
+        start = time.time()
+        writer.close(timeout=5)
+
+        gravados = [
+            text
+            for call in store.add_texts.call_args_list
+            for text in call.kwargs["texts"]
+        ]
+        assert gravados == [f"texto {i}" for i in range(5)]
+        assert time.time() - start < 5
+
+    def test_write_error_does_not_stop_writer(self):
+        """Testa se uma falha no Chroma não derruba a thread de escrita"""
+        store = Mock()
+        store.add_texts.side_effect = [RuntimeError("chroma fora"), None]
+        writer = VectorWriter(lambda: store, batch_size=1, interval=1)
+
+        writer.submit("a")
+        writer.submit("b")
+        writer.close(timeout=2)
+
+        assert store.add_texts.call_count == 2
+
+    def test_full_queue_rejects(self):
+        """Testa se a fila cheia descarta em vez de bloquear a requisição"""
+        gate = threading.Event()
+        store = Mock()
+        store.add_texts.side_effect = lambda **kwargs: gate.wait(2)
+        writer = VectorWriter(lambda: store, batch_size=1, interval=0, max_queue=1)
+
+        writer.submit("ocupa a thread")
+        time.sleep(0.05)
+        assert writer.submit("na fila")
+        assert not writer.submit("excedente")
+        gate.set()
+        writer.close(timeout=2)
+
+    def test_duplicates_are_skipped_before_write(self):
+        """Testa se textos repetidos na sessão não são reenviados ao Chroma"""
+        store = Mock()
+        store.get.return_value = {"documents": ["já gravado"], "metadatas": [{}]}
+        writer = VectorWriter(
+            lambda: store, batch_size=4, interval=5, index=ContentIndex(lambda: store)
+        )
+
+        for texto in ["já gravado", "novo", "novo", "outro"]:
+            writer.submit(texto, {"session_id": "s1"})
+        writer.close(timeout=2)
+
+        store.add_texts.assert_called_once()
+        kwargs = store.add_texts.call_args.kwargs
+        assert kwargs["texts"] == ["novo", "outro"]
+        assert all(m["content_hash"] for m in kwargs["metadatas"])